@@ -7,35 +7,30 @@ from matplotlib import pyplot as plt
 from sklearn.neighbors import KernelDensity
 
 from game_constants import DIRS_PREFIX, PLAYER_NAMES_FILE, LLM_LOG_FILE_FORMAT, METRICS_TO_SCORE, \
-    MESSAGE_PARSING_PATTERN, GAME_MANAGER_NAME, LLM_IDENTIFICATION, PERSONAL_SURVEY_FILE_FORMAT, \
-    SURVEY_COMMENTS_TITLE, METRIC_NAME_AND_SCORE_DELIMITER, MAFIA_WINS_MESSAGE, WHO_WINS_FILE, \
-    GAME_CONFIG_FILE, PLAYERS_KEY_IN_CONFIG, CUTTING_TO_VOTE_MESSAGE, VOTING_MESSAGE_FORMAT, \
-    VOTED_OUT_MESSAGE_FORMAT, VOTING_TIME_MESSAGE_FORMAT, DAYTIME_START_PREFIX, DAYTIME, \
-    NIGHTTIME_START_PREFIX, NIGHTTIME, PUBLIC_MANAGER_CHAT_FILE, PUBLIC_DAYTIME_CHAT_FILE, \
+    LLM_IDENTIFICATION, PERSONAL_SURVEY_FILE_FORMAT, SURVEY_COMMENTS_TITLE, \
+    METRIC_NAME_AND_SCORE_DELIMITER, MAFIA_WINS_MESSAGE, WHO_WINS_FILE, GAME_CONFIG_FILE, \
+    PLAYERS_KEY_IN_CONFIG, DAYTIME, NIGHTTIME, PUBLIC_MANAGER_CHAT_FILE, PUBLIC_DAYTIME_CHAT_FILE, \
     PUBLIC_NIGHTTIME_CHAT_FILE, MAFIA_NAMES_FILE, DAYTIME_MINUTES_KEY, NIGHTTIME_MINUTES_KEY, \
     MAFIA_ROLE, BYSTANDER_ROLE, REAL_NAMES_FILE, REAL_NAME_CODENAME_DELIMITER, strip_special_chars
 from game_status_checks import is_voted_out, all_players_joined
-from llm_players.llm_constants import LLM_CONFIG_KEY
+from llm_players.llm_constants import LLM_CONFIG_KEY, WORDS_PER_SECOND_WAITING_KEY, \
+    TYPING_SPEED_SIGMA_KEY
+from message_records import MessageRecord, SPEAKER_IDS, PHASE_START, CUT_TO_VOTE, PHASE_END, VOTE, \
+    ELIMINATION
 
 
 LAST_GAME_FROM_PILOT = 37
 
 ANALYSIS_DIR = Path("./analysis")
+TYPING_SPEED_FILE = "typing_speed.json"  # the fitted LLM config values, by fit_typing_speed()
 
 MESSAGE_HISTOGRAM_Y_LIM = (0, 30)
 
 MEAN_MARKER_STYLE = dict(marker="x", markersize=8, color="navy", markeredgewidth=3)
 
-# manager messages types
-PHASE_START = "Now it's PHASE for X minutes"
-CUT_TO_VOTE = "There is only one mafia member left"
-PHASE_END = "PHASE has ended, now it's time to vote"
-WHO_VOTE_FOR = "X voted for Y"
-WAS_VOTED_OUT = "X was voted out"
-# manager messages signals
-VOTING_MESSAGE_SIGNAL = VOTING_MESSAGE_FORMAT.replace("{}", "")
-VOTED_OUT_SIGNAL = VOTED_OUT_MESSAGE_FORMAT.replace("{}", "")
-PHASE_END_SIGNAL = VOTING_TIME_MESSAGE_FORMAT.replace("{}", "")
+# manager messages types (besides PHASE_START, CUT_TO_VOTE and PHASE_END from message_records)
+WHO_VOTE_FOR = VOTE
+WAS_VOTED_OUT = ELIMINATION
 
 # message content empiric metrics
 LENGTH, REPETITION, NUM_UNIQUE_WORDS = "length", "repetition", "num_unique_words"
@@ -61,41 +56,35 @@ ANONYMIZED_NAME = "ANONYMIZED"
 def avg(scores): return sum(scores) / len(scores)
 
 
-class ParsedMessage:
+class ParsedMessage(MessageRecord):
+    """A MessageRecord with what the analysis needs, in the attribute names the analysis uses"""
+
+    __slots__ = ("is_llm", "num_words")
 
     def __init__(self, message, llm_player_name=None):
-        self.original = message
-        hrs, mins, secs, name, content = re.match(MESSAGE_PARSING_PATTERN, message).groups()
-        self.timestamp = 3600 * int(hrs) + 60 * int(mins) + int(secs)  # in seconds
-        self.name = name
-        self.is_manager = name == GAME_MANAGER_NAME
-        self.is_llm = name == llm_player_name
-        self.content = content
-        self.words_in_message = content.split()
-        self.num_words = len(self.words_in_message)
-        self.manager_message_type, self.manager_message_subject = self.parse_manager_message()
-
-    def parse_manager_message(self):
+        super().__init__(message)
+        self.is_llm = llm_player_name is not None and self.name == llm_player_name
+        self.num_words = len(self.content.split())
+
+    @property
+    def original(self):
+        return self.line
+
+    @property
+    def manager_message_type(self):
+        return self.kind if self.is_manager else None
+
+    @property
+    def manager_message_subject(self):
         if not self.is_manager:
-            return None, None
-        elif self.content.startswith(DAYTIME_START_PREFIX):
-            return PHASE_START, DAYTIME
-        elif self.content.startswith(NIGHTTIME_START_PREFIX):
-            return PHASE_START, NIGHTTIME
-        elif self.content == CUTTING_TO_VOTE_MESSAGE:
-            return CUT_TO_VOTE, None
-        elif self.content.endswith(PHASE_END_SIGNAL):
-            return PHASE_END, self.content.removesuffix(PHASE_END_SIGNAL)
-        elif VOTING_MESSAGE_SIGNAL in self.content:
-            return WHO_VOTE_FOR, self.content.split(VOTING_MESSAGE_SIGNAL)  # [voter, voted for]
-        elif VOTED_OUT_SIGNAL in self.content:
-            return WAS_VOTED_OUT, self.content.split(VOTED_OUT_SIGNAL)[0]
-        else:
-            return NotImplementedError("This manager message type is new!")
+            return None
+        elif self.kind == VOTE:
+            # [voter, voted for]
+            return [SPEAKER_IDS.get_name(speaker_id) for speaker_id in self.subject]
+        elif self.kind == ELIMINATION:
+            return SPEAKER_IDS.get_name(self.subject)
+        return self.subject  # the phase's name, or None
 
-    def __repr__(self):
-        return self.original
-    
     def copy(self):  # allows resetting timestamps in phases without overrunning them
         message_copy = ParsedMessage(self.original)
         message_copy.is_llm = self.is_llm  # otherwise will stay False as default
@@ -648,6 +637,41 @@ def calculate_self_timing_diffs(phase: Phase, this_game_human_player_self_timing
                 this_game_human_player_self_timing_diffs[player].append(timing_diff)
 
 
+def fit_typing_speed():
+    """
+    Fits the log-normal distribution of the human players' typing speeds (in words per second),
+    as a message's number of words divided by the time since the previous message in the phase,
+    and saves its LLM config values (the median speed and the sigma) for the LLM player's pacing
+    """
+    typing_speeds = []
+    for game_dir in Path(DIRS_PREFIX).glob("*"):
+        if game_dir.is_dir() and game_dir.name.isdigit() and "00001" not in game_dir.name:
+            # parsed directly rather than by get_single_game_results, which requires an LLM player,
+            # so the games of human players only are a part of the fit too
+            all_players = (game_dir / PLAYER_NAMES_FILE).read_text().splitlines()
+            mafia_players = (game_dir / MAFIA_NAMES_FILE).read_text().splitlines()
+            try:
+                llm_player_name = get_llm_player_name(all_players, game_dir)
+            except NotImplementedError:  # a game with multiple LLMs, their names aren't known
+                continue
+            parsed_messages_by_phase = parse_messages(game_dir, all_players, mafia_players,
+                                                      llm_player_name)
+            for phase in parsed_messages_by_phase:
+                for previous_message, message in zip(phase.messages, phase.messages[1:]):
+                    timing_diff = message.timestamp - previous_message.timestamp
+                    if not message.is_manager and not message.is_llm and timing_diff > 0:
+                        typing_speeds.append(message.num_words / timing_diff)
+    log_typing_speeds = np.log([speed for speed in typing_speeds if speed > 0])
+    typing_speed_config = {WORDS_PER_SECOND_WAITING_KEY: float(np.exp(np.mean(log_typing_speeds))),
+                           TYPING_SPEED_SIGMA_KEY: float(np.std(log_typing_speeds))}
+    print(f"Typing speed of human players, from {len(log_typing_speeds)} messages: "
+          f"median = {typing_speed_config[WORDS_PER_SECOND_WAITING_KEY]:.2f} words per second, "
+          f"sigma = {typing_speed_config[TYPING_SPEED_SIGMA_KEY]:.2f}")
+    with open(ANALYSIS_DIR / TYPING_SPEED_FILE, "w") as f:
+        json.dump(typing_speed_config, f, indent=4)
+    return typing_speed_config
+
+
 def get_message_timings_statistics():
     all_games = []
     daytime_minutes_by_game = {}
@@ -1451,5 +1475,6 @@ if __name__ == "__main__":
     # preliminary_analysis_by_game()
     # get_games_statistics()
     # get_message_timings_statistics()
+    # fit_typing_speed()
     # get_message_content_analysis()
     main()
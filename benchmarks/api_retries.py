@@ -0,0 +1,133 @@
+"""
+Checks the API retry policy against a local fake HTTP server, which answers by a script of
+responses: rate limiting with Retry-After, slow responses that time out, a deadline that cuts the
+attempts short, and the circuit breaker opening and closing again. Fails if any of them doesn't
+behave as expected. Run from the repo's root: python benchmarks/api_retries.py
+"""
+import json
+import sys
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Event, Thread
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))  # the repo's root
+
+from llm_players.retry_policy import RetryPolicy, CircuitBreaker, get_retry_after, OPEN, CLOSED
+
+RETRYABLE_ERRORS = (urllib.error.URLError, TimeoutError)
+OK_STATUS = 200
+RATE_LIMITED_STATUS = 429
+SERVER_ERROR_STATUS = 500
+TIMING_TOLERANCE = 0.15  # seconds
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+
+    responses = []  # (status, headers, seconds to wait before answering), the rest are OK
+
+    def do_POST(self):
+        status, headers, delay = self.responses.pop(0) if self.responses else (OK_STATUS, {}, 0)
+        time.sleep(delay)
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        try:
+            self.wfile.write(json.dumps({"status": status}).encode())
+        except BrokenPipeError:
+            pass  # the client has timed out
+
+    def log_message(self, *args):
+        pass  # keeps the output to the checks' results
+
+
+class FakeAPI:
+
+    def __init__(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeAPIHandler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1/chat/completions"
+
+    def set_responses(self, responses):
+        FakeAPIHandler.responses[:] = responses
+
+    def send_request(self, timeout):
+        request = urllib.request.Request(self.url, data=b"{}")
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+
+
+def on_error(error):
+    return get_retry_after(getattr(error, "headers", None))
+
+
+def check_rate_limiting(api):
+    api.set_responses([(RATE_LIMITED_STATUS, {"Retry-After": "0.3"}, 0),
+                       (RATE_LIMITED_STATUS, {"Retry-After": "0.3"}, 0),
+                       (SERVER_ERROR_STATUS, {}, 0)])
+    policy = RetryPolicy(5, 0.01, 0.05, CircuitBreaker(5, 1), request_timeout=1)
+    start_time = time.monotonic()
+    result = policy.call(api.send_request, RETRYABLE_ERRORS, Event(), on_error=on_error)
+    duration = time.monotonic() - start_time
+    return result is not None and policy.metrics["rate_limited"] == 2 \
+        and policy.metrics["attempts"] == 4 and duration >= 0.6, \
+        f"{dict(policy.metrics)} in {duration:.2f}s"
+
+
+def check_timeouts(api):
+    api.set_responses([(OK_STATUS, {}, 0.5)] * 3)
+    policy = RetryPolicy(3, 0.01, 0.05, CircuitBreaker(0, 1), request_timeout=0.1)
+    start_time = time.monotonic()
+    result = policy.call(api.send_request, RETRYABLE_ERRORS, Event(), on_error=on_error)
+    duration = time.monotonic() - start_time
+    return result is None and policy.metrics["attempts_exhausted"] == 1 \
+        and duration < 3 * 0.1 + 2 * 0.05 + TIMING_TOLERANCE, \
+        f"{dict(policy.metrics)} in {duration:.2f}s"
+
+
+def check_deadline(api):
+    # the request timeout is longer than the time left, so the attempt is cut at the deadline
+    api.set_responses([(OK_STATUS, {}, 2)])
+    policy = RetryPolicy(0, 0.01, 0.05, CircuitBreaker(0, 1), request_timeout=5)
+    start_time = time.monotonic()
+    result = policy.call(api.send_request, RETRYABLE_ERRORS, Event(), start_time + 0.5,
+                         on_error)
+    duration = time.monotonic() - start_time
+    return result is None and policy.metrics["deadline_exceeded"] == 1 \
+        and duration < 0.5 + TIMING_TOLERANCE, f"{dict(policy.metrics)} in {duration:.2f}s"
+
+
+def check_circuit_breaker(api):
+    api.set_responses([(SERVER_ERROR_STATUS, {}, 0)] * 2)
+    circuit_breaker = CircuitBreaker(2, 0.3)
+    policy = RetryPolicy(2, 0.01, 0.01, circuit_breaker, request_timeout=1)
+    first_result = policy.call(api.send_request, RETRYABLE_ERRORS, Event(), on_error=on_error)
+    opened = circuit_breaker.state == OPEN
+    short_circuited_result = policy.call(api.send_request, RETRYABLE_ERRORS, Event(),
+                                         on_error=on_error)
+    time.sleep(0.35)  # until the trial request is allowed
+    trial_result = policy.call(api.send_request, RETRYABLE_ERRORS, Event(), on_error=on_error)
+    return first_result is None and opened and short_circuited_result is None \
+        and policy.metrics["short_circuited"] == 1 and trial_result is not None \
+        and circuit_breaker.state == CLOSED, f"{dict(policy.metrics)}"
+
+
+CHECKS = [check_rate_limiting, check_timeouts, check_deadline, check_circuit_breaker]
+
+
+def main():
+    api = FakeAPI()
+    failed = False
+    for check in CHECKS:
+        passed, details = check(api)
+        print(f"{'OK' if passed else 'FAILED'}: {check.__name__} ({details})")
+        failed = failed or not passed
+    api.server.shutdown()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+"""
+Benchmarks the game loop's hot paths on synthetic games of growing size (players, messages per
+phase and phases), reporting for each call its latency, its syscalls (reads and writes, Linux only)
+and the peak memory it allocates. Results can be saved as a baseline JSON (in benchmarks/baselines)
+and later runs compared to it, so regressions show up as diffs.
+Run from the repo's root: python benchmarks/hot_paths.py [--save NAME] [--compare NAME]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))  # the repo's root
+
+from game_constants import MESSAGE_FORMAT, GAME_MANAGER_NAME, \
+    OPTIONAL_CODE_NAMES, PLAYERS_KEY_IN_CONFIG, DAYTIME_MINUTES_KEY, NIGHTTIME_MINUTES_KEY, \
+    PUBLIC_DAYTIME_CHAT_FILE, PERSONAL_CHAT_FILE_FORMAT, PERSONAL_VOTE_FILE_FORMAT, \
+    DAYTIME_START_MESSAGE_FORMAT, DAYTIME_VOTING_TIME_MESSAGE, VOTING_MESSAGE_FORMAT, \
+    GAME_START_TIME_FILE, DIRS_PREFIX, GAME_CONFIG_FILE
+from game_status_checks import append_to_game_file, write_game_file
+from prepare_game import init_game
+from mafia_main import GameManager
+from message_records import MessageRecord
+from llm_players.factory import llm_player_factory
+from llm_players.llm_constants import DEFAULT_LLM_CONFIG, BACKEND_KEY, MOCK_BACKEND, \
+    LOG_LEVEL_KEY, GAME_DIR_KEY, turn_task_into_prompt
+
+BASELINES_DIR = Path(__file__).resolve().parent / "baselines"
+SYNTHETIC_GAME_ID = "0001"
+GAME_SIZES = {  # name -> (players, messages per phase, phases)
+    "small": (6, 30, 2),
+    "medium": (15, 200, 6),
+    "large": (50, 1000, 10),
+}
+DEFAULT_MIN_TIME = 0.2  # seconds of calls to measure, per benchmark and game size
+MAX_NUM_CALLS = 10000
+NUM_ALLOCATION_CALLS = 5  # tracemalloc slows down the calls, so it's measured separately
+DEFAULT_REGRESSION_THRESHOLD = 0.25  # relative slowdown of the median latency
+BENCHMARK_TASK = "Do you want to send a message to the group chat now?"
+SYSCALLS_FIELDS = ("syscr", "syscw")  # in /proc/self/io
+
+
+class SyntheticGame:
+    """A game dir with a message history of the given size, and its manager and LLM player"""
+
+    def __init__(self, root_dir, num_players, messages_per_phase, num_phases):
+        self.names = [OPTIONAL_CODE_NAMES[i % len(OPTIONAL_CODE_NAMES)] + str(i)
+                      for i in range(num_players)]
+        self.llm_name = self.names[-1]
+        self.game_dir = self.create_game_dir(root_dir)
+        self.message_history = self.create_message_history(messages_per_phase, num_phases)
+        self.message_records = self.parse_message_history()  # as the LLM player holds them
+        llm_messages = [message for message in self.message_history
+                        if f"] {self.llm_name}: " in message]
+        append_to_game_file(self.game_dir, PERSONAL_CHAT_FILE_FORMAT.format(self.llm_name),
+                            "".join(llm_messages))
+        write_game_file(self.game_dir, GAME_START_TIME_FILE, "12:00:00")
+        self.manager = GameManager(self.game_dir)
+        with open(self.game_dir / GAME_CONFIG_FILE) as f:
+            llm_player_config = json.load(f)[PLAYERS_KEY_IN_CONFIG][-1]
+        llm_player_config[GAME_DIR_KEY] = self.game_dir
+        self.llm_player = llm_player_factory(llm_player_config)
+
+    def create_game_dir(self, root_dir):
+        llm_config = {**DEFAULT_LLM_CONFIG, BACKEND_KEY: MOCK_BACKEND, LOG_LEVEL_KEY: "warning"}
+        players = [{"name": name, "is_mafia": i < 2, "is_llm": name == self.llm_name,
+                    "real_name": name, "llm_config": llm_config if name == self.llm_name else {}}
+                   for i, name in enumerate(self.names)]
+        config_path = Path(root_dir) / "config.json"
+        config_path.write_text(json.dumps({PLAYERS_KEY_IN_CONFIG: players,
+                                           DAYTIME_MINUTES_KEY: 1, NIGHTTIME_MINUTES_KEY: 1}))
+        (Path(root_dir) / DIRS_PREFIX).mkdir()
+        original_dir = os.getcwd()
+        os.chdir(root_dir)  # init_game creates the game dir relatively to the working dir
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                init_game(SYNTHETIC_GAME_ID, str(config_path))
+        finally:
+            os.chdir(original_dir)
+        return Path(root_dir) / DIRS_PREFIX / SYNTHETIC_GAME_ID
+
+    def format_message(self, seconds, name, message):
+        timestamp = time.strftime("%H:%M:%S", time.gmtime(12 * 3600 + seconds))
+        return MESSAGE_FORMAT.format(timestamp=timestamp, name=name, message=message) + "\n"
+
+    def create_message_history(self, messages_per_phase, num_phases):
+        message_history = []
+        seconds = 0
+        for phase in range(num_phases):
+            message_history.append(self.format_message(
+                seconds, GAME_MANAGER_NAME, DAYTIME_START_MESSAGE_FORMAT.format(2)))
+            for i in range(messages_per_phase):
+                seconds += 1
+                name = self.names[(phase + i) % len(self.names)]
+                message_history.append(self.format_message(
+                    seconds, name, f"message number {i} of phase {phase} i think {name} is mafia"))
+            message_history.append(self.format_message(seconds, GAME_MANAGER_NAME,
+                                                       DAYTIME_VOTING_TIME_MESSAGE))
+            for i, name in enumerate(self.names):
+                voted_for = self.names[(i + 1) % len(self.names)]
+                message_history.append(self.format_message(
+                    seconds, GAME_MANAGER_NAME, VOTING_MESSAGE_FORMAT.format(name, voted_for)))
+        return message_history
+
+    # the benchmarked calls, and their setups (which aren't measured):
+
+    def write_chat_round(self):
+        for player in self.manager.players:
+            append_to_game_file(self.game_dir, player.personal_chat_file.name,
+                                self.format_message(0, player.name, "a new message"))
+
+    def relay_chat_round(self):  # the body of GameManager.relay_messages_of_player, for everyone
+        for player in self.manager.players:
+            lines = player.get_new_messages()
+            if lines:
+                append_to_game_file(self.game_dir, PUBLIC_DAYTIME_CHAT_FILE, "".join(lines))
+
+    def write_votes(self):
+        for i, player in enumerate(self.manager.players):
+            voted_for = self.names[(i + 1) % len(self.names)]
+            append_to_game_file(self.game_dir, PERSONAL_VOTE_FILE_FORMAT.format(player.name),
+                                voted_for + "\n")
+
+    def get_voted_out_name(self, event_loop):
+        players = self.manager.players
+        return event_loop.run_until_complete(
+            self.manager.get_voted_out_name(players, PUBLIC_DAYTIME_CHAT_FILE, players))
+
+    def parse_message_history(self):
+        return [MessageRecord(message) for message in self.message_history]
+
+
+def get_benchmarks(game, event_loop):
+    """name -> (benchmarked call, setup before every call or None)"""
+    return {
+        "run_chat_round_between_players": (game.relay_chat_round, game.write_chat_round),
+        "get_voted_out_name": (lambda: game.get_voted_out_name(event_loop), game.write_votes),
+        "turn_task_into_prompt": (
+            lambda: turn_task_into_prompt(BENCHMARK_TASK, game.message_records), None),
+        "get_system_info_message": (
+            lambda: game.llm_player.get_system_info_message(attention_to_not_repeat=True), None),
+        "talkative_scheduling_prompt_modifier": (
+            lambda: game.llm_player.talkative_scheduling_prompt_modifier(game.message_records),
+            None),
+        "parse_message_history": (game.parse_message_history, None),
+    }
+
+
+def count_syscalls():
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+    except OSError:  # not Linux
+        return None
+    return sum(int(fields[field]) for field in SYSCALLS_FIELDS)
+
+
+def get_syscalls_counting_overhead():  # reading /proc/self/io is counted as syscalls by itself
+    syscalls_before = count_syscalls()
+    return None if syscalls_before is None else count_syscalls() - syscalls_before
+
+
+def measure(call, setup, min_time):
+    durations = []
+    num_syscalls = 0
+    syscalls_counting_overhead = get_syscalls_counting_overhead()
+    deadline = time.perf_counter() + min_time
+    while time.perf_counter() < deadline and len(durations) < MAX_NUM_CALLS:
+        if setup is not None:
+            setup()
+        syscalls_before = count_syscalls()
+        start_time = time.perf_counter()
+        call()
+        durations.append(time.perf_counter() - start_time)
+        syscalls_after = count_syscalls()
+        if syscalls_before is not None:
+            num_syscalls += syscalls_after - syscalls_before - syscalls_counting_overhead
+    peak_allocations = []
+    tracemalloc.start()
+    for _ in range(NUM_ALLOCATION_CALLS):
+        if setup is not None:
+            setup()
+        tracemalloc.reset_peak()
+        allocated_before, _ = tracemalloc.get_traced_memory()
+        call()
+        peak_allocations.append(tracemalloc.get_traced_memory()[1] - allocated_before)
+    tracemalloc.stop()
+    return {"num_calls": len(durations),
+            "median_us": statistics.median(durations) * 1e6,
+            "min_us": min(durations) * 1e6,
+            "syscalls_per_call": None if syscalls_counting_overhead is None
+            else max(num_syscalls, 0) / len(durations),
+            "peak_allocated_bytes": max(peak_allocations)}
+
+
+def run_benchmarks(size_names, benchmark_names, min_time):
+    results = {}
+    event_loop = asyncio.new_event_loop()
+    for size_name in size_names:
+        with tempfile.TemporaryDirectory() as root_dir:
+            game = SyntheticGame(root_dir, *GAME_SIZES[size_name])
+            for name, (call, setup) in get_benchmarks(game, event_loop).items():
+                if benchmark_names and name not in benchmark_names:
+                    continue
+                result = measure(call, setup, min_time)
+                results[f"{name}[{size_name}]"] = result
+                print_result(f"{name}[{size_name}]", result)
+            game.llm_player.logger.close()
+    event_loop.close()
+    return results
+
+
+def print_result(key, result, baseline_result=None):
+    syscalls = result["syscalls_per_call"]
+    line = f"{key:<52} {result['median_us']:>12.1f}us" \
+           f" {'-' if syscalls is None else f'{syscalls:.1f}':>8} syscalls" \
+           f" {result['peak_allocated_bytes']:>11} bytes"
+    if baseline_result is not None:
+        change = result["median_us"] / baseline_result["median_us"] - 1
+        line += f"   ({change:+.0%} from {baseline_result['median_us']:.1f}us)"
+    print(line)
+
+
+def compare_to_baseline(results, baseline, threshold):
+    print(f"\nCompared to the baseline (median latency, regression over {threshold:.0%}):")
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        print_result(key, result, baseline[key])
+        if result["median_us"] > baseline[key]["median_us"] * (1 + threshold):
+            regressions.append(key)
+    for key in regressions:
+        print(f"REGRESSION: {key}")
+    return regressions
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--sizes", nargs="+", choices=list(GAME_SIZES),
+                        default=list(GAME_SIZES))
+    parser.add_argument("-b", "--benchmarks", nargs="+", default=None,
+                        help="names of benchmarks to run (all by default)")
+    parser.add_argument("-t", "--min_time", type=float, default=DEFAULT_MIN_TIME,
+                        help="seconds of calls to measure, per benchmark and game size")
+    parser.add_argument("--save", default=None, help="name of a baseline to save the results as")
+    parser.add_argument("--compare", default=None, help="name of a baseline to compare to")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD)
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    print(f"{'benchmark[game size]':<52} {'median':>14} {'':>17} {'peak allocated':>17}")
+    results = run_benchmarks(args.sizes, args.benchmarks, args.min_time)
+    if args.save:
+        BASELINES_DIR.mkdir(exist_ok=True)
+        baseline_file = BASELINES_DIR / f"{args.save}.json"
+        baseline_file.write_text(json.dumps(results, indent=4, sort_keys=True) + "\n")
+        print(f"\nSaved the results as a baseline in: {baseline_file}")
+    if args.compare:
+        baseline = json.loads((BASELINES_DIR / f"{args.compare}.json").read_text())
+        if compare_to_baseline(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
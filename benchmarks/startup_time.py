@@ -0,0 +1,87 @@
+"""
+Measures how long it takes an LLM player process to start: importing everything that
+llm_interface.py imports, and then building the player's LLM wrapper with the mock backend
+(including its warm-up generation), each reported separately. Fails if the import is too slow or
+if either stage imports a heavy library that only local models need.
+Run from the repo's root: python benchmarks/startup_time.py
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))  # the repo's root
+
+from llm_players.llm_constants import MOCK_BACKEND
+
+IMPORTED_MODULE = "llm_interface"  # the script that runs an LLM player
+HEAVY_MODULES = ["torch", "transformers", "together"]  # should be imported only by their backends
+DEFAULT_NUM_RUNS = 5
+DEFAULT_MAX_SECONDS = 1.0
+CHECK_IMPORTS_CODE = f"import sys, {IMPORTED_MODULE}; " \
+                     f"print(','.join(m for m in {HEAVY_MODULES} if m in sys.modules))"
+# imports first, so only the wrapper's construction is timed (in the subprocess itself)
+BUILD_PLAYER_CODE = \
+    f"import sys, tempfile, time, {IMPORTED_MODULE}; from pathlib import Path; " \
+    f"from llm_players.logger import Logger; from llm_players.llm_wrapper import LLMWrapper; " \
+    f"from llm_players.llm_constants import DEFAULT_LLM_CONFIG, BACKEND_KEY, MOCK_BACKEND; " \
+    f"log_dir = tempfile.mkdtemp(); start_time = time.perf_counter(); " \
+    f"LLMWrapper(Logger('startup', Path(log_dir)), " \
+    f"**{{**DEFAULT_LLM_CONFIG, BACKEND_KEY: MOCK_BACKEND}}); " \
+    f"print(time.perf_counter() - start_time); " \
+    f"print(','.join(m for m in {HEAVY_MODULES} if m in sys.modules))"
+
+
+def measure_startup_time():
+    start_time = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", CHECK_IMPORTS_CODE], capture_output=True,
+                            text=True, check=True)
+    duration = time.perf_counter() - start_time
+    heavy_modules = [module for module in result.stdout.strip().split(",") if module]
+    return duration, heavy_modules
+
+
+def measure_player_build_time():
+    result = subprocess.run([sys.executable, "-c", BUILD_PLAYER_CODE], capture_output=True,
+                            text=True, check=True)
+    duration, imported_heavy_modules = result.stdout.splitlines()[-2:]
+    heavy_modules = [module for module in imported_heavy_modules.split(",") if module]
+    return float(duration), heavy_modules
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--runs", type=int, default=DEFAULT_NUM_RUNS)
+    parser.add_argument("-m", "--max_seconds", type=float, default=DEFAULT_MAX_SECONDS,
+                        help="maximal allowed median startup time")
+    args = parser.parse_args()
+    durations = []
+    heavy_modules = set()
+    build_durations = []
+    for _ in range(args.runs):
+        duration, imported_heavy_modules = measure_startup_time()
+        durations.append(duration)
+        heavy_modules.update(imported_heavy_modules)
+        build_duration, imported_heavy_modules = measure_player_build_time()
+        build_durations.append(build_duration)
+        heavy_modules.update(imported_heavy_modules)
+    median_duration = statistics.median(durations)
+    print(f"Startup time of `import {IMPORTED_MODULE}` over {args.runs} runs: "
+          f"median {median_duration:.3f}s, min {min(durations):.3f}s, max {max(durations):.3f}s")
+    print(f"Time to build the LLM wrapper with the {MOCK_BACKEND} backend, after the import: "
+          f"median {statistics.median(build_durations):.3f}s, "
+          f"min {min(build_durations):.3f}s, max {max(build_durations):.3f}s")
+    failed = False
+    if heavy_modules:
+        print(f"FAILED: imported at startup: {', '.join(sorted(heavy_modules))}")
+        failed = True
+    if median_duration > args.max_seconds:
+        print(f"FAILED: median startup time is over {args.max_seconds}s")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
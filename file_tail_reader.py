@@ -0,0 +1,35 @@
+import os
+
+ENCODING = "utf-8"
+NEW_LINE = b"\n"
+
+
+class FileTailReader:
+    """
+    Reads only what was appended to a file since the previous read, by remembering the byte offset
+    it has reached (instead of re-reading the whole file and skipping the lines already read).
+    A last line that is still being written (with no "\n" yet) is kept until it's completed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0  # in bytes
+        self.partial_line = b""
+
+    def read_new_lines(self):
+        """Returns the new complete lines, each including its "\n" (like `readlines`)"""
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return []
+        if size == self.offset:
+            return []  # nothing new, so there's no need to even open the file
+        if size < self.offset:  # the file was rewritten from scratch, so start over
+            self.offset = 0
+            self.partial_line = b""
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read()
+        self.offset += len(data)
+        *complete_lines, self.partial_line = (self.partial_line + data).split(NEW_LINE)
+        return [line.rstrip(b"\r").decode(ENCODING) + "\n" for line in complete_lines]
@@ -32,6 +32,11 @@ PERSONAL_CHAT_FILE_FORMAT = "{}_chat.txt"
 PERSONAL_VOTE_FILE_FORMAT = "{}_vote.txt"
 PERSONAL_SURVEY_FILE_FORMAT = "{}_survey.txt"
 LLM_LOG_FILE_FORMAT = "{}_log.txt"
+TIMELINE_FILE = "timeline.json"  # spans of the LLM players' stages, for chrome://tracing/Perfetto
+GAME_STATE_SOCKET_FILE = "game_state.sock"  # only exists while game_state_server.py is running
+# groups of files that processes wait on for changes (instead of busy-waiting)
+GAME_STATUS_FILES = [PHASE_STATUS_FILE, WHO_WINS_FILE, GAME_START_TIME_FILE, REMAINING_PLAYERS_FILE]
+PUBLIC_CHAT_FILES = [PUBLIC_MANAGER_CHAT_FILE, PUBLIC_DAYTIME_CHAT_FILE, PUBLIC_NIGHTTIME_CHAT_FILE]
 
 # constant strings for info files
 NIGHTTIME = "Nighttime"
@@ -172,7 +177,7 @@ MODEL_RANDOMLY_VOTED_LOG = "random vote selected for the LLM player"
 
 
 def minutes_to_seconds(num_minutes):
-    return int(num_minutes * 60)
+    return num_minutes * 60  # not rounded, since simulated games can have phases under a second
 
 
 def get_current_timestamp():
@@ -192,14 +197,25 @@ def get_role_string(is_mafia):
     return MAFIA_ROLE if is_mafia else BYSTANDER_ROLE
 
 
+def get_game_dir(game_id):
+    game_dir = Path(DIRS_PREFIX) / game_id
+    if not game_dir.exists():
+        raise ValueError(f"The provided game ID {game_id} doesn't belong to a configured game")
+    return game_dir
+
+
 def get_game_dir_from_argv():
     parser = argparse.ArgumentParser()
     parser.add_argument("game_id", help=f"{GAME_ID_NUM_DIGITS}-digit game ID")
     args = parser.parse_args()
-    game_dir = Path(DIRS_PREFIX) / args.game_id
-    if not game_dir.exists():
-        raise ValueError(f"The provided game ID {args.game_id} doesn't belong to a configured game")
-    return game_dir
+    return get_game_dir(args.game_id)
+
+
+def get_game_dirs_from_argv():  # for hosting multiple games in one process
+    parser = argparse.ArgumentParser()
+    parser.add_argument("game_ids", nargs="+", help=f"{GAME_ID_NUM_DIGITS}-digit game IDs")
+    args = parser.parse_args()
+    return [get_game_dir(game_id) for game_id in args.game_ids]
 
 
 def get_player_names_by_id(player_names):
@@ -0,0 +1,220 @@
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+from game_state_client import get_game_state_client
+
+# inotify constants, as defined in <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+WATCHED_EVENTS_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+INOTIFY_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len (followed by the name)
+INOTIFY_READ_SIZE = 64 * 1024
+
+# polling fallback (for non-Linux platforms), in seconds
+MIN_POLLING_INTERVAL = 0.001
+MAX_POLLING_INTERVAL = 0.1
+POLLING_BACKOFF_FACTOR = 2
+# watchers with nothing to select on are waited on in a thread, which wakes up at least this often
+ASYNC_WAITING_THREAD_TIMEOUT = 1
+
+
+def _get_remaining_time(deadline):
+    return None if deadline is None else max(deadline - time.monotonic(), 0)
+
+
+def _load_libc_with_inotify():
+    if not sys.platform.startswith("linux"):
+        return None
+    libc_name = ctypes.util.find_library("c")
+    if not libc_name:
+        return None
+    libc = ctypes.CDLL(libc_name, use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        return None
+    return libc
+
+
+class InotifyGameDirWatcher:
+    """
+    Blocks until one of the watched files in the game dir is changed, using the kernel's inotify
+    (so waiting costs no CPU at all). Events are queued from the moment the watcher is created,
+    so a change that happens between a status check and the call to `wait` is never missed.
+    """
+
+    def __init__(self, libc, game_dir, file_names=None):
+        self.file_names = set(file_names) if file_names else None
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        watch_descriptor = libc.inotify_add_watch(self.fd, os.fsencode(game_dir),
+                                                  WATCHED_EVENTS_MASK)
+        if watch_descriptor < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {game_dir}")
+
+    def fileno(self):
+        return self.fd
+
+    def consume_events(self):
+        """Drains all the pending events, returns whether any of them was of a watched file"""
+        changed = False
+        while True:
+            try:
+                data = os.read(self.fd, INOTIFY_READ_SIZE)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                *_, name_length = INOTIFY_EVENT_HEADER.unpack_from(data, offset)
+                offset += INOTIFY_EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + name_length].rstrip(b"\0"))
+                offset += name_length
+                if self.file_names is None or name in self.file_names:
+                    changed = True
+
+    def wait(self, timeout=None):
+        """Returns True if a watched file was changed, or False if timed out"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            readable, _, _ = select.select([self.fd], [], [], _get_remaining_time(deadline))
+            if not readable:
+                return False
+            if self.consume_events():
+                return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingGameDirWatcher:
+    """
+    Fallback for platforms without inotify: compares the files' modification times and sizes,
+    sleeping between checks with an exponential backoff that resets on every change, so an active
+    game reacts within milliseconds and an idle one checks only a few times per second.
+    """
+
+    def __init__(self, game_dir, file_names=None):
+        self.game_dir = Path(game_dir)
+        self.file_names = set(file_names) if file_names else None
+        self.polling_interval = MIN_POLLING_INTERVAL
+        self.snapshot = self.take_snapshot()
+
+    def take_snapshot(self):
+        snapshot = {}
+        if self.file_names is None:
+            with os.scandir(self.game_dir) as entries:
+                for entry in entries:
+                    stat = entry.stat()
+                    snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        else:
+            for file_name in self.file_names:
+                try:
+                    stat = os.stat(self.game_dir / file_name)
+                except FileNotFoundError:
+                    continue
+                snapshot[file_name] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def fileno(self):
+        return None  # nothing to select on, callers have to poll
+
+    def consume_events(self):
+        snapshot = self.take_snapshot()
+        changed = snapshot != self.snapshot
+        self.snapshot = snapshot
+        return changed
+
+    def wait(self, timeout=None):
+        """Returns True if a watched file was changed, or False if timed out"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.consume_events():
+                self.polling_interval = MIN_POLLING_INTERVAL
+                return True
+            remaining_time = _get_remaining_time(deadline)
+            if remaining_time == 0:
+                return False
+            time.sleep(self.polling_interval if remaining_time is None
+                       else min(self.polling_interval, remaining_time))
+            self.polling_interval = min(self.polling_interval * POLLING_BACKOFF_FACTOR,
+                                        MAX_POLLING_INTERVAL)
+
+    def close(self):
+        pass
+
+
+def get_game_dir_file_watcher(game_dir, file_names=None):
+    libc = _load_libc_with_inotify()
+    if libc is not None:
+        try:
+            return InotifyGameDirWatcher(libc, game_dir, file_names)
+        except OSError:
+            pass  # for example when reaching the max number of inotify instances
+    return PollingGameDirWatcher(game_dir, file_names)
+
+
+def get_game_dir_watcher(game_dir, file_names=None):
+    """
+    Should be created *before* checking the state that is waited for, to avoid missing changes.
+    `file_names` limits the wake-ups to changes in these files only (default: any file in dir).
+    If the game has a running game_state_server.py, the watcher is woken by its pushed events.
+    """
+    game_state_client = get_game_state_client(game_dir)
+    if game_state_client is not None:
+        return game_state_client.get_watcher(file_names)
+    return get_game_dir_file_watcher(game_dir, file_names)
+
+
+class AsyncGameDirWatcher:
+    """
+    Lets any number of coroutines wait on the same watcher: all of them are woken on every change.
+    Must be created inside a running event loop. Since a waiter can only miss a change that happens
+    while it isn't awaiting, checking the state and then awaiting `wait` (with no await between
+    them) never misses a change.
+    """
+
+    def __init__(self, watcher):
+        self.watcher = watcher
+        self.changed = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        self.waiting_task = None
+        if watcher.fileno() is not None:
+            self.loop.add_reader(watcher.fileno(), self.on_watcher_readable)
+        else:  # the watcher can only be waited on by blocking, so it's done in another thread
+            self.waiting_task = asyncio.create_task(self.wait_in_thread_loop())
+
+    def notify_waiters(self):
+        self.changed.set()
+        self.changed = asyncio.Event()  # for the next waiters
+
+    def on_watcher_readable(self):
+        if self.watcher.consume_events():
+            self.notify_waiters()
+
+    async def wait_in_thread_loop(self):
+        while True:
+            if await asyncio.to_thread(self.watcher.wait, ASYNC_WAITING_THREAD_TIMEOUT):
+                self.notify_waiters()
+
+    async def wait(self, timeout=None):
+        """Returns True if a watched file was changed, or False if timed out"""
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def close(self):
+        if self.waiting_task is not None:
+            self.waiting_task.cancel()
+        else:
+            self.loop.remove_reader(self.watcher.fileno())
+        self.watcher.close()
@@ -0,0 +1,182 @@
+import json
+import socket
+import time
+from pathlib import Path
+from threading import Condition, Lock, Thread
+from game_constants import GAME_STATE_SOCKET_FILE
+
+# protocol of game_state_server.py - one JSON object per line, in both directions
+OPERATION_KEY = "operation"
+FILE_KEY = "file"
+CONTENT_KEY = "content"
+LINES_KEY = "lines"
+FILES_KEY = "files"
+EVENT_KEY = "event"
+WRITE_OPERATION = "write"  # replaces the whole file, like `Path.write_text`
+APPEND_OPERATION = "append"
+SNAPSHOT_EVENT = "snapshot"  # the first event every client gets
+WRITE_EVENT = "write"
+APPEND_EVENT = "append"
+ACK_EVENT = "ack"  # sent to the requesting client after its request's event
+ERROR_EVENT = "error"
+ENCODING = "utf-8"
+CONNECTION_RETRY_INTERVAL = 1  # seconds, between attempts to connect to a server that isn't up
+
+# global mapping of game dirs to their connected clients (only the successful connections)
+game_state_clients = {}
+connection_attempt_times = {}  # game dir -> time.monotonic() of the last attempt to connect
+game_state_clients_lock = Lock()
+
+
+class GameStateClient:
+    """
+    Keeps an in-memory copy of the game's state files, which is kept up to date by the events the
+    server pushes, so status checks don't need any file I/O. Writes are sent to the server (which
+    writes them through to the files) and return only after this client has got their event.
+    """
+
+    def __init__(self, game_dir):
+        self.game_dir = game_dir
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(str(game_dir / GAME_STATE_SOCKET_FILE))
+        self.condition = Condition()  # notified on every event
+        self.files = {}  # file name -> content
+        self.versions = {}  # file name -> number of changes seen, used for waiting on changes
+        self.send_lock = Lock()
+        self.num_requests = self.num_acks = 0
+        self.failed_requests = set()  # indices of requests the server answered with an error
+        self.connected = True
+        self.received_snapshot = False
+        Thread(target=self.receive_events_loop, daemon=True).start()
+        with self.condition:
+            self.condition.wait_for(lambda: self.received_snapshot or not self.connected)
+
+    def receive_events_loop(self):
+        try:
+            for line in self.socket.makefile("r", encoding=ENCODING):
+                self.apply_event(json.loads(line))
+        except (OSError, ValueError):
+            pass
+        with self.condition:
+            self.connected = False
+            self.condition.notify_all()
+
+    def apply_event(self, event):
+        with self.condition:
+            if event[EVENT_KEY] == SNAPSHOT_EVENT:
+                self.files.update(event[FILES_KEY])
+                for file_name in event[FILES_KEY]:
+                    self.versions[file_name] = self.versions.get(file_name, 0) + 1
+                self.received_snapshot = True
+            elif event[EVENT_KEY] == WRITE_EVENT:
+                self.files[event[FILE_KEY]] = event[CONTENT_KEY]
+                self.versions[event[FILE_KEY]] = self.versions.get(event[FILE_KEY], 0) + 1
+            elif event[EVENT_KEY] == APPEND_EVENT:
+                self.versions[event[FILE_KEY]] = self.versions.get(event[FILE_KEY], 0) + 1
+            elif event[EVENT_KEY] in (ACK_EVENT, ERROR_EVENT):
+                self.num_acks += 1  # the server answers every client's requests in their order
+                if event[EVENT_KEY] == ERROR_EVENT:
+                    self.failed_requests.add(self.num_acks)
+            self.condition.notify_all()
+
+    def request(self, operation, file_name, content):
+        """Returns whether the server has handled the request (if not, the file is used directly)"""
+        message = json.dumps({OPERATION_KEY: operation, FILE_KEY: file_name,
+                              CONTENT_KEY: content}) + "\n"
+        with self.send_lock:
+            try:
+                self.socket.sendall(message.encode(ENCODING))
+            except OSError:
+                return False
+            self.num_requests += 1
+            request_index = self.num_requests
+        with self.condition:
+            self.condition.wait_for(lambda: self.num_acks >= request_index or not self.connected)
+            if request_index in self.failed_requests:
+                self.failed_requests.remove(request_index)
+                return False
+            return self.num_acks >= request_index
+
+    def read_file(self, file_name):
+        """Returns None if the file isn't held by the server (so it should be read directly)"""
+        with self.condition:
+            return self.files.get(file_name) if self.connected else None
+
+    def write_file(self, file_name, content):
+        return self.request(WRITE_OPERATION, file_name, content)
+
+    def append_to_file(self, file_name, content):
+        return self.request(APPEND_OPERATION, file_name, content)
+
+    def get_watcher(self, file_names=None):
+        return GameStateWatcher(self, file_names)
+
+
+class GameStateWatcher:
+    """Same interface as the watchers in game_dir_watcher.py, but woken by the server's events"""
+
+    def __init__(self, client, file_names=None):
+        self.client = client
+        self.file_names = set(file_names) if file_names else None
+        self.fallback_watcher = None  # used if the server goes down in the middle of the game
+        with self.client.condition:
+            self.seen_versions = self.get_versions()
+
+    def get_versions(self):
+        if self.file_names is None:
+            return dict(self.client.versions)
+        return {file_name: self.client.versions.get(file_name, 0) for file_name in self.file_names}
+
+    def fileno(self):
+        return None
+
+    def wait(self, timeout=None):
+        """Returns True if a watched file was changed, or False if timed out"""
+        if self.fallback_watcher is not None:
+            return self.fallback_watcher.wait(timeout)
+        with self.client.condition:
+            self.client.condition.wait_for(
+                lambda: self.get_versions() != self.seen_versions or not self.client.connected,
+                timeout)
+            versions = self.get_versions()
+            changed = versions != self.seen_versions
+            self.seen_versions = versions
+            if not self.client.connected:
+                from game_dir_watcher import get_game_dir_file_watcher  # avoids a circular import
+                self.fallback_watcher = get_game_dir_file_watcher(self.client.game_dir,
+                                                                  self.file_names)
+                return True  # the files might have changed while disconnecting
+        return changed
+
+    def close(self):
+        if self.fallback_watcher is not None:
+            self.fallback_watcher.close()
+
+
+def connect_to_game_state_server(game_dir):
+    if not hasattr(socket, "AF_UNIX") or not (game_dir / GAME_STATE_SOCKET_FILE).exists():
+        return None
+    try:
+        return GameStateClient(game_dir)
+    except OSError:  # probably a leftover socket file of a server that isn't running anymore
+        return None
+
+
+def get_game_state_client(game_dir):
+    """Returns None if there's no running server for this game, then files are used directly"""
+    game_dir = Path(game_dir)
+    key = str(game_dir.absolute())
+    with game_state_clients_lock:
+        client = game_state_clients.get(key)
+        if client is not None and client.connected:
+            return client
+        # not connected yet, or the server went down - tried again once in a while, since the
+        # server might start (again) in the middle of the game
+        now = time.monotonic()
+        if now - connection_attempt_times.get(key, -float("inf")) < CONNECTION_RETRY_INTERVAL:
+            return None
+        connection_attempt_times[key] = now
+        client = connect_to_game_state_server(game_dir)
+        if client is not None:
+            game_state_clients[key] = client
+        return client
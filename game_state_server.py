@@ -0,0 +1,143 @@
+import json
+import socketserver
+from threading import Lock, Thread
+from game_constants import *  # incl. argparse, time, Path (from pathlib), colored (from termcolor)
+from game_dir_watcher import get_game_dir_file_watcher
+from file_tail_reader import FileTailReader
+from game_state_client import OPERATION_KEY, FILE_KEY, CONTENT_KEY, LINES_KEY, FILES_KEY, \
+    EVENT_KEY, WRITE_OPERATION, APPEND_OPERATION, SNAPSHOT_EVENT, WRITE_EVENT, APPEND_EVENT, \
+    ACK_EVENT, ERROR_EVENT, ENCODING
+
+SERVER_COLOR = "magenta"
+SERVER_STARTED_MESSAGE_FORMAT = "The game state server is running on: {}\n" \
+                                "It should be started before all other game processes, " \
+                                "and stopped (Ctrl+C) after they have all finished."
+SERVER_STOPPED_MESSAGE = "The game state server has stopped."
+
+
+def get_rewritten_game_files(player_names):
+    personal_status_files = [PERSONAL_STATUS_FILE_FORMAT.format(name) for name in player_names]
+    return GAME_STATUS_FILES + [PLAYER_NAMES_FILE, MAFIA_NAMES_FILE] + personal_status_files
+
+
+def get_appended_game_files(player_names):
+    personal_files = [file_format.format(name) for name in player_names
+                      for file_format in (PERSONAL_CHAT_FILE_FORMAT, PERSONAL_VOTE_FILE_FORMAT)]
+    return PUBLIC_CHAT_FILES + personal_files
+
+
+class GameStateStore:
+    """
+    Holds the game's state files in memory and pushes every change to all subscribed clients.
+    Everything is written through to the game dir (so analyze.py and processes that don't use the
+    server keep working), and changes made directly to the files are picked up and pushed as well.
+    """
+
+    def __init__(self, game_dir):
+        self.game_dir = game_dir
+        self.lock = Lock()  # keeps all events in the same order for all subscribers
+        self.subscribers = []
+        player_names = (game_dir / PLAYER_NAMES_FILE).read_text().splitlines()
+        self.files = {file_name: (game_dir / file_name).read_text()
+                      for file_name in get_rewritten_game_files(player_names)}
+        self.file_readers = {file_name: FileTailReader(game_dir / file_name)
+                             for file_name in get_appended_game_files(player_names)}
+        for file_reader in self.file_readers.values():
+            file_reader.read_new_lines()  # the server only pushes what's new after subscribing
+        self.watcher = get_game_dir_file_watcher(game_dir,
+                                                 list(self.files) + list(self.file_readers))
+        Thread(target=self.watch_files_loop, daemon=True).start()
+
+    def send(self, subscriber, event):
+        try:
+            subscriber.write((json.dumps(event) + "\n").encode(ENCODING))
+        except OSError:  # the client has disconnected
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+    def broadcast(self, event):
+        for subscriber in self.subscribers[:]:
+            self.send(subscriber, event)
+
+    def subscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.append(subscriber)
+            self.send(subscriber, {EVENT_KEY: SNAPSHOT_EVENT, FILES_KEY: self.files})
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+    def refresh_file(self, file_name):
+        if file_name in self.files:
+            content = (self.game_dir / file_name).read_text()
+            if content != self.files[file_name]:
+                self.files[file_name] = content
+                self.broadcast({EVENT_KEY: WRITE_EVENT, FILE_KEY: file_name, CONTENT_KEY: content})
+        elif file_name in self.file_readers:
+            lines = self.file_readers[file_name].read_new_lines()
+            if lines:
+                self.broadcast({EVENT_KEY: APPEND_EVENT, FILE_KEY: file_name, LINES_KEY: lines})
+
+    def watch_files_loop(self):  # for changes that weren't made through the server
+        while True:
+            self.watcher.wait()
+            with self.lock:
+                for file_name in list(self.files) + list(self.file_readers):
+                    self.refresh_file(file_name)
+
+    def handle_request(self, request, subscriber):
+        file_name = request[FILE_KEY]
+        with self.lock:
+            if Path(file_name).name != file_name:  # only files inside the game dir are allowed
+                self.send(subscriber, {EVENT_KEY: ERROR_EVENT, FILE_KEY: file_name})
+                return
+            if request[OPERATION_KEY] == WRITE_OPERATION:
+                (self.game_dir / file_name).write_text(request[CONTENT_KEY])
+            elif request[OPERATION_KEY] == APPEND_OPERATION:
+                with open(self.game_dir / file_name, "a") as f:
+                    f.write(request[CONTENT_KEY])
+            self.refresh_file(file_name)
+            self.send(subscriber, {EVENT_KEY: ACK_EVENT})  # after the event, so it's applied
+
+
+class GameStateRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        store = self.server.store
+        store.subscribe(self.wfile)
+        try:
+            for line in self.rfile:
+                store.handle_request(json.loads(line), self.wfile)
+        finally:
+            store.unsubscribe(self.wfile)
+
+
+class GameStateServer(socketserver.ThreadingUnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, game_dir):
+        self.store = GameStateStore(game_dir)
+        super().__init__(str(game_dir / GAME_STATE_SOCKET_FILE), GameStateRequestHandler)
+
+
+def main():
+    game_dir = get_game_dir_from_argv()
+    socket_path = game_dir / GAME_STATE_SOCKET_FILE
+    socket_path.unlink(missing_ok=True)  # a leftover from a previous run that wasn't stopped well
+    server = GameStateServer(game_dir)
+    print(colored(SERVER_STARTED_MESSAGE_FORMAT.format(socket_path), SERVER_COLOR))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        socket_path.unlink(missing_ok=True)
+        print(colored(SERVER_STOPPED_MESSAGE, SERVER_COLOR))
+
+
+if __name__ == '__main__':
+    main()
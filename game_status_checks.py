@@ -1,28 +1,57 @@
 from game_constants import NIGHTTIME, PHASE_STATUS_FILE, WHO_WINS_FILE, VOTED_OUT, \
     PERSONAL_STATUS_FILE_FORMAT, VOTING_TIME, GAME_START_TIME_FILE, MAFIA_NAMES_FILE
+from game_state_client import get_game_state_client
+
+
+# access to the game files, through game_state_server.py if it's running for this game
+def read_game_file(game_dir, file_name):
+    game_state_client = get_game_state_client(game_dir)
+    if game_state_client is not None:
+        content = game_state_client.read_file(file_name)
+        if content is not None:  # otherwise it's not a file that the server holds in memory
+            return content
+    return (game_dir / file_name).read_text()
+
+
+def write_game_file(game_dir, file_name, content):
+    game_state_client = get_game_state_client(game_dir)
+    if game_state_client is None or not game_state_client.write_file(file_name, content):
+        (game_dir / file_name).write_text(content)
+
+
+def append_to_game_file(game_dir, file_name, content):
+    game_state_client = get_game_state_client(game_dir)
+    if game_state_client is None or not game_state_client.append_to_file(file_name, content):
+        with open(game_dir / file_name, "a") as f:
+            f.write(content)
+
+
+def get_phase_status(game_dir):
+    return read_game_file(game_dir, PHASE_STATUS_FILE)
 
 
 def is_nighttime(game_dir):
-    return NIGHTTIME in (game_dir / PHASE_STATUS_FILE).read_text()
+    return NIGHTTIME in get_phase_status(game_dir)
 
 
 def is_game_over(game_dir):
-    return bool((game_dir / WHO_WINS_FILE).read_text())  # if someone wins, the file isn't empty
+    # if someone wins, the file isn't empty
+    return bool(read_game_file(game_dir, WHO_WINS_FILE))
 
 
 def is_voted_out(name, game_dir):
-    return VOTED_OUT in (game_dir / PERSONAL_STATUS_FILE_FORMAT.format(name)).read_text()
+    return VOTED_OUT in read_game_file(game_dir, PERSONAL_STATUS_FILE_FORMAT.format(name))
 
 
 def is_time_to_vote(game_dir):
-    return VOTING_TIME in (game_dir / PHASE_STATUS_FILE).read_text()
+    return VOTING_TIME in get_phase_status(game_dir)
 
 
 def all_players_joined(game_dir):
     # game is started by manager after all players joined, and then the file will not be empty
-    return bool((game_dir / GAME_START_TIME_FILE).read_text())
+    return bool(read_game_file(game_dir, GAME_START_TIME_FILE))
 
 
 def get_is_mafia(name, game_dir):
-    mafia_names = (game_dir / MAFIA_NAMES_FILE).read_text().splitlines()  # removes the "\n"
+    mafia_names = read_game_file(game_dir, MAFIA_NAMES_FILE).splitlines()  # removes the "\n"
     return name in mafia_names
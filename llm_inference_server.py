@@ -0,0 +1,165 @@
+import queue
+import torch
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener
+from threading import Event, Thread
+from game_constants import *  # incl. argparse, time, Path (from pathlib), colored (from termcolor)
+from llm_players.llm_constants import DEFAULT_INFERENCE_SERVER_PORT, DEFAULT_MAX_BATCH_SIZE, \
+    DEFAULT_MAX_BATCH_WAITING_TIME
+from llm_players.llm_backends import cached_model, cached_tokenizer
+from llm_players.inference_server_client import MODEL_NAME_KEY, PROMPT_KEY, \
+    GENERATION_PARAMETERS_KEY, OUTPUT_KEY, NUM_PROMPT_TOKENS_KEY, NUM_COMPLETION_TOKENS_KEY, \
+    ERROR_KEY, INFERENCE_SERVER_HOST, INFERENCE_SERVER_AUTHKEY
+
+SERVER_COLOR = "magenta"
+SERVER_STARTED_MESSAGE_FORMAT = "The inference server is serving {} on port {}.\n" \
+                                "LLM players with `use_inference_server` in their config will " \
+                                "use it instead of loading the model themselves."
+SERVER_STOPPED_MESSAGE = "The inference server has stopped."
+
+
+class GenerationRequest:
+
+    def __init__(self, prompt, generation_parameters):
+        self.prompt = prompt
+        self.generation_parameters = generation_parameters
+        self.response = None
+        self.done = Event()
+
+
+class BatchedModel:
+    """
+    Holds one copy of a model for all players, and generates for the requests that arrive
+    concurrently in a single `model.generate` call: a batch is started once it has
+    `max_batch_size` requests, or `max_batch_waiting_time` seconds after its first request arrived.
+    Only requests with the same generation parameters can be in the same batch.
+    """
+
+    def __init__(self, model_name, max_batch_size, max_batch_waiting_time):
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.tokenizer = cached_tokenizer(model_name)
+        self.tokenizer.padding_side = "left"  # so all prompts end right before the generation
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.model = cached_model(model_name)
+        self.model.to(self.device)
+        self.model.eval()
+        # the rows that finish early are padded after their end of sequence token, which might be
+        # the padding token too, so a completion is counted up to its first end (of any of them)
+        eos_token_ids = self.model.generation_config.eos_token_id
+        if eos_token_ids is None:
+            eos_token_ids = self.tokenizer.eos_token_id
+        self.eos_token_ids = torch.tensor(eos_token_ids, device=self.device).flatten()
+        self.max_batch_size = max_batch_size
+        self.max_batch_waiting_time = max_batch_waiting_time
+        self.requests = queue.Queue()
+        self.pending_requests = []  # arrived, but didn't fit in the previous batch
+        Thread(target=self.batching_loop, daemon=True).start()
+
+    def generate(self, prompt, generation_parameters):  # called concurrently by the connections
+        request = GenerationRequest(prompt, generation_parameters)
+        self.requests.put(request)
+        request.done.wait()
+        return request.response
+
+    def collect_batch(self):
+        if not self.pending_requests:
+            self.pending_requests.append(self.requests.get())
+        deadline = time.monotonic() + self.max_batch_waiting_time
+        while len(self.pending_requests) < self.max_batch_size:
+            try:
+                remaining_time = max(deadline - time.monotonic(), 0)
+                self.pending_requests.append(self.requests.get(timeout=remaining_time))
+            except queue.Empty:
+                break
+        generation_parameters = self.pending_requests[0].generation_parameters
+        batch = [request for request in self.pending_requests
+                 if request.generation_parameters == generation_parameters][:self.max_batch_size]
+        self.pending_requests = [request for request in self.pending_requests
+                                 if request not in batch]
+        return batch
+
+    def run_batch(self, batch):
+        try:
+            inputs = self.tokenizer([request.prompt for request in batch], return_tensors="pt",
+                                    padding=True)
+            inputs = {key: value.to(self.device) for key, value in inputs.items()}
+            with torch.inference_mode():
+                outputs = self.model.generate(**inputs, pad_token_id=self.tokenizer.pad_token_id,
+                                              **batch[0].generation_parameters)
+            padded_prompt_length = inputs["input_ids"].shape[1]
+            prompts_lengths = inputs["attention_mask"].sum(dim=1).tolist()
+            for request, output, prompt_length in zip(batch, outputs, prompts_lengths):
+                completion = output[padded_prompt_length:]
+                request.response = {
+                    OUTPUT_KEY: self.tokenizer.decode(
+                        output[padded_prompt_length - prompt_length:]),  # without the padding
+                    NUM_PROMPT_TOKENS_KEY: prompt_length,
+                    NUM_COMPLETION_TOKENS_KEY: self.get_completion_length(completion)
+                }
+        except Exception as e:  # the players should know, and the server should keep serving
+            for request in batch:
+                request.response = {ERROR_KEY: repr(e)}
+        for request in batch:
+            request.done.set()
+
+    def get_completion_length(self, completion):
+        """including its end of sequence token, as the direct generation counts it"""
+        ends = torch.isin(completion, self.eos_token_ids).nonzero()
+        return int(ends[0]) + 1 if len(ends) else len(completion)
+
+    def batching_loop(self):
+        while True:
+            self.run_batch(self.collect_batch())
+
+
+def serve_connection(connection, models):
+    with connection:
+        while True:
+            try:
+                request = connection.recv()
+            except (EOFError, OSError):  # the player has disconnected
+                return
+            model = models.get(request[MODEL_NAME_KEY])
+            if model is None:
+                response = {ERROR_KEY: f"{request[MODEL_NAME_KEY]} isn't served by this server"}
+            else:
+                response = model.generate(request[PROMPT_KEY], request[GENERATION_PARAMETERS_KEY])
+            connection.send(response)
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("model_names", nargs="+", help="names (or local paths) of models to serve")
+    parser.add_argument("-p", "--port", type=int, default=DEFAULT_INFERENCE_SERVER_PORT)
+    parser.add_argument("-b", "--max_batch_size", type=int, default=DEFAULT_MAX_BATCH_SIZE)
+    parser.add_argument("-w", "--max_batch_waiting_time", type=float,
+                        default=DEFAULT_MAX_BATCH_WAITING_TIME,
+                        help="seconds to wait for more requests before generating a batch")
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    models = {model_name: BatchedModel(model_name, args.max_batch_size,
+                                       args.max_batch_waiting_time)
+              for model_name in args.model_names}
+    listener = Listener((INFERENCE_SERVER_HOST, args.port), authkey=INFERENCE_SERVER_AUTHKEY)
+    print(colored(SERVER_STARTED_MESSAGE_FORMAT.format(", ".join(models), args.port),
+                  SERVER_COLOR))
+    try:
+        while True:
+            try:
+                connection = listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                continue
+            Thread(target=serve_connection, args=(connection, models), daemon=True).start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        print(colored(SERVER_STOPPED_MESSAGE, SERVER_COLOR))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,16 @@
 import json
+import math
 import random
+from threading import Event, Lock, Thread
 from game_constants import *  # incl. argparse, time, Path (from pathlib), colored (from termcolor)
 from game_status_checks import is_nighttime, is_game_over, is_voted_out, is_time_to_vote, \
-    all_players_joined
+    all_players_joined, read_game_file, write_game_file, append_to_game_file, get_phase_status
 from llm_players.factory import llm_player_factory
-from llm_players.llm_constants import GAME_DIR_KEY, VOTING_WAITING_TIME, MAX_TIME_TO_WAIT
+from llm_players.llm_constants import GAME_DIR_KEY, VOTING_WAITING_TIME_SIGMA, \
+    VOTING_WAITING_TIME_SPREAD, MAX_TIME_TO_WAIT, GENERATION_STATUS_CHECK_INTERVAL
+from game_dir_watcher import get_game_dir_watcher
+from file_tail_reader import FileTailReader
+from message_records import MessageRecord
 
 
 OPERATOR_COLOR = "yellow"  # the person running this file is the "operator" of the model
@@ -15,14 +21,14 @@ LLM_VOTE_MESSAGE_FORMAT = "The LLM player has voted for: {}"
 GAME_ENDED_MESSAGE = "Game has ended, without being voted out!"
 GET_LLM_PLAYER_NAME_MESSAGE = "This game has multiple LLM players, which one you want to run now?"
 ELIMINATED_MESSAGE = "This LLM player was eliminated from the game..."
-
-
-# global variable
-game_dir = Path()  # will be updated in get_llm_player
+# outcomes of a background generation, in the timeline:
+SENT_OUTCOME = "sent"
+PASSED_TURN_OUTCOME = "passed_turn"
+CANCELLED_OUTCOME = "cancelled"
+TOO_LATE_OUTCOME = "too_late"
 
 
 def get_llm_player():
-    global game_dir
     game_dir = get_game_dir_from_argv()
     with open(game_dir / GAME_CONFIG_FILE) as f:
         config = json.load(f)
@@ -38,27 +44,23 @@ def get_llm_player():
                          if player["name"] == player_name][0]
     player_config[GAME_DIR_KEY] = game_dir
     llm_player = llm_player_factory(player_config)
-    (game_dir / PERSONAL_STATUS_FILE_FORMAT.format(llm_player.name)).write_text(JOINED)
+    write_game_file(game_dir, PERSONAL_STATUS_FILE_FORMAT.format(llm_player.name), JOINED)
     return llm_player
 
 
-def read_messages_from_file(message_history, file_name, num_read_lines):
-    with open(game_dir / file_name, "r") as f:
-        lines = f.readlines()[num_read_lines:]
-    message_history.extend(lines)
+def read_messages_from_file(message_history, file_reader):
+    lines = file_reader.read_new_lines()
+    message_history.extend(map(MessageRecord, lines))  # parsed once, for all the player's uses
     return len(lines)
 
 
-def wait_writing_time(player, message):
-    if player.num_words_per_second_to_wait > 0:
-        num_words = len(message.split())
-        time.sleep(min(num_words // player.num_words_per_second_to_wait, MAX_TIME_TO_WAIT))
-        # TODO: leave only working part
-        # time.sleep(num_words // player.num_words_per_second_to_wait)
-        # time.sleep(num_words // player.num_words_per_second_to_wait + 2)
-        # # It was originally num words per second, but now I changed it to be treated as num chars per second
-        # # treated as num chars per second to wait:
-        # time.sleep(len(message) // player.num_words_per_second_to_wait)
+def get_typing_time(player, message):
+    """Random, like the time humans take to type a message of this length"""
+    if player.num_words_per_second_to_wait <= 0:
+        return 0
+    typing_speed = random.lognormvariate(math.log(player.num_words_per_second_to_wait),
+                                         player.typing_speed_sigma)  # in words per second
+    return min(len(message.split()) / typing_speed, MAX_TIME_TO_WAIT)
 
 
 def eliminate(player):
@@ -66,46 +68,187 @@ def eliminate(player):
     print(colored(ELIMINATED_MESSAGE, OPERATOR_COLOR))
 
 
-def get_vote_from_llm(player, message_history):
-    candidate_vote_names = (game_dir / REMAINING_PLAYERS_FILE).read_text().splitlines()
+def get_candidate_vote_names(player):
+    candidate_vote_names = read_game_file(player.game_dir, REMAINING_PLAYERS_FILE).splitlines()
     candidate_vote_names.remove(player.name)
-    voting_message = player.get_vote(message_history, candidate_vote_names)
+    return candidate_vote_names
+
+
+def find_voted_name(voting_message, candidate_vote_names):
+    """The candidate the voting message is for, or None if there is no name in it"""
+    if voting_message in candidate_vote_names:  # checked first, since a name might contain another
+        return voting_message
     for name in candidate_vote_names:
-        if name in voting_message:  # update game manger
-            update_vote(name, player)
-            return
-    # if didn't return: no name was in voting_message
-    player.logger.log(MODEL_VOTED_INVALIDLY_LOG, voting_message)
-    print(colored(MODEL_VOTED_INVALIDLY_LOG + ": " + voting_message, OPERATOR_COLOR))
-    vote = random.choice(candidate_vote_names)
-    player.logger.log(MODEL_RANDOMLY_VOTED_LOG, vote)
-    update_vote(vote, player)
-
-
-def update_vote(voted_name, player):
-    time.sleep(VOTING_WAITING_TIME)
-    with open(game_dir / PERSONAL_VOTE_FILE_FORMAT.format(player.name), "a") as f:
-        f.write(voted_name + "\n")
+        if name in voting_message:
+            return name
+    return None
+
+
+def get_vote_from_llm(player, message_history, voting_start_time, speculative_vote=None):
+    candidate_vote_names = get_candidate_vote_names(player)
+    voted_name = speculative_vote.get_vote(candidate_vote_names) \
+        if speculative_vote is not None else None
+    if voted_name is not None:
+        player.logger.log("speculative vote in get_vote_from_llm", voted_name,
+                          num_history_messages=len(message_history),
+                          num_new_messages=len(message_history)
+                          - speculative_vote.num_messages_at_start)
+    else:
+        with player.timeline.span("get_vote", num_history_messages=len(message_history)):
+            voting_message = player.get_vote(message_history, candidate_vote_names)
+        voted_name = find_voted_name(voting_message, candidate_vote_names)
+    if voted_name is None:
+        player.logger.log(MODEL_VOTED_INVALIDLY_LOG, voting_message)
+        print(colored(MODEL_VOTED_INVALIDLY_LOG + ": " + voting_message, OPERATOR_COLOR))
+        voted_name = random.choice(candidate_vote_names)
+        player.logger.log(MODEL_RANDOMLY_VOTED_LOG, voted_name)
+    update_vote(voted_name, player, voting_start_time)
+
+
+def get_voting_waiting_time(player):
+    """Random, like the times humans take from the voting's start until they vote"""
+    median = player.voting_waiting_time
+    if median <= 0:
+        return 0
+    waiting_time = random.lognormvariate(math.log(median), VOTING_WAITING_TIME_SIGMA)
+    return min(max(waiting_time, median / VOTING_WAITING_TIME_SPREAD),
+               median * VOTING_WAITING_TIME_SPREAD)
+
+
+def update_vote(voted_name, player, voting_start_time):
+    # the time it took to get the vote is a part of the waiting time, and not added to it
+    with player.timeline.span("wait_voting_time"):
+        time.sleep(max(get_voting_waiting_time(player) - (time.monotonic() - voting_start_time),
+                       0))
+    append_to_game_file(player.game_dir, PERSONAL_VOTE_FILE_FORMAT.format(player.name),
+                        voted_name + "\n")
     print(colored(LLM_VOTE_MESSAGE_FORMAT.format(voted_name), OPERATOR_COLOR))
 
 
-def add_message_to_game(player, message_history):
-    is_nighttime_at_start = is_nighttime(game_dir)
-    if not player.is_mafia and is_nighttime_at_start:
-        return  # only mafia can communicate during nighttime
-    message = player.generate_message(message_history).strip()
-    if is_time_to_vote(game_dir):
-        return  # sometimes the messages is generated when it's already too late, so drop it
-    if message:
+class BackgroundVote:
+    """
+    Computes the vote in a background thread in the last seconds of the phase, before the voting
+    starts, so it's ready as soon as it does. It's recomputed (by a new one) when new messages
+    arrive. It shares the model with BackgroundMessageGeneration, so they don't run together.
+    """
+
+    def __init__(self, player, message_history):
+        self.player = player
+        self.num_messages_at_start = len(message_history)
+        self.num_phase = player.phase_stats.update(message_history).num_phases
+        self.start_time = time.monotonic()
+        self.candidate_vote_names = get_candidate_vote_names(player)
+        self.voted_name = None  # until it's computed, or if the model didn't vote for a candidate
+        self.player.llm.allow_generation()
+        self.thread = Thread(target=self.compute_vote, args=(list(message_history),), daemon=True)
+        self.thread.start()
+
+    def compute_vote(self, message_history):
+        with self.player.timeline.span("speculative_vote",
+                                       num_history_messages=len(message_history)) as span_args:
+            voting_message = self.player.get_vote(message_history, self.candidate_vote_names)
+            self.voted_name = find_voted_name(voting_message, self.candidate_vote_names)
+            span_args["voted_name"] = self.voted_name
+
+    def is_done(self):
+        return not self.thread.is_alive()
+
+    def is_outdated(self, message_history):
+        return len(message_history) > self.num_messages_at_start \
+            and time.monotonic() - self.start_time >= self.player.speculative_vote_interval
+
+    def get_vote(self, candidate_vote_names):
+        """The vote if it's still valid for this voting, or None"""
+        self.thread.join()  # if it's still computing, it has the freshest history
+        if not self.is_of_current_phase() or self.voted_name not in candidate_vote_names:
+            return None
+        return self.voted_name
+
+    def is_of_current_phase(self):
+        return self.num_phase == self.player.phase_stats.num_phases
+
+    def cancel(self, wait=False):
+        self.player.llm.cancel_generation()
+        if wait:  # for using the model right after
+            self.thread.join()
+            self.player.llm.allow_generation()
+
+
+class BackgroundMessageGeneration:
+    """
+    Generates a message (and waits its writing time) in a background thread, so that new messages
+    keep being read while the model is thinking. When it's cancelled, the model stops as soon as it
+    can and nothing is sent. Only one should be running at a time, since they share the model.
+    """
+
+    def __init__(self, player, message_history, trigger=None):
+        self.player = player
+        self.trigger = trigger  # why the player was asked now
+        self.game_dir = player.game_dir
+        self.num_messages_at_start = len(message_history)
+        self.phase_status = get_phase_status(self.game_dir)
+        self.lock = Lock()  # so a message is never sent after the generation was cancelled
+        self.cancelled = Event()
+        # a message that is ready only after its phase has ended would be dropped anyway:
+        self.player.llm.allow_generation(deadline=player.get_phase_deadline(message_history))
+        self.thread = Thread(target=self.generate_and_send, args=(list(message_history),),
+                             daemon=True)
+        self.thread.start()
+
+    def generate_and_send(self, message_history):
+        # the player's reaction time, split into stages by the spans inside it
+        with self.player.timeline.span("reaction", num_history_messages=len(message_history),
+                                       trigger=self.trigger) as span_args:
+            span_args["outcome"] = self.try_generate_and_send(message_history)
+
+    def try_generate_and_send(self, message_history):
+        """Returns the outcome: whether the message was sent, and if not then why"""
+        # the player starts "typing" when it's asked, so the scheduling and the generation are a
+        # part of the typing time, and the message is sent when both it and the typing are done
+        typing_start_time = time.monotonic()
+        with self.player.timeline.span("generate_message"):
+            message = self.player.generate_message(message_history).strip()
+        if self.cancelled.is_set():
+            return CANCELLED_OUTCOME
+        if not message:
+            print(colored(MODEL_CHOSE_TO_PASS_TURN_LOG, OPERATOR_COLOR))
+            return PASSED_TURN_OUTCOME
         # artificially making the model taking time to write the message
-        wait_writing_time(player, message)
-        if is_nighttime(game_dir) != is_nighttime_at_start:
-            return  # waited for too long
-        with open(game_dir / PERSONAL_CHAT_FILE_FORMAT.format(player.name), "a") as f:
-            f.write(format_message(player.name, message))
+        with self.player.timeline.span("wait_writing_time"):
+            typing_time_left = get_typing_time(self.player, message) \
+                - (time.monotonic() - typing_start_time)
+            if self.cancelled.wait(max(typing_time_left, 0)):
+                return CANCELLED_OUTCOME
+        with self.lock:
+            if self.cancelled.is_set() or get_phase_status(self.game_dir) != self.phase_status:
+                return TOO_LATE_OUTCOME  # sometimes the message is ready when it's already too late
+            line = format_message(self.player.name, message)
+            append_to_game_file(self.game_dir, PERSONAL_CHAT_FILE_FORMAT.format(self.player.name),
+                                line)
+            self.player.add_previous_message(MessageRecord(line))
         print(colored(MODEL_CHOSE_TO_USE_TURN_LOG, OPERATOR_COLOR))
-    else:
-        print(colored(MODEL_CHOSE_TO_PASS_TURN_LOG, OPERATOR_COLOR))
+        return SENT_OUTCOME
+
+    def is_done(self):
+        return not self.thread.is_alive()
+
+    def is_outdated(self, message_history):
+        num_new_messages = len(message_history) - self.num_messages_at_start
+        return num_new_messages >= self.player.num_new_messages_to_restart_generation \
+            or get_phase_status(self.game_dir) != self.phase_status
+
+    def cancel(self, wait=False):
+        with self.lock:
+            self.cancelled.set()
+            self.player.llm.cancel_generation()
+        if wait:  # for using the model right after
+            self.thread.join()
+            self.player.llm.allow_generation()
+
+
+def cancel_generation(generation, wait=False):
+    if generation is not None:
+        generation.cancel(wait)
 
 
 def end_game():
@@ -114,29 +257,70 @@ def end_game():
 
 def main():
     player = get_llm_player()
+    game_dir = player.game_dir
     print(colored(LLM_PLAYER_LOADED_MESSAGE, OPERATOR_COLOR))
+    game_dir_watcher = get_game_dir_watcher(
+        game_dir,
+        PUBLIC_CHAT_FILES + GAME_STATUS_FILES + [PERSONAL_STATUS_FILE_FORMAT.format(player.name)])
     while not all_players_joined(game_dir):
-        continue
+        game_dir_watcher.wait()
     print(colored(ALL_PLAYERS_JOINED_MESSAGE, OPERATOR_COLOR))
     message_history = []
-    num_read_lines_manager = num_read_lines_daytime = num_read_lines_nighttime = 0
+    manager_chat_reader = FileTailReader(game_dir / PUBLIC_MANAGER_CHAT_FILE)
+    daytime_chat_reader = FileTailReader(game_dir / PUBLIC_DAYTIME_CHAT_FILE)
+    nighttime_chat_reader = FileTailReader(game_dir / PUBLIC_NIGHTTIME_CHAT_FILE)
+    generation = None  # the message currently generated in the background
+    speculative_vote = None  # the vote computed in the background before the voting, if any
     while not is_game_over(game_dir):
-        num_read_lines_manager += read_messages_from_file(
-            message_history, PUBLIC_MANAGER_CHAT_FILE, num_read_lines_manager)
+        read_messages_from_file(message_history, manager_chat_reader)
         # only current phase file will have new messages, so no need to run expensive is_nighttime()
-        num_read_lines_daytime += read_messages_from_file(
-            message_history, PUBLIC_DAYTIME_CHAT_FILE, num_read_lines_daytime)
+        read_messages_from_file(message_history, daytime_chat_reader)
         if player.is_mafia:  # only mafia can see what happens during nighttime
-            num_read_lines_nighttime += read_messages_from_file(
-                message_history, PUBLIC_NIGHTTIME_CHAT_FILE, num_read_lines_nighttime)
+            read_messages_from_file(message_history, nighttime_chat_reader)
+        player.invocation_policy.update(message_history)
         if is_voted_out(player.name, game_dir):
+            cancel_generation(generation)
+            cancel_generation(speculative_vote)
             eliminate(player)
             break
         if is_time_to_vote(game_dir) and (player.is_mafia or not is_nighttime(game_dir)):
-            get_vote_from_llm(player, message_history)
-            while is_time_to_vote(game_dir):
-                continue  # wait for voting time to end when all players have voted
-        add_message_to_game(player, message_history)
+            voting_start_time = time.monotonic()
+            # the model is needed for voting (a running speculative vote means the model is free
+            # of generations, since they don't run together, and it's waited for instead)
+            if speculative_vote is None or speculative_vote.is_done():
+                cancel_generation(generation, wait=True)
+            voting_phase_status = get_phase_status(game_dir)
+            get_vote_from_llm(player, message_history, voting_start_time, speculative_vote)
+            speculative_vote = None
+            # wait for voting time to end when all players have voted (the next phase might be
+            # cut straight to voting, so it's checked by change of phase and not by is_time_to_vote)
+            while get_phase_status(game_dir) == voting_phase_status:
+                game_dir_watcher.wait()
+        if not player.is_mafia and is_nighttime(game_dir):
+            cancel_generation(generation)
+            game_dir_watcher.wait()  # only mafia can communicate during nighttime
+            continue
+        if generation is not None and not generation.is_done() \
+                and generation.is_outdated(message_history):
+            generation.cancel()  # and once it has stopped, restarted with the fresh context
+        is_model_free = (generation is None or generation.is_done()) \
+            and (speculative_vote is None or speculative_vote.is_done())
+        if is_model_free:
+            is_vote_precomputation_time = player.is_vote_precomputation_time(message_history)
+            if is_vote_precomputation_time and (speculative_vote is None
+                                                or not speculative_vote.is_of_current_phase()):
+                # the phase's first vote comes before the messages, the next ones after them
+                speculative_vote = BackgroundVote(player, message_history)
+            else:
+                # asking the model again only if something has changed since it was last asked
+                trigger = player.invocation_policy.pop_fired_trigger()
+                if trigger is not None:
+                    generation = BackgroundMessageGeneration(player, message_history, trigger)
+                elif is_vote_precomputation_time and speculative_vote.is_outdated(message_history):
+                    speculative_vote = BackgroundVote(player, message_history)
+        game_dir_watcher.wait(GENERATION_STATUS_CHECK_INTERVAL)
+    cancel_generation(generation)
+    cancel_generation(speculative_vote)
     end_game()
 
 
@@ -1,8 +1,7 @@
-from game_constants import REMAINING_PLAYERS_FILE, GAME_MANAGER_NAME, MESSAGE_PARSING_PATTERN
-from game_status_checks import is_nighttime
 from llm_players.llm_constants import turn_task_into_prompt, EVERY_X_MESSAGES_TYPE, \
-    make_more_human_like
+    make_more_human_like, GENERATION_PROMPT_KIND
 from llm_players.llm_player import LLMPlayer
+from llm_players.logger import DEBUG
 
 
 class EveryXMessagesPlayer(LLMPlayer):  # TODO implement this!
@@ -18,28 +17,26 @@ class EveryXMessagesPlayer(LLMPlayer):  # TODO implement this!
         # self.scheduler = self.llm  # trying to use the same one for generation...
 
     def should_generate_message(self, message_history):
-        if is_nighttime(self.game_dir):
+        stats = self.phase_stats.update(message_history)
+        if stats.is_nighttime():
             every_x = 2
         else:
-            every_x = len((self.game_dir / REMAINING_PLAYERS_FILE).read_text().splitlines())
-        current_phase_messages = 0
-        for message in message_history[::-1]:
-            if f"] {GAME_MANAGER_NAME}: " in message and "voted for" in message:  # TODO constants!
-                continue
-            elif f"] {GAME_MANAGER_NAME}: " in message and "has ended, now it's time to vote!" in message:  # TODO constants!
-                break
-            if f"] " in message and ": " in message:  # TODO constants!
-                current_phase_messages += 1
+            every_x = len(stats.remaining_players)
+        current_phase_messages = stats.num_phase_messages
         self.logger.log("scheduling current_phase_messages", f"{current_phase_messages}")
         self.logger.log("scheduling every_x", f"{every_x}")
         return current_phase_messages % every_x == every_x - 1
 
     def generate_message(self, message_history):
         if self.should_generate_message(message_history):
-            prompt = self.create_generation_prompt(message_history)
-            self.logger.log("prompt in generate_message", prompt)
-            message = self.llm.generate(prompt, self.get_system_info_message())
-            message = make_more_human_like(message)
+            with self.timeline.span("build_generation_prompt",
+                                    num_history_messages=len(message_history)):
+                prompt = self.create_generation_prompt(message_history)
+                system_info = self.get_system_info_message()
+            self.logger.log("prompt in generate_message", prompt, DEBUG)
+            message = self.llm.generate(prompt, system_info, prompt_kind=GENERATION_PROMPT_KIND)
+            with self.timeline.span("make_more_human_like"):
+                message = make_more_human_like(message)
             return message
         else:
             return ""
@@ -69,4 +66,4 @@ class EveryXMessagesPlayer(LLMPlayer):  # TODO implement this!
                # f"\"because they are the only one that didnt vote diane\",\n" \
                # f"\"i think Moe is so loud\",\n" \
                # f"\"jennifer, do you have anything to say for yourself?\"...\n"
-        return turn_task_into_prompt(task, message_history)
+        return turn_task_into_prompt(task, self.get_prompt_history(message_history))
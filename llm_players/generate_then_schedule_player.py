@@ -1,6 +1,7 @@
 from llm_players.llm_constants import turn_task_into_prompt, GENERATE_THEN_SCHEDULE_TYPE, \
-    make_more_human_like
+    make_more_human_like, SCHEDULING_PROMPT_KIND, GENERATION_PROMPT_KIND
 from llm_players.llm_player import LLMPlayer
+from llm_players.logger import DEBUG
 from llm_players.llm_wrapper import LLMWrapper
 
 
@@ -19,18 +20,26 @@ class GenerateThenSchedulePlayer(LLMPlayer):
         potential_message = potential_message_and_message_history[0]
         message_history = potential_message_and_message_history[1:]
         self.logger.log("potential_message in should_generate_message", potential_message)
-        self.logger.log("message_history in should_generate_message", message_history)
-        prompt = self.create_scheduling_prompt(potential_message, message_history)
-        self.logger.log("prompt in should_generate_message", prompt)
-        decision = self.scheduler.generate(prompt, self.get_system_info_message())
+        self.logger.log("message_history in should_generate_message", message_history, DEBUG)
+        with self.timeline.span("build_scheduling_prompt",
+                                num_history_messages=len(message_history)):
+            prompt = self.create_scheduling_prompt(potential_message, message_history)
+            system_info = self.get_system_info_message()
+        self.logger.log("prompt in should_generate_message", prompt, DEBUG)
+        decision = self.scheduler.generate(prompt, system_info, prompt_kind=SCHEDULING_PROMPT_KIND)
         self.logger.log("decision in should_generate_message", decision)
         return self.interpret_scheduling_decision(decision)
 
     def generate_message(self, message_history):
-        prompt = self.create_generation_prompt(message_history)
-        self.logger.log("prompt in generate_message", prompt)
-        potential_message = self.llm.generate(prompt, self.get_system_info_message())
-        potential_message = make_more_human_like(potential_message)
+        with self.timeline.span("build_generation_prompt",
+                                num_history_messages=len(message_history)):
+            prompt = self.create_generation_prompt(message_history)
+            system_info = self.get_system_info_message()
+        self.logger.log("prompt in generate_message", prompt, DEBUG)
+        potential_message = self.llm.generate(prompt, system_info,
+                                              prompt_kind=GENERATION_PROMPT_KIND)
+        with self.timeline.span("make_more_human_like"):
+            potential_message = make_more_human_like(potential_message)
         self.logger.log("potential_message in generate_message", potential_message)
         if self.should_generate_message([potential_message] + message_history):
             return potential_message
@@ -50,7 +59,7 @@ class GenerateThenSchedulePlayer(LLMPlayer):
                f"too! Reply only with {self.use_turn_token} if you want to send this message " \
                f"now, or only with {self.pass_turn_token} if you want to wait for now, " \
                f"based on your decision! "
-        return turn_task_into_prompt(task, message_history)
+        return turn_task_into_prompt(task, self.get_prompt_history(message_history))
 
     def create_generation_prompt(self, message_history):  # TODO this is duplicate from schedule_then_generate... consider extracting? constant / parent class
         task = f"Add a very short message to the game's chat. " \
@@ -59,4 +68,4 @@ class GenerateThenSchedulePlayer(LLMPlayer):
                f"Your message should only be one short sentence! " \
                f"Don't add a message that you've already added (in the chat history)! " \
                f"It is very important that you don't repeat yourself!"
-        return turn_task_into_prompt(task, message_history)
+        return turn_task_into_prompt(task, self.get_prompt_history(message_history))
@@ -0,0 +1,41 @@
+from multiprocessing.connection import Client
+from threading import local
+
+# protocol of llm_inference_server.py - every request is a dict, answered by a dict
+MODEL_NAME_KEY = "model_name"
+PROMPT_KEY = "prompt"  # already formatted by the model's prompt template
+GENERATION_PARAMETERS_KEY = "generation_parameters"
+OUTPUT_KEY = "output"  # decoded, including the prompt (like `model.generate` output)
+NUM_PROMPT_TOKENS_KEY = "num_prompt_tokens"
+NUM_COMPLETION_TOKENS_KEY = "num_completion_tokens"
+ERROR_KEY = "error"
+INFERENCE_SERVER_HOST = "localhost"
+INFERENCE_SERVER_AUTHKEY = b"async-mafia-inference"
+
+
+class InferenceServerClient:
+    """
+    Sends generation requests to a running llm_inference_server.py, which holds the model, instead
+    of loading it in this process. Every thread gets its own connection, so concurrent requests of
+    the same player (like speculative generation) can be batched together by the server.
+    """
+
+    def __init__(self, port):
+        self.address = (INFERENCE_SERVER_HOST, port)
+        self.thread_local = local()
+
+    def get_connection(self):
+        if getattr(self.thread_local, "connection", None) is None:
+            self.thread_local.connection = Client(self.address, authkey=INFERENCE_SERVER_AUTHKEY)
+        return self.thread_local.connection
+
+    def generate(self, model_name, prompt, generation_parameters):
+        """Returns the decoded output, the number of prompt tokens and of completion tokens"""
+        connection = self.get_connection()
+        connection.send({MODEL_NAME_KEY: model_name, PROMPT_KEY: prompt,
+                         GENERATION_PARAMETERS_KEY: generation_parameters})
+        response = connection.recv()
+        if ERROR_KEY in response:
+            raise RuntimeError(f"The inference server failed to generate: {response[ERROR_KEY]}")
+        return response[OUTPUT_KEY], response[NUM_PROMPT_TOKENS_KEY], \
+            response[NUM_COMPLETION_TOKENS_KEY]
@@ -0,0 +1,79 @@
+import re
+import time
+from llm_players.llm_constants import INVOCATION_TRIGGERS, DEFAULT_INVOCATION_TRIGGERS, \
+    PHASE_CHANGE_TRIGGER, MENTION_TRIGGER, PHASE_ENDING_TRIGGER, NEW_MESSAGES_TRIGGER, \
+    SILENCE_TRIGGER, DEBOUNCE_KEY, MIN_INTERVAL_KEY, THRESHOLD_KEY
+from message_records import CHAT, PHASE_START
+
+
+class InvocationPolicy:
+    """
+    Decides when the player should be asked whether to send a message, so the model isn't asked
+    again and again about a history that hasn't changed: only when a trigger fires (a phase change,
+    a mention of the player, the phase's approaching end, new messages of others or a long silence).
+    A pending trigger fires once it has been pending for its debounce time (so a burst of messages
+    leads to a single decision), and not sooner than its minimum interval since it last fired.
+    A decision covers everything that was pending, until something changes again.
+    """
+
+    def __init__(self, name, phase_stats, triggers_settings=None):
+        self.name = name
+        self.mention_pattern = re.compile(rf"\b{re.escape(name)}\b", re.IGNORECASE)
+        self.phase_stats = phase_stats
+        triggers_settings = triggers_settings or {}
+        self.settings = {}  # of the enabled triggers
+        for trigger in INVOCATION_TRIGGERS:
+            if trigger in triggers_settings and triggers_settings[trigger] is None:
+                continue  # disabled
+            self.settings[trigger] = {**DEFAULT_INVOCATION_TRIGGERS[trigger],
+                                      **triggers_settings.get(trigger, {})}
+        self.num_seen_messages = 0
+        self.pending_since = {}  # trigger -> time.monotonic() since when
+        self.last_firing_times = {}  # trigger -> time.monotonic()
+        self.phase_ending_fired = False  # in the current phase
+
+    def set_pending(self, trigger, now, restart_debounce=False):
+        if trigger in self.settings and (restart_debounce or trigger not in self.pending_since):
+            self.pending_since[trigger] = now
+
+    def update(self, message_history):
+        """Called with every new message history, even while the player is busy"""
+        now = time.monotonic()
+        self.phase_stats.update(message_history)
+        for message in message_history[self.num_seen_messages:]:
+            if message.kind == PHASE_START:
+                self.set_pending(PHASE_CHANGE_TRIGGER, now)
+                self.phase_ending_fired = False
+            elif message.kind == CHAT and message.name != self.name:
+                self.set_pending(NEW_MESSAGES_TRIGGER, now, restart_debounce=True)
+                if self.mention_pattern.search(message.content):
+                    self.set_pending(MENTION_TRIGGER, now)
+        self.num_seen_messages = max(self.num_seen_messages, len(message_history))
+        if SILENCE_TRIGGER in self.settings:
+            seconds_since_last_message = self.phase_stats.seconds_since_last_message()
+            if seconds_since_last_message is not None \
+                    and seconds_since_last_message >= self.settings[SILENCE_TRIGGER][THRESHOLD_KEY]:
+                self.set_pending(SILENCE_TRIGGER, now)
+        if PHASE_ENDING_TRIGGER in self.settings and not self.phase_ending_fired:
+            seconds_until_phase_end = self.phase_stats.seconds_until_phase_end()
+            if seconds_until_phase_end is not None and 0 < seconds_until_phase_end \
+                    <= self.settings[PHASE_ENDING_TRIGGER][THRESHOLD_KEY]:
+                self.set_pending(PHASE_ENDING_TRIGGER, now)
+
+    def pop_fired_trigger(self):
+        """Returns the trigger that fired (and clears all the pending ones), or None"""
+        now = time.monotonic()
+        for trigger in INVOCATION_TRIGGERS:
+            if trigger not in self.pending_since:
+                continue
+            settings = self.settings[trigger]
+            if now - self.pending_since[trigger] < settings[DEBOUNCE_KEY] \
+                    or now - self.last_firing_times.get(trigger, -float("inf")) \
+                    < settings[MIN_INTERVAL_KEY]:
+                continue
+            self.last_firing_times[trigger] = now
+            if trigger == PHASE_ENDING_TRIGGER:
+                self.phase_ending_fired = True
+            self.pending_since.clear()  # the decision is made on everything that was pending
+            return trigger
+        return None
@@ -0,0 +1,530 @@
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+from pathlib import Path
+from threading import Lock
+
+from game_constants import get_current_timestamp
+from llm_players.llm_constants import TASK2OUTPUT_FORMAT, NUM_BEAMS_KEY, PIPELINE_TASK_KEY, \
+    USE_PIPELINE_KEY, USE_TOGETHER_KEY, TOGETHER_API_KEY_KEYWORD, SECRETS_DICT_FILE_PATH, \
+    USE_INFERENCE_SERVER_KEY, INFERENCE_SERVER_PORT_KEY, \
+    DEFAULT_INFERENCE_SERVER_PORT, BACKEND_KEY, TOGETHER_BACKEND, PIPELINE_BACKEND, \
+    DIRECT_BACKEND, INFERENCE_SERVER_BACKEND, MOCK_BACKEND, MOCK_LATENCY_KEY, MOCK_SEED_KEY, \
+    DEFAULT_MOCK_LATENCY, DEFAULT_MOCK_SEED, PASS_TURN_TOKEN_KEY, USE_TURN_TOKEN_KEY, \
+    SCHEDULING_PROMPT_KIND, VOTE_PROMPT_KIND, API_BASE_URL_KEY, API_REQUEST_TIMEOUT_KEY, \
+    API_MAX_ATTEMPTS_KEY, API_INITIAL_BACKOFF_KEY, API_MAX_BACKOFF_KEY, \
+    CIRCUIT_BREAKER_THRESHOLD_KEY, CIRCUIT_BREAKER_RESET_TIME_KEY, FALLBACK_MODEL_NAME_KEY, \
+    DEFAULT_API_REQUEST_TIMEOUT, DEFAULT_API_MAX_ATTEMPTS, DEFAULT_API_INITIAL_BACKOFF, \
+    DEFAULT_API_MAX_BACKOFF, DEFAULT_CIRCUIT_BREAKER_THRESHOLD, DEFAULT_CIRCUIT_BREAKER_RESET_TIME
+from llm_players.inference_server_client import InferenceServerClient
+from llm_players.prefix_cache import PrefixCache
+from llm_players.logger import DEBUG, WARNING
+from llm_players.retry_policy import RetryPolicy, CircuitBreaker, get_retry_after
+
+CACHE_DIR = os.path.expanduser("~/.cache/huggingface/hub")
+MOCK_USE_TURN_PROBABILITY = 0.3
+MOCK_MIN_PROBABILITY = 0.001
+MOCK_MESSAGES = ["I think we should hear from everyone before we vote",
+                 "Who was quiet during the night?", "I'm just a bystander, I promise",
+                 "That sounds suspicious to me", "Let's not rush into voting",
+                 "Why are you defending them?", "I agree with the last message",
+                 "We need to find the mafia fast"]
+MOCK_VOTE_CANDIDATES_PATTERN = r"nothing but that name: (.+)"  # the end of the voting task
+ESTIMATED_CHARS_PER_TOKEN = 4  # for backends without a local tokenizer
+CHOICE_FIELD = "choice"  # of the JSON object of a constrained output
+
+
+# the backends' libraries are imported only when used, since torch and transformers take seconds
+# (and hundreds of MBs) to import, and an API player doesn't need them at all
+@cache
+def import_torch_and_transformers():
+    print("Trying to import torch...", get_current_timestamp())
+    import torch
+    print("Finished importing torch!", get_current_timestamp())
+    print("Trying to import from transformers...", get_current_timestamp())
+    import transformers
+    print("Finished importing from transformers!", get_current_timestamp())
+    return torch, transformers
+
+
+@cache
+def import_together():
+    import together
+    import together.error
+    return together
+
+
+def is_local_path(model_name):
+    return os.path.isdir(model_name)  # maybe should come up with better mechanism
+
+
+@cache
+def cached_model(model_name):
+    _, transformers = import_torch_and_transformers()
+    if is_local_path(model_name):
+        config = transformers.AutoConfig.from_pretrained(model_name)
+        return transformers.AutoModelForSeq2SeqLM.from_pretrained(model_name, config=config)
+    return transformers.AutoModelForCausalLM.from_pretrained(model_name, cache_dir=CACHE_DIR)
+
+
+@cache
+def cached_tokenizer(model_name):
+    _, transformers = import_torch_and_transformers()
+    return transformers.AutoTokenizer.from_pretrained(model_name, cache_dir=CACHE_DIR)
+
+
+@cache
+def cached_pipeline(model_name, task):  # TODO: maybe use device as parameter?
+    _, transformers = import_torch_and_transformers()
+    return transformers.pipeline(task, model_name, device_map="auto")
+
+
+def get_together_api_key():
+    key = os.environ.get(TOGETHER_API_KEY_KEYWORD)
+    if key:
+        return key
+    secrets_file = Path(SECRETS_DICT_FILE_PATH)
+    if secrets_file.exists():
+        try:
+            secrets = eval(secrets_file.read_text())
+        except (ValueError, NameError):
+            return None
+        return secrets.get(TOGETHER_API_KEY_KEYWORD)
+    else:  # TODO: REMOVE AFTER ADDING THE FILE!
+        print("\n\n\nMISSING SECRETS DICT FILE!!!!!\n\n\n")
+    return None
+
+
+@cache
+def get_cancellation_stopping_criteria_class():  # defined lazily, since its base is in transformers
+    _, transformers = import_torch_and_transformers()
+
+    class CancellationStoppingCriteria(transformers.StoppingCriteria):
+        """Stops a local generation in the middle (after the current token) once it was cancelled"""
+
+        def __init__(self, cancel_event):
+            self.cancel_event = cancel_event
+
+        def __call__(self, input_ids, scores, **kwargs):
+            return self.cancel_event.is_set()
+
+    return CancellationStoppingCriteria
+
+
+def get_cancellation_stopping_criteria(cancel_event):
+    _, transformers = import_torch_and_transformers()
+    return transformers.StoppingCriteriaList(
+        [get_cancellation_stopping_criteria_class()(cancel_event)])
+
+
+class LLMBackend(ABC):
+    """
+    Generates for an LLMWrapper (`llm`), using its prompt templates, logger and cancel event.
+    Each backend only has to implement `generate`, the batched and async versions are built on it.
+    """
+
+    NAME = None
+    CAN_SCORE = False  # whether `score_continuations` is implemented
+    CAN_CHOOSE = False  # whether `choose` is (by scoring, or by constraining the output)
+
+    def __init__(self, llm, llm_config):
+        self.llm = llm
+
+    @abstractmethod
+    def generate(self, input_text, system_info, generation_parameters, prompt_kind=None):
+        """Returns the output, the number of prompt tokens and the number of completion tokens"""
+        raise NotImplementedError()
+
+    def generate_batch(self, requests):
+        """
+        `requests` are tuples of `generate`'s arguments, returns a list of `generate`'s results.
+        Generates one request after the other, unless the backend can do better.
+        """
+        return [self.generate(*request) for request in requests]
+
+    async def generate_async(self, input_text, system_info, generation_parameters,
+                             prompt_kind=None):
+        return await asyncio.to_thread(self.generate, input_text, system_info,
+                                       generation_parameters, prompt_kind)
+
+    def score_continuations(self, input_text, system_info, continuations, prompt_kind=None):
+        """
+        Returns the log-probability of each of the `continuations` as the model's output (without
+        generating it) and the number of prompt tokens. Only for backends with CAN_SCORE.
+        """
+        raise NotImplementedError()
+
+    def choose(self, input_text, system_info, choices, generation_parameters, prompt_kind=None):
+        """
+        Returns the one of the `choices` the model prefers as its output, the number of prompt
+        tokens and the number of completion tokens. Only for backends with CAN_CHOOSE.
+        """
+        log_probs, num_prompt_tokens = self.score_continuations(input_text, system_info, choices,
+                                                                prompt_kind)
+        if not log_probs:
+            return "", num_prompt_tokens, 0
+        return max(zip(log_probs, choices))[1], num_prompt_tokens, 0
+
+    def count_tokens(self, text):
+        """Estimated, unless the backend has the model's tokenizer"""
+        return -(-len(text) // ESTIMATED_CHARS_PER_TOKEN)  # rounded up
+
+
+class TogetherBackend(LLMBackend):
+
+    NAME = TOGETHER_BACKEND
+    CAN_CHOOSE = True  # by a JSON schema
+
+    def __init__(self, llm, llm_config):
+        super().__init__(llm, llm_config)
+        self.api_key = get_together_api_key()
+        self.base_url = llm_config.get(API_BASE_URL_KEY)
+        self.create_client(timeout=None)  # fails right away if there is no API key
+        self.retry_policy = RetryPolicy(
+            llm_config.get(API_MAX_ATTEMPTS_KEY, DEFAULT_API_MAX_ATTEMPTS),
+            llm_config.get(API_INITIAL_BACKOFF_KEY, DEFAULT_API_INITIAL_BACKOFF),
+            llm_config.get(API_MAX_BACKOFF_KEY, DEFAULT_API_MAX_BACKOFF),
+            CircuitBreaker(
+                llm_config.get(CIRCUIT_BREAKER_THRESHOLD_KEY, DEFAULT_CIRCUIT_BREAKER_THRESHOLD),
+                llm_config.get(CIRCUIT_BREAKER_RESET_TIME_KEY, DEFAULT_CIRCUIT_BREAKER_RESET_TIME)),
+            llm_config.get(API_REQUEST_TIMEOUT_KEY, DEFAULT_API_REQUEST_TIMEOUT))
+        self.fallback_model_name = llm_config.get(FALLBACK_MODEL_NAME_KEY)
+
+    def generate(self, input_text, system_info, generation_parameters, prompt_kind=None):
+        messages = self.llm.pipeline_preprocessing(input_text, system_info)
+        self.llm.logger.log("messages in generate with together", messages, DEBUG)
+        final_output, num_prompt_tokens, num_completion_tokens = \
+            self.generate_safely(messages, generation_parameters)  # max_new_tokens -> max_tokens
+        self.llm.logger.log("final_output in generate with together", final_output)
+        return final_output, num_prompt_tokens, num_completion_tokens
+
+    def choose(self, input_text, system_info, choices, generation_parameters, prompt_kind=None):
+        messages = self.llm.pipeline_preprocessing(input_text, system_info)
+        self.llm.logger.log("messages in choose with together", messages, DEBUG)
+        # the output is constrained to a JSON object with one of the choices
+        response_format = {"type": "json_object", "schema": {
+            "type": "object", "properties": {CHOICE_FIELD: {"type": "string", "enum": choices}},
+            "required": [CHOICE_FIELD]}}
+        output, num_prompt_tokens, num_completion_tokens = self.generate_safely(
+            messages, {**generation_parameters, "response_format": response_format})
+        self.llm.logger.log("output in choose with together", output)
+        try:
+            choice = json.loads(output)[CHOICE_FIELD]
+        except (ValueError, KeyError, TypeError):
+            choice = output  # the model doesn't support it, hopefully the choice is in the output
+        return choice, num_prompt_tokens, num_completion_tokens
+
+    def generate_safely(self, messages, generation_parameters):
+        """
+        Retries by the retry policy, then tries the fallback model once, and if it fails too the
+        output is empty, which is a cheap decision to pass the turn
+        """
+        errors = import_together().error.TogetherException
+        num_failed_attempts = self.retry_policy.metrics["failed_attempts"]
+        response = self.retry_policy.call(
+            lambda timeout: self.send_request(self.llm.model_name, messages,
+                                              generation_parameters, timeout),
+            errors, self.llm.cancel_event, self.llm.deadline, self.log_error)
+        if response is None and self.fallback_model_name and not self.llm.cancel_event.is_set() \
+                and (self.llm.deadline is None or time.monotonic() < self.llm.deadline):
+            self.retry_policy.metrics["fallbacks"] += 1
+            try:
+                response = self.send_request(
+                    self.fallback_model_name, messages, generation_parameters,
+                    self.retry_policy.get_attempt_timeout(self.llm.deadline))
+            except errors as e:
+                self.log_error(e)
+        if self.retry_policy.metrics["failed_attempts"] > num_failed_attempts:
+            self.llm.logger.log("API retry metrics", dict(self.retry_policy.metrics),
+                                circuit_breaker_state=self.retry_policy.circuit_breaker.state)
+        if response is None:
+            return "", 0, 0
+        output = response.choices[0].message.content
+        if response.usage is None:
+            return output or "", 0, 0
+        return output or "", response.usage.prompt_tokens, response.usage.completion_tokens
+
+    def send_request(self, model_name, messages, generation_parameters, timeout):
+        # the timeout is set per client, which only holds the settings, so every attempt gets its
+        # own client with the time it has left until the deadline
+        return self.create_client(timeout).chat.completions.create(
+            model=model_name, messages=messages, **generation_parameters)
+
+    def create_client(self, timeout):
+        return import_together().Together(api_key=self.api_key, base_url=self.base_url,
+                                          timeout=timeout, max_retries=0)  # see retry_policy
+
+    def log_error(self, error):
+        """Returns the seconds the API asked to wait before retrying (when rate-limited), or None"""
+        self.llm.logger.log("error generating with TogetherAI", str(error), WARNING)
+        return get_retry_after(getattr(error, "headers", None))
+
+
+class InferenceServerBackend(LLMBackend):
+    """The model is loaded only once, by llm_inference_server.py"""
+
+    NAME = INFERENCE_SERVER_BACKEND
+
+    def __init__(self, llm, llm_config):
+        super().__init__(llm, llm_config)
+        self.client = InferenceServerClient(
+            llm_config.get(INFERENCE_SERVER_PORT_KEY, DEFAULT_INFERENCE_SERVER_PORT))
+
+    def generate(self, input_text, system_info, generation_parameters, prompt_kind=None):
+        prompt = self.llm.direct_preprocessing(input_text, system_info)
+        self.llm.logger.log("prompt in generate with inference server", prompt, DEBUG)
+        decoded_output, num_prompt_tokens, num_completion_tokens = \
+            self.client.generate(self.llm.model_name, prompt, generation_parameters)
+        self.llm.logger.log("decoded_output in generate with inference server",
+                            decoded_output, DEBUG)
+        return self.llm.direct_postprocessing(decoded_output), num_prompt_tokens, \
+            num_completion_tokens
+
+    def generate_batch(self, requests):
+        # every thread has its own connection, so the server batches the requests together
+        with ThreadPoolExecutor(max_workers=max(len(requests), 1)) as executor:
+            return list(executor.map(lambda request: self.generate(*request), requests))
+
+
+class PipelineBackend(LLMBackend):
+
+    NAME = PIPELINE_BACKEND
+
+    def __init__(self, llm, llm_config):
+        super().__init__(llm, llm_config)
+        self.pipeline_task = llm_config[PIPELINE_TASK_KEY]
+        self.pipeline = cached_pipeline(self.llm.model_name, self.pipeline_task)
+
+    def generate(self, input_text, system_info, generation_parameters, prompt_kind=None):
+        torch, _ = import_torch_and_transformers()
+        messages = self.llm.pipeline_preprocessing(input_text, system_info)
+        self.llm.logger.log("messages in generate with pipeline", messages, DEBUG)
+        with torch.inference_mode():
+            outputs = self.pipeline(
+                messages,
+                stopping_criteria=get_cancellation_stopping_criteria(self.llm.cancel_event),
+                **generation_parameters)
+        self.llm.logger.log("outputs in generate with pipeline", outputs, DEBUG)
+        final_output = outputs[0][TASK2OUTPUT_FORMAT[self.pipeline_task]][-1]
+        num_prompt_tokens = len(self.pipeline.tokenizer.apply_chat_template(messages))
+        num_completion_tokens = len(self.pipeline.tokenizer.encode(str(final_output),
+                                                                   add_special_tokens=False))
+        return final_output, num_prompt_tokens, num_completion_tokens
+
+    def count_tokens(self, text):
+        return len(self.pipeline.tokenizer.encode(text, add_special_tokens=False))
+
+
+class DirectBackend(LLMBackend):
+    """Prompts of the same kind reuse the KV cache of their shared prefix"""
+
+    NAME = DIRECT_BACKEND
+    CAN_SCORE = True
+    CAN_CHOOSE = True
+
+    def __init__(self, llm, llm_config):
+        super().__init__(llm, llm_config)
+        torch, _ = import_torch_and_transformers()
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.tokenizer = cached_tokenizer(self.llm.model_name)
+        self.model = cached_model(self.llm.model_name)
+        self.model.to(self.device)
+        self.model.eval()
+        self.prefix_cache = None if self.model.config.is_encoder_decoder else PrefixCache()
+
+    def generate(self, input_text, system_info, generation_parameters, prompt_kind=None):
+        torch, transformers = import_torch_and_transformers()
+        prompt = self.llm.direct_preprocessing(input_text, system_info)
+        self.llm.logger.log("prompt in generate directly", prompt, DEBUG)
+        inputs = self.tokenizer(prompt, return_tensors="pt")
+        inputs = {key: value.to(self.device) for key, value in inputs.items()}
+        prompt_token_ids = inputs["input_ids"][0].tolist()
+        # beam search reorders the KV cache by beams, so it can't be reused after it
+        use_prefix_cache = self.prefix_cache is not None and prompt_kind is not None \
+            and NUM_BEAMS_KEY not in generation_parameters
+        if use_prefix_cache:
+            kv_cache, num_cached_tokens = self.prefix_cache.take(prompt_kind, prompt_token_ids)
+            self.llm.logger.log("cached prompt tokens in generate directly", prompt_kind,
+                                num_cached_tokens=num_cached_tokens,
+                                num_prompt_tokens=len(prompt_token_ids))
+            inputs["past_key_values"] = kv_cache if kv_cache is not None \
+                else transformers.DynamicCache()
+        with torch.inference_mode():
+            outputs = self.model.generate(
+                **inputs,
+                stopping_criteria=get_cancellation_stopping_criteria(self.llm.cancel_event),
+                return_dict_in_generate=True, **generation_parameters)
+        if use_prefix_cache:
+            self.prefix_cache.put(prompt_kind, prompt_token_ids, outputs.past_key_values)
+        decoded_output = self.tokenizer.decode(outputs.sequences[0])
+        self.llm.logger.log("decoded_output in generate directly", decoded_output, DEBUG)
+        num_prompt_tokens = len(prompt_token_ids)
+        num_completion_tokens = outputs.sequences.shape[1] - num_prompt_tokens
+        return self.llm.direct_postprocessing(decoded_output), num_prompt_tokens, \
+            num_completion_tokens
+
+    def score_continuations(self, input_text, system_info, continuations, prompt_kind=None):
+        torch, _ = import_torch_and_transformers()
+        prompt = self.llm.direct_preprocessing(input_text, system_info)
+        self.llm.logger.log("prompt in score directly", prompt, DEBUG)
+        inputs = self.tokenizer(prompt, return_tensors="pt")
+        inputs = {key: value.to(self.device) for key, value in inputs.items()}
+        continuations_token_ids = [self.tokenizer.encode(continuation, add_special_tokens=False)
+                                   for continuation in continuations]
+        with torch.inference_mode():
+            if self.model.config.is_encoder_decoder:
+                log_probs = [self.score_as_labels(inputs, token_ids)
+                             for token_ids in continuations_token_ids]
+            else:
+                log_probs = self.score_after_prompt(inputs["input_ids"][0].tolist(),
+                                                    continuations_token_ids, prompt_kind)
+        self.llm.logger.log("log_probs in score directly", log_probs, DEBUG,
+                            continuations=continuations)
+        return log_probs, inputs["input_ids"].shape[1]
+
+    def score_after_prompt(self, prompt_token_ids, continuations_token_ids, prompt_kind):
+        """
+        The prompt is encoded once (after its prefix in the cache): the logits of its last token
+        score the continuations' first tokens, and the rest of their tokens are encoded together
+        in one batch, each continuation on its own copy of the prompt's KV cache.
+        """
+        torch, transformers = import_torch_and_transformers()
+        use_prefix_cache = self.prefix_cache is not None and prompt_kind is not None
+        kv_cache, num_cached_tokens = self.prefix_cache.take(prompt_kind, prompt_token_ids) \
+            if use_prefix_cache else (None, 0)
+        if kv_cache is None:
+            kv_cache = transformers.DynamicCache()
+        outputs = self.model(
+            input_ids=torch.tensor([prompt_token_ids[num_cached_tokens:]], device=self.device),
+            past_key_values=kv_cache, use_cache=True)
+        kv_cache = outputs.past_key_values
+        first_token_log_probs = torch.log_softmax(outputs.logits[0, -1].float(), dim=-1)
+        log_probs = [first_token_log_probs[token_ids[0]].item()
+                     for token_ids in continuations_token_ids]
+        max_length = max(map(len, continuations_token_ids))
+        if max_length > 1:
+            # padded at the end, so the continuations' tokens don't attend to the padding
+            padding_token_id = self.tokenizer.pad_token_id or 0
+            batch_token_ids = [token_ids[:-1] + [padding_token_id] * (max_length - len(token_ids))
+                               for token_ids in continuations_token_ids]
+            kv_cache.batch_repeat_interleave(len(continuations_token_ids))
+            outputs = self.model(input_ids=torch.tensor(batch_token_ids, device=self.device),
+                                 past_key_values=kv_cache, use_cache=True)
+            tokens_log_probs = torch.log_softmax(outputs.logits.float(), dim=-1)
+            for i, token_ids in enumerate(continuations_token_ids):
+                log_probs[i] += tokens_log_probs[i, torch.arange(len(token_ids) - 1),
+                                                 torch.tensor(token_ids[1:])].sum().item()
+            kv_cache.batch_select_indices(torch.tensor([0], device=self.device))
+        if use_prefix_cache:
+            self.prefix_cache.put(prompt_kind, prompt_token_ids, kv_cache)  # crops the additions
+        return log_probs
+
+    def score_as_labels(self, inputs, token_ids):
+        torch, _ = import_torch_and_transformers()
+        labels = torch.tensor([token_ids], device=self.device)
+        # the loss is the mean negative log-probability of the labels' tokens
+        return -self.model(**inputs, labels=labels).loss.item() * len(token_ids)
+
+    def count_tokens(self, text):
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+
+class MockBackend(LLMBackend):
+    """
+    Doesn't use a model at all, for running games and benchmarks offline: answers every prompt
+    kind with a valid output after `mock_latency` seconds. The outputs of each prompt kind are a
+    deterministic sequence, decided by `mock_seed`, and tokens are counted as words.
+    """
+
+    NAME = MOCK_BACKEND
+    CAN_SCORE = True
+    CAN_CHOOSE = True
+
+    def __init__(self, llm, llm_config):
+        super().__init__(llm, llm_config)
+        self.latency = llm_config.get(MOCK_LATENCY_KEY, DEFAULT_MOCK_LATENCY)
+        self.seed = llm_config.get(MOCK_SEED_KEY, DEFAULT_MOCK_SEED)
+        self.pass_turn_token = llm_config[PASS_TURN_TOKEN_KEY]
+        self.use_turn_token = llm_config[USE_TURN_TOKEN_KEY]
+        self.randoms = {}  # prompt kind -> its own Random, so kinds don't affect each other
+        self.randoms_lock = Lock()
+
+    def get_random(self, prompt_kind):
+        with self.randoms_lock:
+            if prompt_kind not in self.randoms:
+                self.randoms[prompt_kind] = random.Random(f"{self.seed}:{prompt_kind}")
+            return self.randoms[prompt_kind]
+
+    def generate(self, input_text, system_info, generation_parameters, prompt_kind=None):
+        num_prompt_tokens = len(system_info.split()) + len(input_text.split())
+        if self.llm.cancel_event.wait(self.latency):
+            return "", num_prompt_tokens, 0
+        rng = self.get_random(prompt_kind)
+        if prompt_kind == SCHEDULING_PROMPT_KIND:
+            output = self.use_turn_token if rng.random() < MOCK_USE_TURN_PROBABILITY \
+                else self.pass_turn_token
+        elif prompt_kind == VOTE_PROMPT_KIND:
+            matcher = re.search(MOCK_VOTE_CANDIDATES_PATTERN, input_text)
+            output = rng.choice(matcher.group(1).strip().split(", ")) if matcher else ""
+        else:
+            output = rng.choice(MOCK_MESSAGES)
+        return output, num_prompt_tokens, len(output.split())
+
+    def score_continuations(self, input_text, system_info, continuations, prompt_kind=None):
+        num_prompt_tokens = len(system_info.split()) + len(input_text.split())
+        if self.llm.cancel_event.wait(self.latency):
+            return None, num_prompt_tokens
+        rng = self.get_random(prompt_kind)
+        if prompt_kind != SCHEDULING_PROMPT_KIND:
+            return [math.log(rng.uniform(MOCK_MIN_PROBABILITY, 1)) for _ in continuations], \
+                num_prompt_tokens
+        # the use turn token gets a random probability around MOCK_USE_TURN_PROBABILITY
+        use_turn_probability = rng.uniform(MOCK_MIN_PROBABILITY, 2 * MOCK_USE_TURN_PROBABILITY)
+        probabilities = {self.use_turn_token: use_turn_probability,
+                         self.pass_turn_token: 1 - use_turn_probability}
+        return [math.log(probabilities.get(continuation, MOCK_MIN_PROBABILITY))
+                for continuation in continuations], num_prompt_tokens
+
+    def count_tokens(self, text):
+        return len(text.split())
+
+
+llm_backends_classes = {
+    TogetherBackend.NAME: TogetherBackend,
+    InferenceServerBackend.NAME: InferenceServerBackend,
+    PipelineBackend.NAME: PipelineBackend,
+    DirectBackend.NAME: DirectBackend,
+    MockBackend.NAME: MockBackend,
+}
+
+
+def register_llm_backend(backend_class):
+    """Makes a new backend available by its NAME in `backend` of the LLM config"""
+    llm_backends_classes[backend_class.NAME] = backend_class
+    return backend_class
+
+
+def get_backend_name(llm_config):
+    if llm_config.get(BACKEND_KEY):
+        return llm_config[BACKEND_KEY]
+    # older configs choose the backend by flags
+    if llm_config.get(USE_TOGETHER_KEY):
+        return TOGETHER_BACKEND
+    elif llm_config.get(USE_INFERENCE_SERVER_KEY):
+        return INFERENCE_SERVER_BACKEND
+    elif llm_config.get(USE_PIPELINE_KEY):
+        return PIPELINE_BACKEND
+    else:
+        return DIRECT_BACKEND
+
+
+def llm_backend_factory(llm, llm_config):
+    backend_class = llm_backends_classes[get_backend_name(llm_config)]
+    return backend_class(llm, llm_config)
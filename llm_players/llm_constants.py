@@ -1,4 +1,6 @@
 from game_constants import get_current_timestamp, RULES_OF_THE_GAME, strip_special_chars
+from message_records import join_lines
+from llm_players.logger import LOG_LEVELS, DEFAULT_LOG_LEVEL
 
 MODEL_NAMES = [
     "meta-llama/Llama-3.3-70B-Instruct-Turbo-Free",
@@ -33,6 +35,11 @@ GENERAL_SYSTEM_INFO = f"You are a bot player in an online version of the party g
                       f"\nThe rules of the game: {RULES_OF_THE_GAME}"
 # I removed the following because it didn't choose to wait: "You have a very outgoing personality"
 
+# prompt kinds, each one has its own prefix cache (when generating directly with a local model):
+SCHEDULING_PROMPT_KIND = "scheduling"
+GENERATION_PROMPT_KIND = "generation"
+VOTE_PROMPT_KIND = "vote"
+
 # LLM players type names:
 SCHEDULE_THEN_GENERATE_TYPE = "schedule_then_generate"
 GENERATE_THEN_SCHEDULE_TYPE = "generate_then_schedule"
@@ -42,10 +49,18 @@ ASYNC_TYPES = [SCHEDULE_THEN_GENERATE_TYPE, GENERATE_THEN_SCHEDULE_TYPE,
                FINE_TUNED_TYPE, EVERY_X_MESSAGES_TYPE]
 DEFAULT_ASYNC_TYPE = ASYNC_TYPES[0]
 
+# LLM backends names (llm_backends.py):
+TOGETHER_BACKEND = "together"
+PIPELINE_BACKEND = "pipeline"
+DIRECT_BACKEND = "direct"
+INFERENCE_SERVER_BACKEND = "inference_server"
+MOCK_BACKEND = "mock"  # no model at all, for offline games and benchmarks
+BACKENDS = [TOGETHER_BACKEND, PIPELINE_BACKEND, DIRECT_BACKEND, INFERENCE_SERVER_BACKEND,
+            MOCK_BACKEND]
+
 # API keys and secrets
 SECRETS_DICT_FILE_PATH = ".secrets_dict.txt"
 TOGETHER_API_KEY_KEYWORD = "TOGETHER_API_KEY"
-SLEEPING_TIME_FOR_API_GENERATION_ERROR = 3
 
 # config keys:
 LLM_CONFIG_KEY = "llm_config"  # should match the key in PlayerConfig dataclass
@@ -54,10 +69,53 @@ MODEL_NAME_KEY = "model_name"
 USE_TOGETHER_KEY = "use_together"
 USE_PIPELINE_KEY = "use_pipeline"
 PIPELINE_TASK_KEY = "pipeline_task"
-WORDS_PER_SECOND_WAITING_KEY = "num_words_per_second_to_wait"
+WORDS_PER_SECOND_WAITING_KEY = "num_words_per_second_to_wait"  # the median typing speed
+TYPING_SPEED_SIGMA_KEY = "typing_speed_sigma"  # of its log-normal distribution (0 - always median)
 PASS_TURN_TOKEN_KEY = "pass_turn_token"
 USE_TURN_TOKEN_KEY = "use_turn_token"
 ASYNC_TYPE_KEY = "async_type"
+# restarting a background generation when its context is outdated by this many new messages:
+NEW_MESSAGES_TO_RESTART_GENERATION_KEY = "num_new_messages_to_restart_generation"
+# generating the message concurrently with the scheduling decision (discarded if decided to wait):
+SPECULATIVE_GENERATION_KEY = "speculative_generation"
+# generating with a running llm_inference_server.py (shared by all players) instead of a local model
+USE_INFERENCE_SERVER_KEY = "use_inference_server"
+INFERENCE_SERVER_PORT_KEY = "inference_server_port"
+LOG_LEVEL_KEY = "log_level"  # "info" leaves the full prompts out of the LLM log
+MAX_LOG_FILE_SIZE_KEY = "max_log_file_size"  # in bytes, bigger LLM logs are gzipped (0 - never)
+# one of BACKENDS, overrides the use_together/use_inference_server/use_pipeline flags if given:
+BACKEND_KEY = "backend"
+MOCK_LATENCY_KEY = "mock_latency"  # seconds for every generation of the mock backend
+MOCK_SEED_KEY = "mock_seed"
+# the message history in prompts is kept under this many tokens, by summarizing earlier phases:
+HISTORY_TOKEN_BUDGET_KEY = "history_token_budget"
+# retrying failed API generations (see retry_policy.py):
+API_BASE_URL_KEY = "api_base_url"  # instead of the provider's, like a local server for testing
+API_REQUEST_TIMEOUT_KEY = "api_request_timeout"  # seconds
+API_MAX_ATTEMPTS_KEY = "api_max_attempts"  # 0 - until the phase ends
+API_INITIAL_BACKOFF_KEY = "api_initial_backoff"  # seconds, doubled after every failed attempt
+API_MAX_BACKOFF_KEY = "api_max_backoff"
+CIRCUIT_BREAKER_THRESHOLD_KEY = "circuit_breaker_threshold"  # consecutive failures (0 - never)
+CIRCUIT_BREAKER_RESET_TIME_KEY = "circuit_breaker_reset_time"  # seconds
+FALLBACK_MODEL_NAME_KEY = "fallback_model_name"  # tried once when the model's requests fail
+# when the player is asked whether to send a message (see invocation_policy.py), trigger -> its
+# settings (overriding DEFAULT_INVOCATION_TRIGGERS' settings), or None to disable the trigger:
+INVOCATION_TRIGGERS_KEY = "invocation_triggers"
+# the scheduling decision by the probabilities of the two tokens, from a forward pass without
+# generating (only for backends that can score, like a local model - the others generate it):
+SCHEDULING_BY_SCORING_KEY = "scheduling_by_scoring"
+SCHEDULING_THRESHOLD_KEY = "scheduling_threshold"  # the lowest probability to use the turn with
+SCHEDULING_SAMPLING_KEY = "scheduling_sampling"  # use the turn with its probability, not threshold
+SCHEDULING_TEMPERATURE_KEY = "scheduling_temperature"  # calibrates the model's probabilities
+# the vote is always one of the candidates: the most likely name by a forward pass (local models),
+# or an output constrained to the names (APIs) - the other backends generate it freely:
+CONSTRAINED_VOTE_KEY = "constrained_vote"
+# the vote is computed in the background in the last seconds of the phase, and refreshed with new
+# messages, so it's ready when the voting starts:
+SPECULATIVE_VOTE_KEY = "speculative_vote"
+SPECULATIVE_VOTE_WINDOW_KEY = "speculative_vote_window"  # seconds before the phase ends
+SPECULATIVE_VOTE_INTERVAL_KEY = "speculative_vote_interval"  # min seconds between refreshes
+VOTING_WAITING_TIME_KEY = "voting_waiting_time"  # median seconds from the voting's start to vote
 # generation hyper parameters:
 MAX_NEW_TOKENS_KEY = "max_new_tokens"
 NUM_BEAMS_KEY = "num_beams"
@@ -72,10 +130,19 @@ TOGETHER_GENERATION_PARAMETERS = [MAX_TOKENS_KEY, REPETITION_PENALTY_KEY]
 # GENERATION_PARAMETERS = HUGGINGFACE_GENERATION_PARAMETERS
 GENERATION_PARAMETERS = TOGETHER_GENERATION_PARAMETERS
 
-INT_CONFIG_KEYS = [MAX_NEW_TOKENS_KEY, MAX_TOKENS_KEY, NUM_BEAMS_KEY, WORDS_PER_SECOND_WAITING_KEY,
-                   NO_REPEAT_NGRAM_KEY]
-FLOAT_CONFIG_KEYS = [REPETITION_PENALTY_KEY, TEMPERATURE_KEY]
-BOOL_CONFIG_KEYS = [USE_TOGETHER_KEY, USE_PIPELINE_KEY, DO_SAMPLE_KEY]
+INT_CONFIG_KEYS = [MAX_NEW_TOKENS_KEY, MAX_TOKENS_KEY, NUM_BEAMS_KEY, NO_REPEAT_NGRAM_KEY,
+                   NEW_MESSAGES_TO_RESTART_GENERATION_KEY, INFERENCE_SERVER_PORT_KEY,
+                   MAX_LOG_FILE_SIZE_KEY, MOCK_SEED_KEY,
+                   HISTORY_TOKEN_BUDGET_KEY, API_MAX_ATTEMPTS_KEY, CIRCUIT_BREAKER_THRESHOLD_KEY]
+FLOAT_CONFIG_KEYS = [REPETITION_PENALTY_KEY, TEMPERATURE_KEY, MOCK_LATENCY_KEY,
+                     API_REQUEST_TIMEOUT_KEY, API_INITIAL_BACKOFF_KEY, API_MAX_BACKOFF_KEY,
+                     CIRCUIT_BREAKER_RESET_TIME_KEY, SCHEDULING_THRESHOLD_KEY,
+                     SCHEDULING_TEMPERATURE_KEY, SPECULATIVE_VOTE_WINDOW_KEY,
+                     SPECULATIVE_VOTE_INTERVAL_KEY, VOTING_WAITING_TIME_KEY,
+                     WORDS_PER_SECOND_WAITING_KEY, TYPING_SPEED_SIGMA_KEY]
+BOOL_CONFIG_KEYS = [USE_TOGETHER_KEY, USE_PIPELINE_KEY, DO_SAMPLE_KEY, SPECULATIVE_GENERATION_KEY,
+                    USE_INFERENCE_SERVER_KEY, SCHEDULING_BY_SCORING_KEY, SCHEDULING_SAMPLING_KEY,
+                    CONSTRAINED_VOTE_KEY, SPECULATIVE_VOTE_KEY]
 
 # default values
 DEFAULT_MAX_NEW_TOKENS = 25
@@ -86,14 +153,65 @@ DEFAULT_TEMPERATURE = 1.3
 DEFAULT_NO_REPEAT_NGRAM = 8
 
 DEFAULT_NUM_WORDS_PER_SECOND_TO_WAIT = 1  # simulates number of words written normally per second
+DEFAULT_TYPING_SPEED_SIGMA = 0.4  # analyze.fit_typing_speed() fits both from the human players
+DEFAULT_NUM_NEW_MESSAGES_TO_RESTART_GENERATION = 3
+DEFAULT_SPECULATIVE_GENERATION = False  # lower latency, but more tokens
+DEFAULT_MAX_LOG_FILE_SIZE = 0
+DEFAULT_MOCK_LATENCY = 0
+DEFAULT_MOCK_SEED = 0
+DEFAULT_HISTORY_TOKEN_BUDGET = 0  # unlimited - the whole history, verbatim
+DEFAULT_API_REQUEST_TIMEOUT = 20
+DEFAULT_API_MAX_ATTEMPTS = 5
+DEFAULT_API_INITIAL_BACKOFF = 1
+DEFAULT_API_MAX_BACKOFF = 20
+DEFAULT_CIRCUIT_BREAKER_THRESHOLD = 5
+DEFAULT_CIRCUIT_BREAKER_RESET_TIME = 30
+DEFAULT_SCHEDULING_BY_SCORING = False
+DEFAULT_SCHEDULING_THRESHOLD = 0.5
+DEFAULT_SCHEDULING_SAMPLING = False
+DEFAULT_SCHEDULING_TEMPERATURE = 1  # >1 flattens the probabilities, <1 sharpens them
+DEFAULT_CONSTRAINED_VOTE = False
+DEFAULT_SPECULATIVE_VOTE = False  # the vote is ready when the voting starts, but takes more tokens
+DEFAULT_SPECULATIVE_VOTE_WINDOW = 30
+DEFAULT_SPECULATIVE_VOTE_INTERVAL = 5
+
+# invocation triggers, by their priority (when a few fire together, the first is the reported one)
+PHASE_CHANGE_TRIGGER = "phase_change"
+MENTION_TRIGGER = "mention"  # the player's name in a new message of another player
+PHASE_ENDING_TRIGGER = "phase_ending"  # once per phase
+NEW_MESSAGES_TRIGGER = "new_messages"  # of other players
+SILENCE_TRIGGER = "silence"
+INVOCATION_TRIGGERS = [PHASE_CHANGE_TRIGGER, MENTION_TRIGGER, PHASE_ENDING_TRIGGER,
+                       NEW_MESSAGES_TRIGGER, SILENCE_TRIGGER]
+# triggers settings (all in seconds):
+DEBOUNCE_KEY = "debounce"  # fires only after it was pending this long (since the last new message)
+MIN_INTERVAL_KEY = "min_interval"  # since it last fired
+THRESHOLD_KEY = "threshold"  # of silence, or of the time left until the phase ends
+DEFAULT_INVOCATION_TRIGGERS = {
+    PHASE_CHANGE_TRIGGER: {DEBOUNCE_KEY: 0, MIN_INTERVAL_KEY: 0},
+    MENTION_TRIGGER: {DEBOUNCE_KEY: 0, MIN_INTERVAL_KEY: 1},
+    PHASE_ENDING_TRIGGER: {DEBOUNCE_KEY: 0, MIN_INTERVAL_KEY: 0, THRESHOLD_KEY: 10},
+    NEW_MESSAGES_TRIGGER: {DEBOUNCE_KEY: 0.5, MIN_INTERVAL_KEY: 1},
+    SILENCE_TRIGGER: {DEBOUNCE_KEY: 0, MIN_INTERVAL_KEY: 15, THRESHOLD_KEY: 15},
+}
+
+# local inference server (llm_inference_server.py)
+DEFAULT_INFERENCE_SERVER_PORT = 6543
+DEFAULT_MAX_BATCH_SIZE = 8
+DEFAULT_MAX_BATCH_WAITING_TIME = 0.05  # seconds
 
-VOTING_WAITING_TIME = 5  # seconds
+VOTING_WAITING_TIME = 5  # the default median, in seconds (see VOTING_WAITING_TIME_KEY)
+VOTING_WAITING_TIME_SIGMA = 0.35  # of its log-normal distribution, like the times humans take
+VOTING_WAITING_TIME_SPREAD = 2  # it's between the median divided by this and multiplied by it
 MAX_TIME_TO_WAIT = 10
+# how often the main loop checks on the background generation, if no file has changed (seconds)
+GENERATION_STATUS_CHECK_INTERVAL = 0.25
 
 DEFAULT_LLM_CONFIG = {
     MODEL_NAME_KEY: DEFAULT_MODEL_NAME,
     USE_TOGETHER_KEY: True,
     USE_PIPELINE_KEY: False,
+    USE_INFERENCE_SERVER_KEY: False,
     PIPELINE_TASK_KEY: TEXT_GENERATION_TASK,
     MAX_NEW_TOKENS_KEY: DEFAULT_MAX_NEW_TOKENS,
     MAX_TOKENS_KEY: DEFAULT_MAX_NEW_TOKENS,
@@ -103,6 +221,16 @@ DEFAULT_LLM_CONFIG = {
     TEMPERATURE_KEY: DEFAULT_TEMPERATURE,
     NO_REPEAT_NGRAM_KEY: DEFAULT_NO_REPEAT_NGRAM,
     WORDS_PER_SECOND_WAITING_KEY: DEFAULT_NUM_WORDS_PER_SECOND_TO_WAIT,
+    TYPING_SPEED_SIGMA_KEY: DEFAULT_TYPING_SPEED_SIGMA,
+    NEW_MESSAGES_TO_RESTART_GENERATION_KEY: DEFAULT_NUM_NEW_MESSAGES_TO_RESTART_GENERATION,
+    SPECULATIVE_GENERATION_KEY: DEFAULT_SPECULATIVE_GENERATION,
+    SCHEDULING_BY_SCORING_KEY: DEFAULT_SCHEDULING_BY_SCORING,
+    CONSTRAINED_VOTE_KEY: DEFAULT_CONSTRAINED_VOTE,
+    SPECULATIVE_VOTE_KEY: DEFAULT_SPECULATIVE_VOTE,
+    VOTING_WAITING_TIME_KEY: VOTING_WAITING_TIME,
+    LOG_LEVEL_KEY: DEFAULT_LOG_LEVEL,
+    MAX_LOG_FILE_SIZE_KEY: DEFAULT_MAX_LOG_FILE_SIZE,
+    HISTORY_TOKEN_BUDGET_KEY: DEFAULT_HISTORY_TOKEN_BUDGET,
     PASS_TURN_TOKEN_KEY: DEFAULT_PASS_TURN_TOKEN,
     USE_TURN_TOKEN_KEY: DEFAULT_USE_TURN_TOKEN,
     ASYNC_TYPE_KEY: DEFAULT_ASYNC_TYPE
@@ -113,7 +241,10 @@ LLM_CONFIG_KEYS_OPTIONS = {
     PIPELINE_TASK_KEY: [TEXT_GENERATION_TASK],
     PASS_TURN_TOKEN_KEY: PASS_TURN_TOKEN_OPTIONS,
     USE_TURN_TOKEN_KEY: USE_TURN_TOKEN_OPTIONS,
-    ASYNC_TYPE_KEY: ASYNC_TYPES
+    ASYNC_TYPE_KEY: ASYNC_TYPES,
+    LOG_LEVEL_KEY: list(LOG_LEVELS),
+    BACKEND_KEY: BACKENDS,
+    FALLBACK_MODEL_NAME_KEY: MODEL_NAMES
 }
 
 HUGGINGFACE_SCHEDULING_GENERATION_PARAMETERS = {
@@ -139,12 +270,13 @@ QUIETER_PROMPT = "Don't overflow the discussion with your messages! " \
 
 
 def turn_task_into_prompt(task, message_history):
-    prompt = f"The current time is [{get_current_timestamp()}].\n"
+    # the parts that change the least are first, so successive prompts share the longest prefix
     if not message_history:
-        prompt += "No player has sent a message yet.\n"
+        prompt = "No player has sent a message yet.\n"
     else:
-        prompt += "Here is the message history so far, including [timestamps]:\n"
-        prompt += "".join(message_history)  # each one already ends with "\n"
+        prompt = "Here is the message history so far, including [timestamps]:\n"
+        prompt += join_lines(message_history)
+    prompt += f"The current time is [{get_current_timestamp()}].\n"
     prompt += task.strip() + "\n"
     # not necessarily needed with all models, seemed relevant to Llama3.1:
     prompt += "Don't add the time, the timestamp or the [timestamp] in your answer!\n"
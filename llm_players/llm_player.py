@@ -1,11 +1,25 @@
-import re
+import time
 from abc import ABC, abstractmethod
 from game_constants import get_role_string, GAME_START_TIME_FILE, PERSONAL_CHAT_FILE_FORMAT, \
-    MESSAGE_PARSING_PATTERN, SCHEDULING_DECISION_LOG, MODEL_CHOSE_TO_USE_TURN_LOG, MODEL_CHOSE_TO_PASS_TURN_LOG
+    PLAYER_NAMES_FILE, SCHEDULING_DECISION_LOG, MODEL_CHOSE_TO_USE_TURN_LOG, \
+    MODEL_CHOSE_TO_PASS_TURN_LOG
+from game_status_checks import read_game_file
 from llm_players.llm_constants import turn_task_into_prompt, GENERAL_SYSTEM_INFO, \
-    PASS_TURN_TOKEN_KEY, USE_TURN_TOKEN_KEY, WORDS_PER_SECOND_WAITING_KEY, PASS_TURN_TOKEN_OPTIONS
+    PASS_TURN_TOKEN_KEY, USE_TURN_TOKEN_KEY, WORDS_PER_SECOND_WAITING_KEY, PASS_TURN_TOKEN_OPTIONS, \
+    NEW_MESSAGES_TO_RESTART_GENERATION_KEY, DEFAULT_NUM_NEW_MESSAGES_TO_RESTART_GENERATION, \
+    VOTE_PROMPT_KIND, LOG_LEVEL_KEY, MAX_LOG_FILE_SIZE_KEY, DEFAULT_MAX_LOG_FILE_SIZE, \
+    HISTORY_TOKEN_BUDGET_KEY, DEFAULT_HISTORY_TOKEN_BUDGET, INVOCATION_TRIGGERS_KEY, \
+    CONSTRAINED_VOTE_KEY, DEFAULT_CONSTRAINED_VOTE, SPECULATIVE_VOTE_KEY, \
+    DEFAULT_SPECULATIVE_VOTE, SPECULATIVE_VOTE_WINDOW_KEY, DEFAULT_SPECULATIVE_VOTE_WINDOW, \
+    SPECULATIVE_VOTE_INTERVAL_KEY, DEFAULT_SPECULATIVE_VOTE_INTERVAL, VOTING_WAITING_TIME_KEY, \
+    VOTING_WAITING_TIME, TYPING_SPEED_SIGMA_KEY, DEFAULT_TYPING_SPEED_SIGMA
 from llm_players.llm_wrapper import LLMWrapper
-from llm_players.logger import Logger
+from llm_players.logger import Logger, DEBUG, WARNING, DEFAULT_LOG_LEVEL
+from llm_players.timeline import Timeline
+from llm_players.prompt_history import PromptHistory
+from llm_players.phase_stats import PhaseStats
+from llm_players.invocation_policy import InvocationPolicy
+from message_records import MessageRecord, UNPARSED
 
 
 class LLMPlayer(ABC):
@@ -17,17 +31,88 @@ class LLMPlayer(ABC):
         self.is_mafia = is_mafia
         self.role = get_role_string(is_mafia)
         self.game_dir = game_dir
-        self.logger = Logger(name, game_dir)
+        self.logger = Logger(name, game_dir, llm_config.get(LOG_LEVEL_KEY, DEFAULT_LOG_LEVEL),
+                             llm_config.get(MAX_LOG_FILE_SIZE_KEY, DEFAULT_MAX_LOG_FILE_SIZE))
         self.pass_turn_token = llm_config[PASS_TURN_TOKEN_KEY]
         self.use_turn_token = llm_config[USE_TURN_TOKEN_KEY]
         self.num_words_per_second_to_wait = llm_config[WORDS_PER_SECOND_WAITING_KEY]
-        self.llm = LLMWrapper(self.logger, **llm_config)
+        self.typing_speed_sigma = llm_config.get(TYPING_SPEED_SIGMA_KEY, DEFAULT_TYPING_SPEED_SIGMA)
+        self.num_new_messages_to_restart_generation = llm_config.get(  # missing in older configs
+            NEW_MESSAGES_TO_RESTART_GENERATION_KEY, DEFAULT_NUM_NEW_MESSAGES_TO_RESTART_GENERATION)
+        self.speculative_vote = llm_config.get(SPECULATIVE_VOTE_KEY, DEFAULT_SPECULATIVE_VOTE)
+        self.speculative_vote_window = llm_config.get(SPECULATIVE_VOTE_WINDOW_KEY,
+                                                      DEFAULT_SPECULATIVE_VOTE_WINDOW)
+        self.speculative_vote_interval = llm_config.get(SPECULATIVE_VOTE_INTERVAL_KEY,
+                                                        DEFAULT_SPECULATIVE_VOTE_INTERVAL)
+        self.voting_waiting_time = llm_config.get(VOTING_WAITING_TIME_KEY, VOTING_WAITING_TIME)
+        self.timeline = Timeline(game_dir, name)
+        self.llm = LLMWrapper(self.logger, self.timeline, **llm_config)
+        self.constrained_vote = llm_config.get(CONSTRAINED_VOTE_KEY, DEFAULT_CONSTRAINED_VOTE)
+        if self.constrained_vote and not self.llm.can_choose():
+            self.logger.log("constrained vote", "The backend can't constrain the vote, so it will "
+                            "be generated freely instead", WARNING)
+            self.constrained_vote = False
+        player_names = read_game_file(game_dir, PLAYER_NAMES_FILE).splitlines()
+        self.phase_stats = PhaseStats(player_names)  # updated from the history when it's needed
+        self.invocation_policy = InvocationPolicy(name, self.phase_stats,
+                                                  llm_config.get(INVOCATION_TRIGGERS_KEY))
+        history_token_budget = llm_config.get(HISTORY_TOKEN_BUDGET_KEY,
+                                              DEFAULT_HISTORY_TOKEN_BUDGET)
+        self.prompt_history = PromptHistory(self.llm.count_tokens, history_token_budget,
+                                            player_names) \
+            if history_token_budget else None  # without a budget, the whole history is used
+        # the parts of the system info that don't change during the game are built only once:
+        self.system_info_header = f"Your name is {self.name}. {GENERAL_SYSTEM_INFO}\n" \
+                                  f"You were assigned the following role: {self.role}.\n"
+        self.special_tokens_info = \
+            f"You can ONLY respond with one of two possible outputs:\n" \
+            f"{self.pass_turn_token} - indicating your character in the game " \
+            f"should wait and not send a message in the current timing;\n" \
+            f"{self.use_turn_token} - indicating your character in the game should " \
+            f"send a message to the public chat now.\n\n" \
+            f"You must NEVER output any other text, explanations, or variations " \
+            f"of these tokens. Only these exact tokens are allowed: " \
+            f"{self.pass_turn_token} or {self.use_turn_token}.\n"
+        self.chat_room_open_time = ""  # until the game starts
+        self.previous_messages_info = ""  # grows with every message the player sends
+        # the file is read only once, it isn't empty only if the player was restarted mid-game:
+        for line in (game_dir / PERSONAL_CHAT_FILE_FORMAT.format(name)).read_text().splitlines():
+            self.add_previous_message(MessageRecord(line))
+
+    def get_phase_deadline(self, message_history):
+        """The time.monotonic() time the current phase's discussion ends, or None if it's unknown"""
+        seconds_until_phase_end = self.phase_stats.update(message_history).seconds_until_phase_end()
+        if seconds_until_phase_end is None:
+            return None
+        return time.monotonic() + seconds_until_phase_end
+
+    def is_vote_precomputation_time(self, message_history):
+        """Whether the vote should be computed already, in the last seconds of the phase"""
+        if not self.speculative_vote:
+            return False
+        seconds_until_phase_end = self.phase_stats.update(message_history).seconds_until_phase_end()
+        return seconds_until_phase_end is not None \
+            and 0 < seconds_until_phase_end <= self.speculative_vote_window
+
+    def get_prompt_history(self, message_history):
+        if self.prompt_history is None:
+            return message_history
+        return self.prompt_history.get_messages(message_history)
+
+    def add_previous_message(self, message):
+        """Called with the MessageRecord of every message the player sends"""
+        if message.kind != UNPARSED:
+            self.previous_messages_info += f"* \"{message.content}\"\n"
+
+    def get_chat_room_open_time(self):
+        if not self.chat_room_open_time:  # if the game has started, the file isn't empty
+            self.chat_room_open_time = read_game_file(self.game_dir, GAME_START_TIME_FILE).strip()
+        return self.chat_room_open_time
 
     def get_system_info_message(self, attention_to_not_repeat=False, only_special_tokens=False):
-        system_info = f"Your name is {self.name}. {GENERAL_SYSTEM_INFO}\n" \
-                      f"You were assigned the following role: {self.role}.\n"
-        chat_room_open_time = (self.game_dir / GAME_START_TIME_FILE).read_text().strip()
-        if chat_room_open_time:  # if the game has started, the file isn't empty
+        system_info = self.system_info_header
+        chat_room_open_time = self.get_chat_room_open_time()
+        if chat_room_open_time:
             system_info += f"The game's chat room was open at [{chat_room_open_time}].\n"
         if attention_to_not_repeat:
             # system_info += "Note: Do not repeat any messages already present in the message history below!\n"
@@ -42,26 +127,11 @@ class LLMPlayer(ABC):
                            "5. Focus on adding new information or reactions " \
                            "to the current situation.\n" \
                            "6. Don't start messages with common phrases you've used before.\n"
-            previous_messages = (self.game_dir / PERSONAL_CHAT_FILE_FORMAT.format(self.name)
-                                 ).read_text().splitlines()
-            if previous_messages:
+            if self.previous_messages_info:
                 system_info += "The following message are the previous messages that you've " \
-                               "sent and you should never repeat:\n"
-                for message in previous_messages:
-                    matcher = re.match(MESSAGE_PARSING_PATTERN, message)
-                    if not matcher:
-                        continue
-                    message_content = matcher.group(5)  # depends on MESSAGE_PARSING_PATTERN
-                    system_info += f"* \"{message_content}\"\n"
+                               "sent and you should never repeat:\n" + self.previous_messages_info
         if only_special_tokens:
-            system_info += f"You can ONLY respond with one of two possible outputs:\n" \
-                           f"{self.pass_turn_token} - indicating your character in the game " \
-                           f"should wait and not send a message in the current timing;\n" \
-                           f"{self.use_turn_token} - indicating your character in the game should " \
-                           f"send a message to the public chat now.\n\n" \
-                           f"You must NEVER output any other text, explanations, or variations " \
-                           f"of these tokens. Only these exact tokens are allowed: " \
-                           f"{self.pass_turn_token} or {self.use_turn_token}.\n"
+            system_info += self.special_tokens_info
         return system_info
 
     @abstractmethod
@@ -96,10 +166,14 @@ class LLMPlayer(ABC):
                f"history, and especially on what you ({self.name}) said. " \
                f"Reply with only one name from the list, and nothing but that name: "
         task += ", ".join(candidate_vote_names)
-        prompt = turn_task_into_prompt(task, message_history)
+        prompt = turn_task_into_prompt(task, self.get_prompt_history(message_history))
         system_info = self.get_system_info_message()
-        self.logger.log("prompt for get_vote", prompt)
-        self.logger.log("system_info for get_vote", system_info)
-        vote = self.llm.generate(prompt, system_info)
-        self.logger.log("generated vote in get_vote", vote)
+        self.logger.log("prompt for get_vote", prompt, DEBUG)
+        self.logger.log("system_info for get_vote", system_info, DEBUG)
+        if self.constrained_vote:
+            vote = self.llm.choose(prompt, system_info, candidate_vote_names,
+                                   prompt_kind=VOTE_PROMPT_KIND)
+        else:
+            vote = self.llm.generate(prompt, system_info, prompt_kind=VOTE_PROMPT_KIND)
+        self.logger.log("generated vote in get_vote", vote, constrained=self.constrained_vote)
         return vote
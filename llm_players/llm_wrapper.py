@@ -1,94 +1,32 @@
-import os
 import time
-from functools import cache
-from pathlib import Path
+from threading import Event, Lock
 
-from game_constants import get_current_timestamp
-from llm_players.llm_constants import TASK2OUTPUT_FORMAT, INITIAL_GENERATION_PROMPT, \
+from llm_players.llm_constants import INITIAL_GENERATION_PROMPT, \
     INSTRUCTION_INPUT_RESPONSE_PATTERN, LLAMA3_PATTERN, DEFAULT_PROMPT_PATTERN, NUM_BEAMS_KEY, \
-    MODEL_NAME_KEY, USE_PIPELINE_KEY, PIPELINE_TASK_KEY, MAX_NEW_TOKENS_KEY, GENERAL_SYSTEM_INFO, \
-    REPETITION_PENALTY_KEY, GENERATION_PARAMETERS, USE_TOGETHER_KEY, TOGETHER_API_KEY_KEYWORD, \
-    SECRETS_DICT_FILE_PATH, SLEEPING_TIME_FOR_API_GENERATION_ERROR
-
-print("Trying to import torch...", get_current_timestamp())
-import torch
-print("Finished importing torch!", get_current_timestamp())
-print("Trying to import from transformers...", get_current_timestamp())
-from transformers import AutoTokenizer, AutoModelForCausalLM, AutoModelForSeq2SeqLM, AutoConfig, \
-    pipeline
-print("Finished importing from transformers!", get_current_timestamp())
-
-from together import Together
-from together.error import TogetherException
-
-CACHE_DIR = os.path.expanduser("~/.cache/huggingface/hub")
-
-
-def is_local_path(model_name):
-    return os.path.isdir(model_name)  # maybe should come up with better mechanism
-
-
-@cache
-def cached_model(model_name):
-    if is_local_path(model_name):
-        config = AutoConfig.from_pretrained(model_name)
-        return AutoModelForSeq2SeqLM.from_pretrained(model_name, config=config)
-    return AutoModelForCausalLM.from_pretrained(model_name, cache_dir=CACHE_DIR)
-
-
-@cache
-def cached_tokenizer(model_name):
-    return AutoTokenizer.from_pretrained(model_name, cache_dir=CACHE_DIR)
-
-
-@cache
-def cached_pipeline(model_name, task):  # TODO: maybe use device as parameter?
-    return pipeline(task, model_name, device_map="auto")
-
-
-def get_together_api_key():
-    key = os.environ.get(TOGETHER_API_KEY_KEYWORD)
-    if key:
-        return key
-    secrets_file = Path(SECRETS_DICT_FILE_PATH)
-    if secrets_file.exists():
-        try:
-            secrets = eval(secrets_file.read_text())
-        except (ValueError, NameError):
-            return None
-        return secrets.get(TOGETHER_API_KEY_KEYWORD)
-    else:  # TODO: REMOVE AFTER ADDING THE FILE!
-        print("\n\n\nMISSING SECRETS DICT FILE!!!!!\n\n\n")
-    return None
+    MODEL_NAME_KEY, GENERAL_SYSTEM_INFO, GENERATION_PARAMETERS
+from llm_players.llm_backends import llm_backend_factory
+from llm_players.timeline import Timeline
 
 
 class LLMWrapper:
 
-    def __init__(self, logger, **llm_config):
+    def __init__(self, logger, timeline=None, **llm_config):
         self.logger = logger
+        self.timeline = timeline if timeline is not None else Timeline()  # (records nothing)
         self.model_name = llm_config[MODEL_NAME_KEY]
-        self.use_together = llm_config.get(USE_TOGETHER_KEY)
-        self.use_pipeline = llm_config[USE_PIPELINE_KEY]
-        self.pipeline_task = llm_config[PIPELINE_TASK_KEY]
         self.generation_parameters = {key: value for key, value in llm_config.items()
                                       if key in GENERATION_PARAMETERS}
         if (NUM_BEAMS_KEY in self.generation_parameters
             and self.generation_parameters[NUM_BEAMS_KEY] < 2):
             del self.generation_parameters[NUM_BEAMS_KEY]
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.prompt_template = self._get_prompt_template()
-        if self.use_together:
-            self.client = Together(api_key=get_together_api_key())
-            self.pipeline = self.tokenizer = self.model = None
-        elif self.use_pipeline:
-            self.pipeline = cached_pipeline(self.model_name, self.pipeline_task)
-            self.client = self.tokenizer = self.model = None
-        else:
-            self.pipeline = self.client = None
-            self.tokenizer = cached_tokenizer(self.model_name)
-            self.model = cached_model(self.model_name)
-            self.model.to(self.device)
-            self.model.eval()
+        # set from another thread to stop the current generation early, and skip the next ones:
+        self.cancel_event = Event()
+        # a time.monotonic() time, after which a failed API request isn't retried (None - never):
+        self.deadline = None
+        self.token_usage_lock = Lock()
+        self.total_prompt_tokens = self.total_completion_tokens = 0
+        self.backend = llm_backend_factory(self, llm_config)  # Together, a local model, mock...
         # initial generation just to save time of first generation in real time
         self.generate(INITIAL_GENERATION_PROMPT, system_info=GENERAL_SYSTEM_INFO)
 
@@ -153,43 +91,99 @@ class LLMWrapper:
         else:
             raise NotImplementedError("Missing output template for used model")
 
-    def generate(self, input_text, system_info="", generation_parameters=None):
+    def cancel_generation(self):
+        self.cancel_event.set()
+
+    def allow_generation(self, deadline=None):
+        self.deadline = deadline
+        self.cancel_event.clear()
+
+    def generate(self, input_text, system_info="", generation_parameters=None, prompt_kind=None):
+        """
+        Returns an empty string if the generation was cancelled before it was finished.
+        Prompts of the same `prompt_kind` reuse the KV cache of their shared prefix (not for APIs).
+        """
+        output, _, _ = self.generate_with_token_usage(input_text, system_info,
+                                                      generation_parameters, prompt_kind)
+        return output
+
+    def generate_with_token_usage(self, input_text, system_info="", generation_parameters=None,
+                                  prompt_kind=None):
+        """Returns the output, the number of prompt tokens and the number of completion tokens"""
+        if self.cancel_event.is_set():
+            return "", 0, 0
         if generation_parameters is None:
             generation_parameters = self.generation_parameters
-        with torch.inference_mode():
-            if self.use_together:
-                messages = self.pipeline_preprocessing(input_text, system_info)
-                self.logger.log("messages in generate with self.use_together", messages)
-                final_output = self.generate_with_together_safely(messages, generation_parameters)  # max_new_tokens -> max_tokens
-                self.logger.log("final_output in generate with self.use_together", final_output)
-            elif self.use_pipeline:
-                messages = self.pipeline_preprocessing(input_text, system_info)
-                self.logger.log("messages in generate with self.use_pipeline", messages)
-                outputs = self.pipeline(messages, **generation_parameters)
-                self.logger.log("outputs in generate with self.use_pipeline", outputs)
-                final_output = outputs[0][TASK2OUTPUT_FORMAT[self.pipeline_task]][-1]
-            else:
-                prompt = self.direct_preprocessing(input_text, system_info)
-                self.logger.log("prompt in generate directly", prompt)
-                inputs = self.tokenizer(prompt, return_tensors="pt")
-                inputs = {key: value.to(self.device) for key, value in inputs.items()}
-                outputs = self.model.generate(**inputs, **generation_parameters)
-                decoded_output = self.tokenizer.decode(outputs[0])
-                self.logger.log("decoded_output in generate directly", decoded_output)
-                final_output = self.direct_postprocessing(decoded_output)
-        return final_output.replace("\n", "   ").strip()
-
-    def generate_with_together_safely(self, messages, generation_parameters):
-        output = None
-        while not output:
-            try:
-                response = self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=messages,
-                    **generation_parameters
-                )
-                output = response.choices[0].message.content
-            except TogetherException as e:
-                self.logger.log("error generating with TogetherAI", str(e))
-                time.sleep(SLEEPING_TIME_FOR_API_GENERATION_ERROR)
-        return output
+        start_time = time.monotonic()
+        with self.timeline.span(f"llm_generate[{prompt_kind or 'other'}]") as span_args:
+            final_output, num_prompt_tokens, num_completion_tokens = self.backend.generate(
+                input_text, system_info, generation_parameters, prompt_kind)
+            span_args.update(num_prompt_tokens=num_prompt_tokens,
+                             num_completion_tokens=num_completion_tokens,
+                             cancelled=self.cancel_event.is_set())
+        self.count_token_usage(num_prompt_tokens, num_completion_tokens,
+                               time.monotonic() - start_time, prompt_kind)
+        if self.cancel_event.is_set():
+            return "", num_prompt_tokens, num_completion_tokens  # a partial output was cancelled
+        return final_output.replace("\n", "   ").strip(), num_prompt_tokens, num_completion_tokens
+
+    def can_score(self):
+        return self.backend.CAN_SCORE
+
+    def score_continuations(self, input_text, system_info, continuations, prompt_kind=None):
+        """
+        Returns the log-probability of each of the `continuations` as the output, from a forward
+        pass instead of a generation (see `can_score`), or None if it was cancelled.
+        """
+        if self.cancel_event.is_set():
+            return None
+        start_time = time.monotonic()
+        with self.timeline.span(f"llm_score[{prompt_kind or 'other'}]") as span_args:
+            log_probs, num_prompt_tokens = self.backend.score_continuations(
+                input_text, system_info, continuations, prompt_kind)
+            span_args.update(num_prompt_tokens=num_prompt_tokens,
+                             cancelled=self.cancel_event.is_set())
+        self.count_token_usage(num_prompt_tokens, 0, time.monotonic() - start_time, prompt_kind)
+        if self.cancel_event.is_set():
+            return None
+        return log_probs
+
+    def can_choose(self):
+        return self.backend.CAN_CHOOSE
+
+    def choose(self, input_text, system_info, choices, generation_parameters=None,
+               prompt_kind=None):
+        """
+        Returns the one of the `choices` the model prefers, by scoring them or by constraining the
+        output to them (see `can_choose`), or an empty string if it was cancelled
+        """
+        if self.cancel_event.is_set():
+            return ""
+        if generation_parameters is None:
+            generation_parameters = self.generation_parameters
+        start_time = time.monotonic()
+        with self.timeline.span(f"llm_choose[{prompt_kind or 'other'}]",
+                                num_choices=len(choices)) as span_args:
+            choice, num_prompt_tokens, num_completion_tokens = self.backend.choose(
+                input_text, system_info, choices, generation_parameters, prompt_kind)
+            span_args.update(num_prompt_tokens=num_prompt_tokens,
+                             num_completion_tokens=num_completion_tokens,
+                             cancelled=self.cancel_event.is_set())
+        self.count_token_usage(num_prompt_tokens, num_completion_tokens,
+                               time.monotonic() - start_time, prompt_kind)
+        if self.cancel_event.is_set():
+            return ""
+        return choice
+
+    def count_tokens(self, text):
+        return self.backend.count_tokens(text)
+
+    def count_token_usage(self, num_prompt_tokens, num_completion_tokens, duration, prompt_kind):
+        with self.token_usage_lock:  # generations might run concurrently
+            self.total_prompt_tokens += num_prompt_tokens
+            self.total_completion_tokens += num_completion_tokens
+            self.logger.log("token usage in generate", prompt_kind, duration=duration,
+                            num_prompt_tokens=num_prompt_tokens,
+                            num_completion_tokens=num_completion_tokens,
+                            total_prompt_tokens=self.total_prompt_tokens,
+                            total_completion_tokens=self.total_completion_tokens)
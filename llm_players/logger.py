@@ -1,15 +1,86 @@
+import atexit
+import gzip
+import json
+import queue
+import shutil
+import time
+from logging import DEBUG, INFO, WARNING, getLevelName
 from pathlib import Path
+from threading import Thread
 from game_constants import LLM_LOG_FILE_FORMAT, get_current_timestamp
 
-NEW_LOG_FORMAT = "# NEW LOG\n## TIME: {time}\n## OPERATION: {operation}\n## CONTENT: {content}\n\n"
+ROTATED_LOG_FILE_SUFFIX_FORMAT = ".{}.gz"  # added to the log file name, numbered from 1
+LOG_QUEUE_MAX_SIZE = 10000  # records, if the disk can't keep up then logging starts blocking
+LOG_WRITING_BATCH_SIZE = 500  # records written together, before flushing
+LOG_LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING}  # debug includes full prompts
+DEFAULT_LOG_LEVEL = "debug"
 
 
 class Logger:
+    """
+    Writes JSONL records (one JSON object per line) in a background thread, so logging costs the
+    caller only a queue insertion. Records are written in batches, and the file is kept open.
+    Records below `log_level` are dropped, and once the file is bigger than `max_file_size` bytes
+    (if given) it's compressed with gzip and a new one is started.
+    """
 
-    def __init__(self, name: str, game_dir: Path):
+    def __init__(self, name: str, game_dir: Path, log_level=DEFAULT_LOG_LEVEL, max_file_size=0):
         self.log_file = game_dir / LLM_LOG_FILE_FORMAT.format(name)
+        self.log_level = LOG_LEVELS[log_level]
+        self.max_file_size = max_file_size
+        self.num_rotated_files = 0
+        self.records = queue.Queue(maxsize=LOG_QUEUE_MAX_SIZE)
+        self.writing_thread = Thread(target=self.write_records_loop, daemon=True)
+        self.writing_thread.start()
+        atexit.register(self.close)  # so the last records aren't lost
 
-    def log(self, operation, content):
-        with open(self.log_file, "a") as f:
-            f.write(NEW_LOG_FORMAT.format(time=get_current_timestamp(),
-                                          operation=operation, content=content))
+    def log(self, operation, content, level=INFO, **fields):
+        """`fields` are added to the record as they are, like durations and token counts"""
+        if level < self.log_level:
+            return
+        self.records.put({"time": get_current_timestamp(), "unix_time": time.time(),
+                          "level": getLevelName(level), "operation": operation,
+                          "content": content, **fields})
+
+    def get_records_batch(self):
+        batch = [self.records.get()]
+        while len(batch) < LOG_WRITING_BATCH_SIZE:
+            try:
+                batch.append(self.records.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def write_records_loop(self):
+        f = open(self.log_file, "a")
+        while True:
+            batch = self.get_records_batch()
+            is_closed = None in batch  # the sign that the logger was closed
+            f.writelines(json.dumps(record, default=str) + "\n"
+                         for record in batch if record is not None)
+            f.flush()
+            if is_closed:
+                f.close()
+                return
+            if self.max_file_size and f.tell() > self.max_file_size:
+                f.close()
+                self.rotate()
+                f = open(self.log_file, "a")
+
+    def get_rotated_file(self, number):
+        return self.log_file.with_name(self.log_file.name
+                                       + ROTATED_LOG_FILE_SUFFIX_FORMAT.format(number))
+
+    def rotate(self):
+        self.num_rotated_files += 1
+        while self.get_rotated_file(self.num_rotated_files).exists():  # from a previous run
+            self.num_rotated_files += 1
+        rotated_file = self.get_rotated_file(self.num_rotated_files)
+        with open(self.log_file, "rb") as f_in, gzip.open(rotated_file, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        self.log_file.write_text("")
+
+    def close(self):
+        if self.writing_thread.is_alive():
+            self.records.put(None)
+            self.writing_thread.join()
@@ -0,0 +1,85 @@
+import re
+import time
+from threading import Lock
+from game_constants import NIGHTTIME
+from message_records import SPEAKER_IDS, CHAT, VOTE, PHASE_START, ELIMINATION, UNPARSED
+
+SECONDS_IN_DAY = 24 * 60 * 60
+PHASE_MINUTES_PATTERN = r" for ([\d.]+) minutes"  # in the phases' start messages
+
+
+def get_seconds_since_midnight():
+    now = time.localtime()  # the messages' timestamps are in local time, see MESSAGE_FORMAT
+    return now.tm_hour * 60 * 60 + now.tm_min * 60 + now.tm_sec
+
+
+class PhaseStats:
+    """
+    Statistics of the current phase (who talked how much, who talked last and when, who is still
+    in the game), updated incrementally from the message history, so the scheduling decisions
+    don't rescan it or read the game's files on every poll.
+    """
+
+    def __init__(self, player_names):
+        self.remaining_players = list(player_names)
+        self.phase_name = None  # until the first phase starts
+        self.num_phases = 0  # that have started, identifies the current phase
+        self.players_counts = {name: 0 for name in player_names}  # messages in the current phase
+        self.num_players_messages = 0  # by all players in the current phase
+        self.num_phase_messages = 0  # incl. the game manager's, but without the votes
+        self.last_speaker = None
+        self.last_message_time = None  # seconds since midnight, from the message's timestamp
+        self.phase_end_time = None  # seconds since midnight, by the phase's start message
+        self.num_processed_messages = 0
+        self.lock = Lock()  # a generation and a speculative generation might update concurrently
+
+    def start_phase(self, phase_name):
+        self.phase_name = phase_name
+        self.num_phases += 1
+        self.players_counts = dict.fromkeys(self.players_counts, 0)
+        self.num_players_messages = 0
+        self.num_phase_messages = 0
+
+    def add_message(self, message):
+        """`message` is a MessageRecord"""
+        if message.kind == UNPARSED or message.kind == VOTE:
+            return  # the votes aren't a part of the phase's discussion
+        if message.kind == PHASE_START:
+            self.start_phase(message.subject)
+            matcher = re.search(PHASE_MINUTES_PATTERN, message.content)
+            self.phase_end_time = message.timestamp + float(matcher.group(1)) * 60 \
+                if matcher else None
+        elif message.kind == ELIMINATION:
+            voted_out_name = SPEAKER_IDS.get_name(message.subject)
+            if voted_out_name in self.remaining_players:
+                self.remaining_players.remove(voted_out_name)
+        elif message.kind == CHAT:
+            self.players_counts[message.name] = self.players_counts.get(message.name, 0) + 1
+            self.num_players_messages += 1
+        self.num_phase_messages += 1
+        self.last_speaker = message.name
+        self.last_message_time = message.timestamp
+
+    def update(self, message_history):
+        """Adds the messages that are new since the last update, and returns itself"""
+        with self.lock:
+            # the history only grows, so only the messages after the processed ones are new
+            for message in message_history[self.num_processed_messages:]:
+                self.add_message(message)
+            self.num_processed_messages = max(self.num_processed_messages, len(message_history))
+        return self
+
+    def is_nighttime(self):
+        return self.phase_name == NIGHTTIME
+
+    def seconds_since_last_message(self):
+        if self.last_message_time is None:
+            return None
+        return (get_seconds_since_midnight() - self.last_message_time) % SECONDS_IN_DAY
+
+    def seconds_until_phase_end(self):
+        """Negative once the phase's discussion has ended, None if it's unknown"""
+        if self.phase_end_time is None:
+            return None
+        seconds = (self.phase_end_time - get_seconds_since_midnight()) % SECONDS_IN_DAY
+        return seconds if seconds <= SECONDS_IN_DAY / 2 else seconds - SECONDS_IN_DAY
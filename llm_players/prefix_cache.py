@@ -0,0 +1,47 @@
+from threading import Lock
+
+
+def get_shared_prefix_length(token_ids, other_token_ids):
+    length = 0
+    for token_id, other_token_id in zip(token_ids, other_token_ids):
+        if token_id != other_token_id:
+            break
+        length += 1
+    return length
+
+
+class PrefixCache:
+    """
+    Keeps the KV cache (`past_key_values`) of the last prompt of each kind (scheduling, generation,
+    vote...), so the next prompt of the same kind only has to encode what follows their shared
+    prefix - usually the system info and the message history are shared, and only the new messages
+    and the task after them are new.
+    """
+
+    def __init__(self):
+        self.entries = {}  # prompt kind -> (token ids of its last prompt, KV cache of that prompt)
+        self.lock = Lock()  # prompts of different kinds might be generated concurrently
+
+    def take(self, prompt_kind, token_ids):
+        """
+        Returns the KV cache of the prefix shared with the last prompt of this kind (or None) and
+        the prefix's length. The KV cache is removed from here until `put` is called with the new
+        prompt, since generating with it extends it.
+        """
+        with self.lock:
+            entry = self.entries.pop(prompt_kind, None)
+        if entry is None:
+            return None, 0
+        cached_token_ids, kv_cache = entry
+        # at least the last token has to be encoded, to get the logits of the first new token
+        prefix_length = min(get_shared_prefix_length(cached_token_ids, token_ids),
+                            len(token_ids) - 1)
+        if prefix_length <= 0:
+            return None, 0
+        kv_cache.crop(prefix_length)
+        return kv_cache, prefix_length
+
+    def put(self, prompt_kind, token_ids, kv_cache):
+        kv_cache.crop(len(token_ids))  # the generated tokens won't be in the next prompt
+        with self.lock:
+            self.entries[prompt_kind] = (token_ids, kv_cache)
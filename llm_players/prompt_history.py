@@ -0,0 +1,118 @@
+import re
+from collections import Counter
+from threading import Lock
+from game_constants import DAYTIME
+from message_records import MessageRecord, PHASE_START, UNPARSED
+
+ACCUSATION_KEYWORDS = ["mafia", "sus", "suspicious", "lying", "liar", "vote", "kill", "guilty"]
+MAX_ACCUSATIONS_IN_SUMMARY = 5
+# the summaries of earlier phases get at most this part of the budget, the current phase the rest:
+SUMMARIES_MAX_BUDGET_FRACTION = 0.25
+PHASE_SUMMARY_FORMAT = "[Summary of an earlier {} phase with {} messages] {}\n"
+ACCUSATION_SUMMARY_FORMAT = "{} suspected {}"
+OMITTED_MESSAGES_FORMAT = "[{} earlier messages of the current phase are not shown]\n"
+OMITTED_SUMMARIES_FORMAT = "[{} earlier phases are not shown]\n"
+
+
+class PhaseSummary:
+    """Compactly keeps what matters from a phase that has ended: votes, eliminations, accusations"""
+
+    def __init__(self, phase_name, player_names):
+        self.phase_name = phase_name
+        self.player_names = player_names
+        self.num_messages = 0
+        self.manager_messages = []  # the votes and who was voted out, verbatim (without the time)
+        self.accusations = Counter()  # (accuser, accused) -> number of messages
+
+    def add(self, message):
+        """`message` is a MessageRecord"""
+        self.num_messages += 1
+        if message.is_manager:
+            if message.kind != PHASE_START:
+                self.manager_messages.append(message.content.strip())
+            return
+        name = message.name
+        lowered_content = message.content.lower()
+        if not any(keyword in lowered_content for keyword in ACCUSATION_KEYWORDS):
+            return
+        for accused in self.player_names:
+            if accused != name and re.search(rf"\b{re.escape(accused.lower())}\b",
+                                             lowered_content):
+                self.accusations[(name, accused)] += 1
+
+    def to_message(self):
+        accusations = [ACCUSATION_SUMMARY_FORMAT.format(accuser, accused)
+                       + (f" ({count} times)" if count > 1 else "")
+                       for (accuser, accused), count
+                       in self.accusations.most_common(MAX_ACCUSATIONS_IN_SUMMARY)]
+        parts = ([f"Accusations: {', '.join(accusations)}."] if accusations else []) \
+            + self.manager_messages
+        return PHASE_SUMMARY_FORMAT.format(self.phase_name, self.num_messages, " ".join(parts))
+
+
+class PromptHistory:
+    """
+    Keeps the message history in prompts under a token budget: the current phase is kept
+    verbatim, and every phase that has ended is compressed into a short summary. If it's still
+    over the budget, the oldest summaries and then the oldest messages are left out.
+    It's updated incrementally, so every message is parsed and its tokens counted only once.
+    """
+
+    def __init__(self, count_tokens, token_budget, player_names):
+        self.count_tokens = count_tokens  # with the model's tokenizer
+        self.token_budget = token_budget
+        self.player_names = player_names
+        self.num_processed_messages = 0
+        # (MessageRecord, its tokens), the summaries are records of lines that aren't messages:
+        self.summaries = []  # of the phases that have ended
+        self.current_phase_messages = []
+        self.current_phase_summary = PhaseSummary(DAYTIME, player_names)
+        self.lock = Lock()  # a generation and a speculative generation might update concurrently
+
+    def start_phase(self, phase_name):
+        if self.current_phase_messages:
+            summary_message = self.current_phase_summary.to_message()
+            self.summaries.append((MessageRecord(summary_message),
+                                   self.count_tokens(summary_message)))
+        self.current_phase_messages = []
+        self.current_phase_summary = PhaseSummary(phase_name, self.player_names)
+
+    def add_message(self, message):
+        """`message` is a MessageRecord"""
+        if message.kind == PHASE_START:
+            self.start_phase(message.subject)
+        if message.kind != UNPARSED:
+            self.current_phase_summary.add(message)
+        self.current_phase_messages.append((message, self.count_tokens(message.line)))
+
+    def update(self, message_history):
+        # the history only grows, so only the messages after the processed ones are new (a
+        # snapshot that is older than the last update gets the newer one, which is harmless)
+        for message in message_history[self.num_processed_messages:]:
+            self.add_message(message)
+        self.num_processed_messages = max(self.num_processed_messages, len(message_history))
+
+    def take_newest_within_budget(self, messages_and_tokens, budget):
+        taken = []
+        for message, num_tokens in reversed(messages_and_tokens):
+            if num_tokens > budget:
+                break
+            taken.append(message)
+            budget -= num_tokens
+        return taken[::-1], budget
+
+    def get_messages(self, message_history):
+        """Returns the messages to put in the prompt instead of the whole `message_history`"""
+        with self.lock:
+            self.update(message_history)
+            summaries_budget = int(self.token_budget * SUMMARIES_MAX_BUDGET_FRACTION)
+            summaries, unused_budget = self.take_newest_within_budget(self.summaries,
+                                                                      summaries_budget)
+            current_phase_messages, _ = self.take_newest_within_budget(
+                self.current_phase_messages, self.token_budget - summaries_budget + unused_budget)
+            num_omitted_summaries = len(self.summaries) - len(summaries)
+            num_omitted_messages = len(self.current_phase_messages) - len(current_phase_messages)
+        return ([MessageRecord(OMITTED_SUMMARIES_FORMAT.format(num_omitted_summaries))]
+                if num_omitted_summaries else []) + summaries \
+            + ([MessageRecord(OMITTED_MESSAGES_FORMAT.format(num_omitted_messages))]
+               if num_omitted_messages else []) + current_phase_messages
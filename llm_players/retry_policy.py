@@ -0,0 +1,143 @@
+import random
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from threading import Lock
+
+# circuit breaker states
+CLOSED = "closed"  # requests are sent
+OPEN = "open"  # requests fail right away, without being sent
+HALF_OPEN = "half_open"  # a single trial request is sent, to decide whether to close it again
+RETRY_AFTER_HEADER = "retry-after"
+
+
+def get_retry_after(headers):
+    """The seconds a rate-limited server asked to wait (in seconds or as an HTTP date), or None"""
+    if not headers:
+        return None
+    value = {key.lower(): value for key, value in dict(headers).items()}.get(RETRY_AFTER_HEADER)
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    After `failure_threshold` consecutive failed attempts, the requests fail right away for
+    `reset_time` seconds, instead of waiting on a service that is down. Then a single trial
+    request decides whether it's back up.
+    """
+
+    def __init__(self, failure_threshold, reset_time):
+        self.failure_threshold = failure_threshold
+        self.reset_time = reset_time
+        self.state = CLOSED
+        self.num_consecutive_failures = 0
+        self.opening_time = None
+        self.lock = Lock()  # generations might run concurrently
+
+    def allow_request(self):
+        with self.lock:
+            if self.state == OPEN and time.monotonic() - self.opening_time >= self.reset_time:
+                self.state = HALF_OPEN
+                return True  # the trial request
+            return self.state == CLOSED
+
+    def record_success(self):
+        with self.lock:
+            self.state = CLOSED
+            self.num_consecutive_failures = 0
+
+    def record_failure(self):
+        """Returns whether the circuit was opened by this failure"""
+        with self.lock:
+            self.num_consecutive_failures += 1
+            if self.state == HALF_OPEN \
+                    or self.num_consecutive_failures >= self.failure_threshold > 0:
+                was_open = self.state == OPEN
+                self.state = OPEN
+                self.opening_time = time.monotonic()
+                return not was_open
+            return False
+
+
+class RetryPolicy:
+    """
+    Retries a failed request with exponential backoff and full jitter (or as long as a rate-limited
+    server asked), up to `max_attempts` attempts (0 - unlimited), and never past the deadline, since
+    a message after its phase has ended is worse than no message. Every attempt times out after
+    `request_timeout` seconds, or at the deadline if it's sooner. Counts what happened in `metrics`.
+    """
+
+    def __init__(self, max_attempts, initial_backoff, max_backoff, circuit_breaker,
+                 request_timeout=None):
+        self.max_attempts = max_attempts
+        self.request_timeout = request_timeout  # seconds (None - no timeout besides the deadline)
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.circuit_breaker = circuit_breaker
+        self.metrics = Counter()  # attempts, retries, failed_attempts, rate_limited, ...
+        self.random = random.Random()
+
+    def get_backoff(self, num_failed_attempts, retry_after=None):
+        if retry_after is not None:  # the server knows best when it will accept requests again
+            return retry_after
+        return self.random.uniform(
+            0, min(self.max_backoff, self.initial_backoff * 2 ** (num_failed_attempts - 1)))
+
+    def get_attempt_timeout(self, deadline=None):
+        """The seconds an attempt that starts now may take, or None if it's unlimited"""
+        if deadline is None:
+            return self.request_timeout
+        time_left = max(deadline - time.monotonic(), 0)
+        return time_left if self.request_timeout is None else min(self.request_timeout, time_left)
+
+    def call(self, send_request, retryable_errors, cancel_event, deadline=None,
+             on_error=lambda error: None):
+        """
+        Returns the result of `send_request(timeout)` (the attempt's timeout in seconds, see
+        `get_attempt_timeout`), or None if it was cancelled, short-circuited, failed
+        `max_attempts` times or would end after the `deadline` (a time.monotonic() time).
+        `on_error(error)` is called with every failure, and returns the seconds the server asked
+        to wait before retrying, or None.
+        """
+        num_failed_attempts = 0
+        while not cancel_event.is_set():
+            if deadline is not None and time.monotonic() >= deadline:
+                self.metrics["deadline_exceeded"] += 1
+                return None
+            if not self.circuit_breaker.allow_request():
+                self.metrics["short_circuited"] += 1
+                return None
+            self.metrics["attempts"] += 1
+            try:
+                result = send_request(self.get_attempt_timeout(deadline))
+            except retryable_errors as error:
+                num_failed_attempts += 1
+                self.metrics["failed_attempts"] += 1
+                if self.circuit_breaker.record_failure():
+                    self.metrics["circuit_opened"] += 1
+                retry_after = on_error(error)
+                if retry_after is not None:
+                    self.metrics["rate_limited"] += 1
+                if 0 < self.max_attempts <= num_failed_attempts:
+                    self.metrics["attempts_exhausted"] += 1
+                    return None
+                backoff = self.get_backoff(num_failed_attempts, retry_after)
+                if deadline is not None and time.monotonic() + backoff >= deadline:
+                    self.metrics["deadline_exceeded"] += 1
+                    return None
+                self.metrics["retries"] += 1
+                cancel_event.wait(backoff)
+                continue
+            self.circuit_breaker.record_success()
+            return result
+        self.metrics["cancelled"] += 1
+        return None
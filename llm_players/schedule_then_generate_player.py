@@ -1,20 +1,21 @@
-import re
-from game_constants import REMAINING_PLAYERS_FILE, GAME_MANAGER_NAME, MESSAGE_PARSING_PATTERN
-from game_status_checks import is_nighttime
+import math
+import random
+from concurrent.futures import ThreadPoolExecutor, wait
 from llm_players.llm_constants import turn_task_into_prompt, SCHEDULE_THEN_GENERATE_TYPE, \
-    make_more_human_like, SCHEDULING_GENERATION_PARAMETERS, TALKATIVE_PROMPT, QUIETER_PROMPT
+    make_more_human_like, SCHEDULING_GENERATION_PARAMETERS, TALKATIVE_PROMPT, QUIETER_PROMPT, \
+    LLM_CONFIG_KEY, SPECULATIVE_GENERATION_KEY, DEFAULT_SPECULATIVE_GENERATION, \
+    SCHEDULING_PROMPT_KIND, GENERATION_PROMPT_KIND, SCHEDULING_BY_SCORING_KEY, \
+    SCHEDULING_THRESHOLD_KEY, SCHEDULING_SAMPLING_KEY, SCHEDULING_TEMPERATURE_KEY, \
+    DEFAULT_SCHEDULING_BY_SCORING, DEFAULT_SCHEDULING_THRESHOLD, DEFAULT_SCHEDULING_SAMPLING, \
+    DEFAULT_SCHEDULING_TEMPERATURE
 from llm_players.llm_player import LLMPlayer
+from llm_players.logger import DEBUG, WARNING
 from llm_players.llm_wrapper import LLMWrapper
+from message_records import CHAT
 
 
 def no_one_has_talked_yet_in_current_phase(message_history):
-    if not message_history:
-        return True
-    matcher = re.match(MESSAGE_PARSING_PATTERN, message_history[-1])
-    if not matcher:
-        return True
-    name = matcher.group(4)  # depends on MESSAGE_PARSING_PATTERN
-    return name == GAME_MANAGER_NAME
+    return not message_history or message_history[-1].kind != CHAT
 
 
 class ScheduleThenGeneratePlayer(LLMPlayer):
@@ -26,44 +27,131 @@ class ScheduleThenGeneratePlayer(LLMPlayer):
         # scheduler_kwargs = kwargs.get("scheduler_kwargs", kwargs)
         # self.scheduler = LLMWrapper(**scheduler_kwargs)
         self.scheduler = self.llm  # using the same one for generation...
+        self.speculative_generation = kwargs[LLM_CONFIG_KEY].get(  # missing in older configs
+            SPECULATIVE_GENERATION_KEY, DEFAULT_SPECULATIVE_GENERATION)
+        self.generation_executor = ThreadPoolExecutor(max_workers=1) \
+            if self.speculative_generation else None
+        self.num_discarded_tokens = 0  # the cost of speculative generation
+        llm_config = kwargs[LLM_CONFIG_KEY]
+        self.scheduling_by_scoring = llm_config.get(SCHEDULING_BY_SCORING_KEY,
+                                                    DEFAULT_SCHEDULING_BY_SCORING)
+        if self.scheduling_by_scoring and not self.scheduler.can_score():
+            self.logger.log("scheduling by scoring", "The backend can't score, so the scheduling "
+                            "decision will be generated instead", WARNING)
+            self.scheduling_by_scoring = False
+        self.scheduling_threshold = llm_config.get(SCHEDULING_THRESHOLD_KEY,
+                                                   DEFAULT_SCHEDULING_THRESHOLD)
+        self.scheduling_sampling = llm_config.get(SCHEDULING_SAMPLING_KEY,
+                                                  DEFAULT_SCHEDULING_SAMPLING)
+        self.scheduling_temperature = llm_config.get(SCHEDULING_TEMPERATURE_KEY,
+                                                     DEFAULT_SCHEDULING_TEMPERATURE)
+        self.scheduling_random = random.Random()
 
     def should_generate_message(self, message_history):
         if no_one_has_talked_yet_in_current_phase(message_history):
             return False
-        prompt = self.create_scheduling_prompt(message_history)
-        self.logger.log("prompt in should_generate_message", prompt)
-        decision = self.scheduler.generate(
-            prompt, self.get_system_info_message(only_special_tokens=True),
-            SCHEDULING_GENERATION_PARAMETERS)
+        with self.timeline.span("build_scheduling_prompt",
+                                num_history_messages=len(message_history)):
+            prompt = self.create_scheduling_prompt(message_history)
+            system_info = self.get_system_info_message(only_special_tokens=True)
+        self.logger.log("prompt in should_generate_message", prompt, DEBUG)
+        if self.scheduling_by_scoring:
+            return self.score_scheduling_decision(prompt, system_info)
+        decision = self.scheduler.generate(prompt, system_info, SCHEDULING_GENERATION_PARAMETERS,
+                                           SCHEDULING_PROMPT_KIND)
         self.logger.log("decision in should_generate_message", decision)
         return self.interpret_scheduling_decision(decision)
 
+    def get_use_turn_probability(self, prompt, system_info):
+        """
+        The probability of the use turn token against the pass turn token, as the model's output
+        to the scheduling prompt, or None if it was cancelled
+        """
+        log_probs = self.scheduler.score_continuations(
+            prompt, system_info, [self.use_turn_token, self.pass_turn_token],
+            SCHEDULING_PROMPT_KIND)
+        if log_probs is None:
+            return None
+        use_turn_log_prob, pass_turn_log_prob = log_probs
+        # a softmax over the two options, with the temperature for calibration
+        logit = (use_turn_log_prob - pass_turn_log_prob) / self.scheduling_temperature
+        return 1 / (1 + math.exp(-logit)) if logit >= 0 else math.exp(logit) / (1 + math.exp(logit))
+
+    def score_scheduling_decision(self, prompt, system_info):
+        use_turn_probability = self.get_use_turn_probability(prompt, system_info)
+        if use_turn_probability is None:
+            return self.interpret_scheduling_decision("")
+        if self.scheduling_sampling:
+            use_turn = self.scheduling_random.random() < use_turn_probability
+        else:
+            use_turn = use_turn_probability >= self.scheduling_threshold
+        self.logger.log("use turn probability in should_generate_message", use_turn_probability,
+                        sampled=self.scheduling_sampling, threshold=self.scheduling_threshold)
+        return self.interpret_scheduling_decision(
+            self.use_turn_token if use_turn else self.pass_turn_token)
+
     def generate_message(self, message_history):
+        if self.speculative_generation:
+            return self.generate_message_speculatively(message_history)
         if self.should_generate_message(message_history):
-            prompt = self.create_generation_prompt(message_history)
-            self.logger.log("prompt in generate_message", prompt)
-            message = self.llm.generate(
-                prompt, self.get_system_info_message(attention_to_not_repeat=True))
-            message = make_more_human_like(message)
+            message, _ = self.create_message(message_history)
             return message
         else:
             return ""
 
+    def generate_message_speculatively(self, message_history):
+        if no_one_has_talked_yet_in_current_phase(message_history):
+            return ""  # the scheduling decision is known without the model, so don't speculate
+        # the message is generated while the scheduling decision is made, instead of after it
+        generation = self.generation_executor.submit(self.create_message, message_history)
+        if self.should_generate_message(message_history):
+            message, _ = generation.result()
+            return message
+        self.discard_generation(generation)
+        return ""
+
+    def discard_generation(self, generation):
+        """
+        Stops the speculative generation and waits for it, so the model is free when this returns
+        (the caller might use it right after, for another generation or for voting)
+        """
+        was_cancelled = self.llm.cancel_event.is_set()  # then it has to stay cancelled
+        self.llm.cancel_generation()
+        wait([generation])
+        if not was_cancelled:
+            self.llm.allow_generation(self.llm.deadline)
+        if generation.exception() is not None:
+            self.logger.log("error in discarded speculative message in generate_message",
+                            repr(generation.exception()), WARNING)
+            return
+        self.log_discarded_message(*generation.result())
+
+    def create_message(self, message_history):
+        """Returns the message and the number of tokens it took"""
+        with self.timeline.span("build_generation_prompt",
+                                num_history_messages=len(message_history)):
+            prompt = self.create_generation_prompt(message_history)
+            system_info = self.get_system_info_message(attention_to_not_repeat=True)
+        self.logger.log("prompt in generate_message", prompt, DEBUG)
+        message, num_prompt_tokens, num_completion_tokens = self.llm.generate_with_token_usage(
+            prompt, system_info, prompt_kind=GENERATION_PROMPT_KIND)
+        with self.timeline.span("make_more_human_like"):
+            message = make_more_human_like(message)
+        return message, num_prompt_tokens + num_completion_tokens
+
+    def log_discarded_message(self, message, num_tokens):
+        with self.llm.token_usage_lock:
+            self.num_discarded_tokens += num_tokens
+            total_discarded_tokens = self.num_discarded_tokens
+        self.logger.log("discarded speculative message in generate_message", message,
+                        num_tokens=num_tokens, total_discarded_tokens=total_discarded_tokens)
+
     def talkative_scheduling_prompt_modifier(self, message_history):
-        if not message_history or is_nighttime(self.game_dir):
+        stats = self.phase_stats.update(message_history)
+        if not message_history or stats.is_nighttime():
             return TALKATIVE_PROMPT
-        all_players = (self.game_dir / REMAINING_PLAYERS_FILE).read_text().splitlines()
-        players_counts = {player: 0 for player in all_players}
-        for message in message_history[::-1]:
-            if f"] {GAME_MANAGER_NAME}: " in message and "voted for" in message:  # TODO constants!
-                continue
-            elif f"] {GAME_MANAGER_NAME}: " in message and "has ended, now it's time to vote!" in message:  # TODO constants!
-                break
-            for player in players_counts:
-                if f"] {player}: " in message:  # TODO constants!
-                    players_counts[player] += 1
-        all_player_messages = sum(players_counts.values())
-        if not all_player_messages or players_counts[self.name] / all_player_messages < 1 / len(all_players):
+        if not stats.num_players_messages or stats.players_counts.get(self.name, 0) \
+                / stats.num_players_messages < 1 / len(stats.remaining_players):
             return TALKATIVE_PROMPT
         else:
             return QUIETER_PROMPT
@@ -79,7 +167,7 @@ class ScheduleThenGeneratePlayer(LLMPlayer):
                f"Reply only with `{self.use_turn_token}` if you want to send a message now, " \
                f"or only with `{self.pass_turn_token}` if you want to wait for now, " \
                f"based on your decision! "
-        return turn_task_into_prompt(task, message_history)
+        return turn_task_into_prompt(task, self.get_prompt_history(message_history))
 
     def create_generation_prompt(self, message_history):
         task = f"Add a very short message to the game's chat. " \
@@ -106,4 +194,4 @@ class ScheduleThenGeneratePlayer(LLMPlayer):
                # f"\"because they are the only one that didnt vote diane\",\n" \
                # f"\"i think Moe is so loud\",\n" \
                # f"\"jennifer, do you have anything to say for yourself?\"...\n"
-        return turn_task_into_prompt(task, message_history)
+        return turn_task_into_prompt(task, self.get_prompt_history(message_history))
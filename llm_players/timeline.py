@@ -0,0 +1,85 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from game_constants import TIMELINE_FILE
+
+# Chrome trace event format (which Perfetto and chrome://tracing open), as a JSON array:
+# https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU
+TIMELINE_FILE_START = "[\n"  # the array's closing "]" is optional, so events can just be appended
+COMPLETE_EVENT_PHASE = "X"  # an event with a start and a duration
+METADATA_EVENT_PHASE = "M"
+
+
+class Timeline:
+    """
+    Records spans (named stages with a start and a duration) of an LLM player into the game's
+    timeline file, which all the game's LLM players append to, each as its own process. Every span
+    is written in a single append, right when it ends. Without a game dir, nothing is recorded.
+    """
+
+    def __init__(self, game_dir=None, name=None):
+        self.fd = None if game_dir is None else self.open_timeline_file(game_dir / TIMELINE_FILE)
+        self.pid = os.getpid()
+        self.seen_threads = set()
+        self.lock = threading.Lock()
+        if self.fd is not None:
+            self.write_event({"ph": METADATA_EVENT_PHASE, "name": "process_name", "pid": self.pid,
+                              "args": {"name": name}})
+
+    @staticmethod
+    def open_timeline_file(path):
+        try:  # only the first player to open it starts it (exclusive creation is atomic)
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o666)
+            os.write(fd, TIMELINE_FILE_START.encode())
+            return fd
+        except FileExistsError:
+            return os.open(path, os.O_WRONLY | os.O_APPEND)
+
+    def write_event(self, event):
+        # a single write to a file opened for appending isn't interleaved with other processes'
+        os.write(self.fd, (json.dumps(event, default=str) + ",\n").encode())
+
+    def name_current_thread(self, tid):
+        with self.lock:
+            if tid in self.seen_threads:
+                return
+            self.seen_threads.add(tid)
+        self.write_event({"ph": METADATA_EVENT_PHASE, "name": "thread_name", "pid": self.pid,
+                          "tid": tid, "args": {"name": threading.current_thread().name}})
+
+    @contextmanager
+    def span(self, name, **args):
+        """
+        Yields the span's args (like history length and token counts), so values that are known
+        only inside the span can be added to it.
+        """
+        start_time = time.time()  # a clock shared by all the processes
+        start_counter = time.perf_counter()
+        try:
+            yield args
+        finally:
+            if self.fd is not None:
+                duration = time.perf_counter() - start_counter
+                tid = threading.get_native_id()
+                self.name_current_thread(tid)
+                self.write_event({"ph": COMPLETE_EVENT_PHASE, "name": name, "pid": self.pid,
+                                  "tid": tid, "ts": int(start_time * 1e6),
+                                  "dur": int(duration * 1e6), "args": args})
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def read_timeline_events(path):
+    """Parses a timeline file, skipping an event that was cut in the middle (by a crash)"""
+    events = []
+    for line in path.read_text().splitlines()[1:]:  # after TIMELINE_FILE_START
+        try:
+            events.append(json.loads(line.rstrip(",")))
+        except json.JSONDecodeError:
+            continue
+    return events
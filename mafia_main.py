@@ -1,203 +1,261 @@
+import asyncio
 import json
 import os
 from game_constants import *  # incl. argparse, time, Path (from pathlib), colored (from termcolor)
+from game_dir_watcher import get_game_dir_watcher, AsyncGameDirWatcher
+from file_tail_reader import FileTailReader
+from game_status_checks import read_game_file, write_game_file, append_to_game_file
 
-
-# global variable for the game dir
-game_dir = Path()  # will be updated only if __name__ == __main__ (prevents new ones in imports)
+GAME_PRINT_PREFIX_FORMAT = "[game {}] "  # when hosting multiple games, to know which game printed
 
 
 class Player:
 
-    def __init__(self, name, is_mafia, **kwargs):
+    def __init__(self, name, is_mafia, game_dir, game_dir_watcher=None, **kwargs):
         self.name = name
         self.is_mafia = is_mafia
+        self.game_dir = game_dir
+        self.game_dir_watcher = game_dir_watcher  # set by the game manager once the loop is running
         self.personal_chat_file = game_dir / PERSONAL_CHAT_FILE_FORMAT.format(self.name)
-        self.personal_chat_file_lines_read = 0
+        self.personal_chat_file_reader = FileTailReader(self.personal_chat_file)
         self.personal_vote_file = game_dir / PERSONAL_VOTE_FILE_FORMAT.format(self.name)
-        self.personal_vote_file_lines_read = 0
+        self.personal_vote_file_reader = FileTailReader(self.personal_vote_file)
         # status is whether the player has joined and then whether was voted out
-        self.personal_status_file = game_dir / PERSONAL_STATUS_FILE_FORMAT.format(self.name)
+        self.personal_status_file_name = PERSONAL_STATUS_FILE_FORMAT.format(self.name)
 
     def get_new_messages(self):
-        with open(self.personal_chat_file, "r") as f:
-            # the readlines method includes the "\n"
-            lines = f.readlines()[self.personal_chat_file_lines_read:]
-        self.personal_chat_file_lines_read += len(lines)
-        return lines
+        return self.personal_chat_file_reader.read_new_lines()  # lines include the "\n"
 
     def get_voted_player(self):
-        all_votes = self.personal_vote_file.read_text().splitlines()
-        new_votes = all_votes[self.personal_vote_file_lines_read:]
+        new_votes = self.personal_vote_file_reader.read_new_lines()  # should be 1 if works well
         if new_votes:
-            self.personal_vote_file_lines_read += len(new_votes)  # should be 1 if works correctly
             return new_votes[-1].strip()
         else:
             return None
 
-    def eliminate(self):
-        self.personal_status_file.write_text(VOTED_OUT)
-
-
-def get_config():
-    with open(game_dir / GAME_CONFIG_FILE, "r") as f:
-        config = json.load(f)
-    return config
-
-
-def get_players(config):
-    return [Player(**player_config) for player_config in config[PLAYERS_KEY_IN_CONFIG]]
-
-
-def is_win_by_bystanders(mafia_players):
-    if len(mafia_players) == 0:
-        (game_dir / WHO_WINS_FILE).write_text(BYSTANDERS_WIN_MESSAGE)
-        return True
-    return False
-
+    async def iterate_new_messages(self):
+        while True:
+            lines = self.get_new_messages()
+            if lines:
+                yield lines
+            await self.game_dir_watcher.wait()
 
-def is_win_by_mafia(mafia_players, bystanders):
-    if len(mafia_players) >= len(bystanders):
-        (game_dir / WHO_WINS_FILE).write_text(MAFIA_WINS_MESSAGE)
-        return True
-    return False
+    async def iterate_votes(self):
+        while True:
+            voted_for = self.get_voted_player()
+            if voted_for:
+                yield voted_for
+            await self.game_dir_watcher.wait()
 
+    def has_joined(self):
+        # empty until joined
+        return bool(read_game_file(self.game_dir, self.personal_status_file_name))
 
-def is_game_over(players):
-    mafia_players = [player for player in players if player.is_mafia]
-    bystanders = [player for player in players if not player.is_mafia]
-    return is_win_by_bystanders(mafia_players) or is_win_by_mafia(mafia_players, bystanders)
-
-
-def run_chat_round_between_players(players, chat_room):
-    for player in players:
-        lines = player.get_new_messages()
-        with open(chat_room, "a") as f:
-            f.writelines(lines)  # lines already include "\n"
-
-
-def notify_players_about_voting_time(phase_name, public_chat_file):
-    phase_end_message = DAYTIME_VOTING_TIME_MESSAGE if phase_name == DAYTIME else NIGHTTIME_VOTING_TIME_MESSAGE
-    with open(public_chat_file, "a") as f:  # only to the current phase's active players chat room
-        f.write(format_message(GAME_MANAGER_NAME, phase_end_message))
-    voting_phase_name = DAYTIME_VOTING_TIME if phase_name == DAYTIME else NIGHTTIME_VOTING_TIME
-    (game_dir / PHASE_STATUS_FILE).write_text(voting_phase_name)
-
-
-def get_voted_out_name(optional_votes_players, public_chat_file, voting_players):
-    votes = {player.name: 0 for player in optional_votes_players}
-    while voting_players:
-        voted_players = []
-        for player in voting_players:
-            voted_for = player.get_voted_player()
-            if not voted_for:
-                continue
-            voted_players.append(player)
+    def eliminate(self):
+        write_game_file(self.game_dir, self.personal_status_file_name, VOTED_OUT)
+
+    def get_personal_file_names(self):  # the files the manager waits on for changes
+        return [self.personal_chat_file.name, self.personal_vote_file.name,
+                self.personal_status_file_name]
+
+
+class GameManager:
+    """
+    Runs a single game. All of the game's state is held here (and not in module globals), so any
+    number of games can be hosted concurrently on the same event loop, each in its own game dir.
+    """
+
+    def __init__(self, game_dir, print_prefix=""):
+        self.game_dir = game_dir
+        self.print_prefix = print_prefix
+        self.config = self.get_config()
+        self.players = self.get_players()
+        self.game_dir_watcher = None  # will be updated in run_game, once the event loop is running
+
+    def print(self, message, color=None):
+        message = self.print_prefix + message
+        print(colored(message, color) if color else message)
+
+    def get_config(self):
+        with open(self.game_dir / GAME_CONFIG_FILE, "r") as f:
+            config = json.load(f)
+        return config
+
+    def get_players(self):
+        return [Player(**player_config, game_dir=self.game_dir)
+                for player_config in self.config[PLAYERS_KEY_IN_CONFIG]]
+
+    def is_win_by_bystanders(self, mafia_players):
+        if len(mafia_players) == 0:
+            write_game_file(self.game_dir, WHO_WINS_FILE, BYSTANDERS_WIN_MESSAGE)
+            return True
+        return False
+
+    def is_win_by_mafia(self, mafia_players, bystanders):
+        if len(mafia_players) >= len(bystanders):
+            write_game_file(self.game_dir, WHO_WINS_FILE, MAFIA_WINS_MESSAGE)
+            return True
+        return False
+
+    def is_game_over(self):
+        mafia_players = [player for player in self.players if player.is_mafia]
+        bystanders = [player for player in self.players if not player.is_mafia]
+        return self.is_win_by_bystanders(mafia_players) \
+            or self.is_win_by_mafia(mafia_players, bystanders)
+
+    async def relay_messages_of_player(self, player, chat_room):
+        async for lines in player.iterate_new_messages():
+            # lines already include "\n"
+            append_to_game_file(self.game_dir, chat_room, "".join(lines))
+
+    async def run_chat_between_players(self, players, chat_room):
+        await asyncio.gather(*[self.relay_messages_of_player(player, chat_room)
+                               for player in players])
+
+    def notify_players_about_voting_time(self, phase_name, public_chat_file):
+        phase_end_message = DAYTIME_VOTING_TIME_MESSAGE if phase_name == DAYTIME \
+            else NIGHTTIME_VOTING_TIME_MESSAGE
+        # only to the current phase's active players chat room:
+        append_to_game_file(self.game_dir, public_chat_file,
+                            format_message(GAME_MANAGER_NAME, phase_end_message))
+        voting_phase_name = DAYTIME_VOTING_TIME if phase_name == DAYTIME else NIGHTTIME_VOTING_TIME
+        write_game_file(self.game_dir, PHASE_STATUS_FILE, voting_phase_name)
+
+    @staticmethod
+    async def get_vote_of_player(player):
+        async for voted_for in player.iterate_votes():
+            return player, voted_for  # only the first vote counts
+
+    async def get_voted_out_name(self, optional_votes_players, public_chat_file, voting_players):
+        votes = {player.name: 0 for player in optional_votes_players}
+        # votes are announced in the order they arrive, and counting ends as soon as the last does
+        players_votes = [self.get_vote_of_player(player) for player in voting_players]
+        for next_vote in asyncio.as_completed(players_votes):
+            player, voted_for = await next_vote
             if voted_for in votes:
-                with open(public_chat_file, "a") as f:
-                    voting_message = VOTING_MESSAGE_FORMAT.format(player.name, voted_for)
-                    f.write(format_message(GAME_MANAGER_NAME, voting_message))
+                voting_message = VOTING_MESSAGE_FORMAT.format(player.name, voted_for)
+                append_to_game_file(self.game_dir, public_chat_file,
+                                    format_message(GAME_MANAGER_NAME, voting_message))
                 votes[voted_for] += 1
-        for player in voted_players:
-            voting_players.remove(player)
-    # if there were invalid votes or if there was a tie, decision will be made "randomly"
-    voted_out_name = max(votes, key=votes.get)
-    return voted_out_name
-
-
-def voting_sub_phase(phase_name, voting_players, optional_votes_players, public_chat_file, players):
-    notify_players_about_voting_time(phase_name, public_chat_file)
-    voted_out_name = get_voted_out_name(optional_votes_players, public_chat_file, voting_players[:])
-    # update info file of remaining players
-    remaining_players = (game_dir / REMAINING_PLAYERS_FILE).read_text().splitlines()
-    remaining_players.remove(voted_out_name)
-    (game_dir / REMAINING_PLAYERS_FILE).write_text("\n".join(remaining_players))
-    # update player object status
-    voted_out_player = {player.name: player for player in optional_votes_players}[voted_out_name]
-    voted_out_player.eliminate()
-    players.remove(voted_out_player)
-    announce_voted_out_player(voted_out_player)
-
-
-def game_manager_announcement(message):
-    with open(game_dir / PUBLIC_MANAGER_CHAT_FILE, "a") as f:
-        f.write(format_message(GAME_MANAGER_NAME, message))
-
-
-def announce_voted_out_player(voted_out_player):
-    role = get_role_string(voted_out_player.is_mafia)
-    voted_out_message = VOTED_OUT_MESSAGE_FORMAT.format(voted_out_player.name, role)
-    game_manager_announcement(voted_out_message)
-
-
-def run_phase(players, voting_players, optional_votes_players, public_chat_file,
-              time_limit_seconds, phase_name):
-    if len(voting_players) > 1:
-        start_time = time.time()
-        while time.time() - start_time < time_limit_seconds:
-            run_chat_round_between_players(voting_players, public_chat_file)
-    else:
-        game_manager_announcement(CUTTING_TO_VOTE_MESSAGE)
-    print("Now voting starts...")
-    voting_sub_phase(phase_name, voting_players, optional_votes_players, public_chat_file, players)
-
-
-def run_nighttime(players, nighttime_minutes):
-    (game_dir / PHASE_STATUS_FILE).write_text(NIGHTTIME)
-    mafia_players = [player for player in players if player.is_mafia]
-    bystanders = [player for player in players if not player.is_mafia]
-    print(colored(NIGHTTIME_START_MESSAGE_FORMAT.format(nighttime_minutes), NIGHTTIME_COLOR))
-    game_manager_announcement(NIGHTTIME_START_MESSAGE_FORMAT.format(nighttime_minutes))
-    run_phase(players, mafia_players, bystanders, game_dir / PUBLIC_NIGHTTIME_CHAT_FILE,
-              minutes_to_seconds(nighttime_minutes), NIGHTTIME)
-
-
-def run_daytime(players, daytime_minutes):
-    (game_dir / PHASE_STATUS_FILE).write_text(DAYTIME)
-    print(colored(DAYTIME_START_MESSAGE_FORMAT.format(daytime_minutes), DAYTIME_COLOR))
-    game_manager_announcement(DAYTIME_START_MESSAGE_FORMAT.format(daytime_minutes))
-    run_phase(players, players, players, game_dir / PUBLIC_DAYTIME_CHAT_FILE,
-              minutes_to_seconds(daytime_minutes), DAYTIME)
-
-
-def wait_for_players(players):
-    havent_joined_yet = [player for player in players]
-    print("Waiting for all players to connect and start running their programs to join:")
-    print(",  ".join([player.name for player in havent_joined_yet]))
-    while havent_joined_yet:
-        joined = []
-        for player in havent_joined_yet:
-            if bool(player.personal_status_file.read_text()):  # file isn't empty once joined
-                joined.append(player)
-                print(f"{player.name} has joined!")
-        for player in joined:
-            havent_joined_yet.remove(player)
-    (game_dir / GAME_START_TIME_FILE).write_text(get_current_timestamp())
-    print("Game is now running! Its content is displayed to players.")
-
-
-def get_all_player_out_of_voting_time():
-    current_phase = (game_dir / PHASE_STATUS_FILE).read_text()
-    (game_dir / PHASE_STATUS_FILE).write_text(current_phase.replace(VOTING_TIME, ""))
-
-
-def end_game():
-    get_all_player_out_of_voting_time()
-    print("Game has finished.")
+        # if there were invalid votes or if there was a tie, decision will be made "randomly"
+        voted_out_name = max(votes, key=votes.get)
+        return voted_out_name
+
+    async def voting_sub_phase(self, phase_name, voting_players, optional_votes_players,
+                               public_chat_file):
+        self.notify_players_about_voting_time(phase_name, public_chat_file)
+        voted_out_name = await self.get_voted_out_name(optional_votes_players, public_chat_file,
+                                                       voting_players)
+        # update info file of remaining players
+        remaining_players = read_game_file(self.game_dir, REMAINING_PLAYERS_FILE).splitlines()
+        remaining_players.remove(voted_out_name)
+        write_game_file(self.game_dir, REMAINING_PLAYERS_FILE, "\n".join(remaining_players))
+        # update player object status
+        voted_out_player = [player for player in optional_votes_players
+                            if player.name == voted_out_name][0]
+        voted_out_player.eliminate()
+        self.players.remove(voted_out_player)
+        self.announce_voted_out_player(voted_out_player)
+
+    def game_manager_announcement(self, message):
+        append_to_game_file(self.game_dir, PUBLIC_MANAGER_CHAT_FILE,
+                            format_message(GAME_MANAGER_NAME, message))
+
+    def announce_voted_out_player(self, voted_out_player):
+        role = get_role_string(voted_out_player.is_mafia)
+        voted_out_message = VOTED_OUT_MESSAGE_FORMAT.format(voted_out_player.name, role)
+        self.game_manager_announcement(voted_out_message)
+
+    async def run_phase(self, voting_players, optional_votes_players, public_chat_file,
+                        time_limit_seconds, phase_name):
+        if len(voting_players) > 1:
+            try:  # the chat is stopped by the phase's timer
+                await asyncio.wait_for(
+                    self.run_chat_between_players(voting_players, public_chat_file),
+                    time_limit_seconds)
+            except asyncio.TimeoutError:
+                pass
+        else:
+            self.game_manager_announcement(CUTTING_TO_VOTE_MESSAGE)
+        self.print("Now voting starts...")
+        await self.voting_sub_phase(phase_name, voting_players, optional_votes_players,
+                                    public_chat_file)
+
+    async def run_nighttime(self):
+        nighttime_minutes = self.config[NIGHTTIME_MINUTES_KEY]
+        write_game_file(self.game_dir, PHASE_STATUS_FILE, NIGHTTIME)
+        mafia_players = [player for player in self.players if player.is_mafia]
+        bystanders = [player for player in self.players if not player.is_mafia]
+        self.print(NIGHTTIME_START_MESSAGE_FORMAT.format(nighttime_minutes), NIGHTTIME_COLOR)
+        self.game_manager_announcement(NIGHTTIME_START_MESSAGE_FORMAT.format(nighttime_minutes))
+        await self.run_phase(mafia_players, bystanders, PUBLIC_NIGHTTIME_CHAT_FILE,
+                             minutes_to_seconds(nighttime_minutes), NIGHTTIME)
+
+    async def run_daytime(self):
+        daytime_minutes = self.config[DAYTIME_MINUTES_KEY]
+        write_game_file(self.game_dir, PHASE_STATUS_FILE, DAYTIME)
+        self.print(DAYTIME_START_MESSAGE_FORMAT.format(daytime_minutes), DAYTIME_COLOR)
+        self.game_manager_announcement(DAYTIME_START_MESSAGE_FORMAT.format(daytime_minutes))
+        await self.run_phase(self.players, self.players, PUBLIC_DAYTIME_CHAT_FILE,
+                             minutes_to_seconds(daytime_minutes), DAYTIME)
+
+    async def wait_for_players(self):
+        havent_joined_yet = [player for player in self.players]
+        self.print("Waiting for all players to connect and start running their programs to join:")
+        self.print(",  ".join([player.name for player in havent_joined_yet]))
+        while havent_joined_yet:
+            joined = []
+            for player in havent_joined_yet:
+                if player.has_joined():
+                    joined.append(player)
+                    self.print(f"{player.name} has joined!")
+            for player in joined:
+                havent_joined_yet.remove(player)
+            if havent_joined_yet:
+                await self.game_dir_watcher.wait()
+        write_game_file(self.game_dir, GAME_START_TIME_FILE, get_current_timestamp())
+        self.print("Game is now running! Its content is displayed to players.")
+
+    def get_all_player_out_of_voting_time(self):
+        current_phase = read_game_file(self.game_dir, PHASE_STATUS_FILE)
+        write_game_file(self.game_dir, PHASE_STATUS_FILE, current_phase.replace(VOTING_TIME, ""))
+
+    def end_game(self):
+        self.get_all_player_out_of_voting_time()
+        self.print("Game has finished.")
+
+    async def run_game(self):
+        players_file_names = [file_name for player in self.players
+                              for file_name in player.get_personal_file_names()]
+        self.game_dir_watcher = AsyncGameDirWatcher(
+            get_game_dir_watcher(self.game_dir, players_file_names))
+        for player in self.players:
+            player.game_dir_watcher = self.game_dir_watcher
+        await self.wait_for_players()
+        while not self.is_game_over():
+            await self.run_daytime()
+            if self.is_game_over():
+                break
+            await self.run_nighttime()
+        self.end_game()
+        self.game_dir_watcher.close()
+
+
+async def run_games(game_managers):
+    # all games share the same event loop, so a game only takes CPU time when it has something to do
+    results = await asyncio.gather(*[game_manager.run_game() for game_manager in game_managers],
+                                   return_exceptions=True)
+    for game_manager, result in zip(game_managers, results):
+        if isinstance(result, Exception):  # a failing game shouldn't stop the others
+            game_manager.print(f"Game has failed: {result!r}", "red")
 
 
 def main():
-    global game_dir
-    game_dir = get_game_dir_from_argv()
-    config = get_config()
-    players = get_players(config)
-    wait_for_players(players)
-    while not is_game_over(players):
-        run_daytime(players, config[DAYTIME_MINUTES_KEY])
-        if is_game_over(players):
-            break
-        run_nighttime(players, config[NIGHTTIME_MINUTES_KEY])
-    end_game()
+    game_dirs = get_game_dirs_from_argv()
+    print_prefix_format = GAME_PRINT_PREFIX_FORMAT if len(game_dirs) > 1 else ""
+    game_managers = [GameManager(game_dir, print_prefix_format.format(game_dir.name))
+                     for game_dir in game_dirs]
+    asyncio.run(run_games(game_managers))
 
 
 if __name__ == '__main__':
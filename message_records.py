@@ -0,0 +1,107 @@
+"""
+A compact representation of a chat message, parsed once when it's read, and then used by the LLM
+players and by the analysis, instead of each of them matching the raw line again.
+"""
+import re
+from operator import attrgetter
+from game_constants import MESSAGE_PARSING_PATTERN, GAME_MANAGER_NAME, DAYTIME_START_PREFIX, \
+    NIGHTTIME_START_PREFIX, DAYTIME, NIGHTTIME, CUTTING_TO_VOTE_MESSAGE, VOTING_MESSAGE_FORMAT, \
+    VOTED_OUT_MESSAGE_FORMAT, VOTING_TIME_MESSAGE_FORMAT
+
+# message kinds (all of them except CHAT and UNPARSED are the game manager's announcements)
+CHAT = "chat"
+VOTE = "vote"  # subject: (voter id, voted for id)
+PHASE_START = "phase_start"  # subject: the phase's name
+PHASE_END = "phase_end"  # when it's time to vote, subject: the phase's name
+ELIMINATION = "elimination"  # subject: the voted out player's id
+CUT_TO_VOTE = "cut_to_vote"
+OTHER_ANNOUNCEMENT = "other_announcement"
+UNPARSED = "unparsed"  # a line that doesn't match MESSAGE_FORMAT
+
+MESSAGE_PARSER = re.compile(MESSAGE_PARSING_PATTERN)
+VOTING_MESSAGE_INFIX = VOTING_MESSAGE_FORMAT.split("{}")[1]  # " voted for "
+VOTED_OUT_MESSAGE_INFIX = VOTED_OUT_MESSAGE_FORMAT.split("{}")[1]  # " was voted out. ..."
+PHASE_END_SUFFIX = VOTING_TIME_MESSAGE_FORMAT.split("{}")[1]  # " has ended, now it's time..."
+GAME_MANAGER_ID = 0
+
+
+class SpeakerIds:
+    """Interns the speakers' names as small ints, so a record keeps an int instead of a name"""
+
+    def __init__(self):
+        self.names = [GAME_MANAGER_NAME]  # its index is GAME_MANAGER_ID
+        self.ids = {GAME_MANAGER_NAME: GAME_MANAGER_ID}
+
+    def get_id(self, name):
+        speaker_id = self.ids.get(name)
+        if speaker_id is None:
+            speaker_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return speaker_id
+
+    def get_name(self, speaker_id):
+        return None if speaker_id is None else self.names[speaker_id]
+
+
+SPEAKER_IDS = SpeakerIds()  # shared by all the records of the process
+
+
+def parse_announcement(content):
+    """Returns the kind and the subject of the game manager's message"""
+    if content.startswith(DAYTIME_START_PREFIX):
+        return PHASE_START, DAYTIME
+    elif content.startswith(NIGHTTIME_START_PREFIX):
+        return PHASE_START, NIGHTTIME
+    elif content == CUTTING_TO_VOTE_MESSAGE:
+        return CUT_TO_VOTE, None
+    elif content.endswith(PHASE_END_SUFFIX):
+        return PHASE_END, content.removesuffix(PHASE_END_SUFFIX)
+    elif VOTING_MESSAGE_INFIX in content:
+        voter, voted_for = content.split(VOTING_MESSAGE_INFIX, 1)
+        return VOTE, (SPEAKER_IDS.get_id(voter), SPEAKER_IDS.get_id(voted_for))
+    elif VOTED_OUT_MESSAGE_INFIX in content:
+        return ELIMINATION, SPEAKER_IDS.get_id(content.split(VOTED_OUT_MESSAGE_INFIX)[0])
+    else:
+        return OTHER_ANNOUNCEMENT, None
+
+
+class MessageRecord:
+    """A parsed chat line, which keeps the original line for prompts (and for str())"""
+
+    __slots__ = ("line", "timestamp", "speaker_id", "kind", "content", "subject")
+
+    def __init__(self, line):
+        self.line = line
+        matcher = MESSAGE_PARSER.match(line)
+        if not matcher:
+            self.timestamp = self.speaker_id = self.subject = None
+            self.kind = UNPARSED
+            self.content = line
+            return
+        hours, minutes, seconds, name, content = matcher.groups()  # depends on the pattern
+        self.timestamp = 3600 * int(hours) + 60 * int(minutes) + int(seconds)  # in seconds
+        self.speaker_id = SPEAKER_IDS.get_id(name)
+        self.content = content
+        if self.speaker_id == GAME_MANAGER_ID:
+            self.kind, self.subject = parse_announcement(content)
+        else:
+            self.kind, self.subject = CHAT, None
+
+    @property
+    def name(self):
+        return SPEAKER_IDS.get_name(self.speaker_id)
+
+    @property
+    def is_manager(self):
+        return self.speaker_id == GAME_MANAGER_ID
+
+    def __str__(self):
+        return self.line
+
+    def __repr__(self):
+        return self.line
+
+
+def join_lines(messages):
+    """The original lines of the MessageRecords, joined (each one already ends with a newline)"""
+    return "".join(map(attrgetter("line"), messages))  # faster than str() on each record
@@ -1,6 +1,8 @@
 from game_constants import *  # incl. argparse, time, Path (from pathlib), colored (from termcolor)
 from game_status_checks import is_game_over, is_time_to_vote, all_players_joined, get_is_mafia, \
-    is_nighttime
+    is_nighttime, read_game_file, write_game_file
+from game_dir_watcher import get_game_dir_watcher
+from file_tail_reader import FileTailReader
 
 
 def introducing_mafia_members(game_dir, is_mafia, name):
@@ -41,23 +43,23 @@ def welcome_player(game_dir):
     role_color = NIGHTTIME_COLOR if is_mafia else DAYTIME_COLOR
     print(colored(ROLE_REVELATION_MESSAGE, MANAGER_COLOR))
     print(colored(role + "\n", role_color))
-    (game_dir / PERSONAL_STATUS_FILE_FORMAT.format(name)).write_text(JOINED)
+    write_game_file(game_dir, PERSONAL_STATUS_FILE_FORMAT.format(name), JOINED)
     introducing_mafia_members(game_dir, is_mafia, name)
     print(colored(WAITING_FOR_ALL_PLAYERS_TO_JOIN_MESSAGE, MANAGER_COLOR))
+    game_dir_watcher = get_game_dir_watcher(game_dir, [GAME_START_TIME_FILE])
     while not all_players_joined(game_dir):
-        continue
+        game_dir_watcher.wait()
+    game_dir_watcher.close()
     # The game manager automatically posts a message that will be printed when the game starts
     return name, is_mafia  # name is used only in the joint read-and-write interface (with threads)
 
 
-def display_lines_from_file(game_dir, file_name, num_read_lines, display_color):
-    with open(game_dir / file_name, "r") as f:
-        lines = f.readlines()[num_read_lines:]
+def display_new_lines_from_file(file_reader, display_color):
+    lines = file_reader.read_new_lines()
     if len(lines) > 0:  # this `if` in needed because of `print()` that is used for multithreading
         print()  # prevents the messages from being printed in the same line as the middle of input
         for line in lines:
             print(colored(line.strip(), display_color))
-    return len(lines)
 
 
 def ask_player_to_vote():
@@ -76,22 +78,23 @@ def ask_player_to_vote_only_once(already_asked, game_dir, is_mafia):
 
 
 def read_game_text_loop(is_mafia, game_dir):
-    num_read_lines_manager = num_read_lines_daytime = num_read_lines_nighttime = 0
+    manager_chat_reader = FileTailReader(game_dir / PUBLIC_MANAGER_CHAT_FILE)
+    daytime_chat_reader = FileTailReader(game_dir / PUBLIC_DAYTIME_CHAT_FILE)
+    nighttime_chat_reader = FileTailReader(game_dir / PUBLIC_NIGHTTIME_CHAT_FILE)
     already_asked = False
+    game_dir_watcher = get_game_dir_watcher(game_dir, PUBLIC_CHAT_FILES + GAME_STATUS_FILES)
     while not is_game_over(game_dir):
-        num_read_lines_manager += display_lines_from_file(
-            game_dir, PUBLIC_MANAGER_CHAT_FILE, num_read_lines_manager, MANAGER_COLOR)
+        display_new_lines_from_file(manager_chat_reader, MANAGER_COLOR)
         # only current phase file will have new messages, so no need to run expensive is_nighttime()
-        num_read_lines_daytime += display_lines_from_file(
-            game_dir, PUBLIC_DAYTIME_CHAT_FILE, num_read_lines_daytime, DAYTIME_COLOR)
+        display_new_lines_from_file(daytime_chat_reader, DAYTIME_COLOR)
         if is_mafia:  # only mafia can see what happens during nighttime
-            num_read_lines_nighttime += display_lines_from_file(
-                game_dir, PUBLIC_NIGHTTIME_CHAT_FILE, num_read_lines_nighttime, NIGHTTIME_COLOR)
+            display_new_lines_from_file(nighttime_chat_reader, NIGHTTIME_COLOR)
         already_asked = ask_player_to_vote_only_once(already_asked, game_dir, is_mafia)
+        game_dir_watcher.wait()
 
 
 def game_over_message(game_dir):
-    who_wins = (game_dir / WHO_WINS_FILE).read_text().strip()
+    who_wins = read_game_file(game_dir, WHO_WINS_FILE).strip()
     print(colored(who_wins, MANAGER_COLOR))
     mafia_names = (game_dir / MAFIA_NAMES_FILE).read_text().splitlines()  # removes the "\n"
     print(colored(MAFIA_REVELATION_MESSAGE, MANAGER_COLOR),
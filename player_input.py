@@ -1,7 +1,8 @@
 from game_constants import *  # incl. random, Path (from pathlib), colored (from termcolor)
 from game_status_checks import is_nighttime, is_game_over, is_voted_out, is_time_to_vote, \
-    all_players_joined, get_is_mafia
+    all_players_joined, get_is_mafia, read_game_file, append_to_game_file, get_phase_status
 from player_survey import run_survey_about_llm_player
+from game_dir_watcher import get_game_dir_watcher
 
 
 def get_name_and_role(game_dir):
@@ -11,8 +12,10 @@ def get_name_and_role(game_dir):
     name = get_player_name_from_user(player_names, GET_CODE_NAME_FROM_USER_MESSAGE)
     is_mafia = get_is_mafia(name, game_dir)
     print(colored(WAITING_FOR_ALL_PLAYERS_TO_JOIN_MESSAGE, MANAGER_COLOR))
+    game_dir_watcher = get_game_dir_watcher(game_dir, [GAME_START_TIME_FILE])
     while not all_players_joined(game_dir):
-        continue
+        game_dir_watcher.wait()
+    game_dir_watcher.close()
     print(colored(YOU_CAN_START_WRITING_MESSAGE, MANAGER_COLOR))
     return name, is_mafia
 
@@ -25,21 +28,24 @@ def notify_only_once_about_finish_writing(already_notified):
 
 
 def collect_vote(name, game_dir):
-    remaining_player_names = (game_dir / REMAINING_PLAYERS_FILE).read_text().splitlines()
+    remaining_player_names = read_game_file(game_dir, REMAINING_PLAYERS_FILE).splitlines()
     remaining_player_names.remove(name)  # players shouldn't vote for themselves
     voted_name = get_player_name_from_user(remaining_player_names,
                                            GET_VOTED_NAME_MESSAGE_FORMAT.format(name))
-    with open(game_dir / PERSONAL_VOTE_FILE_FORMAT.format(name), "a") as f:
-        f.write(voted_name + "\n")
+    append_to_game_file(game_dir, PERSONAL_VOTE_FILE_FORMAT.format(name), voted_name + "\n")
 
 
 def write_text_to_game_loop(name, is_mafia, game_dir):
     already_notified = False
+    game_dir_watcher = get_game_dir_watcher(
+        game_dir, GAME_STATUS_FILES + [PERSONAL_STATUS_FILE_FORMAT.format(name)])
     while not is_game_over(game_dir):
         if is_voted_out(name, game_dir):
             already_notified = notify_only_once_about_finish_writing(already_notified)
+            game_dir_watcher.wait()
             continue  # can't write or vote anymore, waiting for final survey
         if not is_mafia and is_nighttime(game_dir):
+            game_dir_watcher.wait()
             continue  # only mafia can communicate during nighttime
         user_input = input(colored(GET_CHAT_INPUT_MESSAGE, MANAGER_COLOR)).strip()
         if not user_input:
@@ -48,12 +54,15 @@ def write_text_to_game_loop(name, is_mafia, game_dir):
             if not is_time_to_vote(game_dir):
                 print(colored(NOT_TIME_TO_VOTE_MESSAGE, MANAGER_COLOR))
                 continue
+            voting_phase_status = get_phase_status(game_dir)
             collect_vote(name, game_dir)
-            while is_time_to_vote(game_dir):
-                continue  # wait for voting time to end when all players have voted
+            # wait for voting time to end when all players have voted (the next phase might be
+            # cut straight to voting, so it's checked by change of phase and not by is_time_to_vote)
+            while get_phase_status(game_dir) == voting_phase_status:
+                game_dir_watcher.wait()
         elif not is_time_to_vote(game_dir):  # if it's time to vote then players can't chat
-            with open(game_dir / PERSONAL_CHAT_FILE_FORMAT.format(name), "a") as f:
-                f.write(format_message(name, user_input))
+            append_to_game_file(game_dir, PERSONAL_CHAT_FILE_FORMAT.format(name),
+                                format_message(name, user_input))
 
 
 def main():
@@ -3,7 +3,10 @@ from flask import Flask, request, redirect, jsonify, render_template_string
 from game_constants import *
 from game_status_checks import *
 from player_survey import run_survey_about_llm_player
+from game_dir_watcher import get_game_dir_watcher
+from file_tail_reader import FileTailReader
 from pathlib import Path
+from threading import Lock
 import random
 
 app = Flask(__name__)
@@ -11,6 +14,8 @@ game_dir = None
 name = None
 is_mafia = None
 voted_out = False
+chat_readers = {}  # file name -> (FileTailReader, all lines read so far), filled incrementally
+chat_readers_lock = Lock()  # flask may serve requests in multiple threads
 
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -101,9 +106,13 @@ HTML_TEMPLATE = """
 def get_chat_lines():
     lines = []
     def add_lines(file, color):
-        if (game_dir / file).exists():
-            for line in (game_dir / file).read_text().splitlines():
-                lines.append({"text": line, "color": color})
+        with chat_readers_lock:
+            if file not in chat_readers:
+                chat_readers[file] = (FileTailReader(game_dir / file), [])
+            reader, file_lines = chat_readers[file]
+            file_lines.extend({"text": line.rstrip("\n"), "color": color}
+                              for line in reader.read_new_lines())
+            lines.extend(file_lines)
     add_lines(PUBLIC_MANAGER_CHAT_FILE, "blue")
     add_lines(PUBLIC_DAYTIME_CHAT_FILE, "black")
     if is_mafia:
@@ -121,7 +130,7 @@ def index():
 
     vote_options = []
     if show_vote:
-        vote_options = (game_dir / REMAINING_PLAYERS_FILE).read_text().splitlines()
+        vote_options = read_game_file(game_dir, REMAINING_PLAYERS_FILE).splitlines()
         if name in vote_options:
             vote_options.remove(name)
 
@@ -140,15 +149,14 @@ def chat():
 def send():
     msg = request.form["msg"].strip()
     if msg:
-        with open(game_dir / PERSONAL_CHAT_FILE_FORMAT.format(name), "a") as f:
-            f.write(format_message(name, msg))
+        append_to_game_file(game_dir, PERSONAL_CHAT_FILE_FORMAT.format(name),
+                            format_message(name, msg))
     return redirect("/")
 
 @app.route("/vote", methods=["POST"])
 def vote():
     vote_for = request.form["vote_for"]
-    with open(game_dir / PERSONAL_VOTE_FILE_FORMAT.format(name), "a") as f:
-        f.write(vote_for + "\n")
+    append_to_game_file(game_dir, PERSONAL_VOTE_FILE_FORMAT.format(name), vote_for + "\n")
     return redirect("/")
 
 @app.route("/survey", methods=["POST"])
@@ -168,7 +176,7 @@ def state():
     show_survey = is_game_over(game_dir) and not voted_out
     vote_options = []
     if can_vote:
-        vote_options = (game_dir / REMAINING_PLAYERS_FILE).read_text().splitlines()
+        vote_options = read_game_file(game_dir, REMAINING_PLAYERS_FILE).splitlines()
         if name in vote_options:
             vote_options.remove(name)
 
@@ -188,9 +196,11 @@ def initialize():
     random.shuffle(player_names)
     name = get_player_name_from_user(player_names, GET_CODE_NAME_FROM_USER_MESSAGE)
     is_mafia = get_is_mafia(name, game_dir)
-    (game_dir / PERSONAL_STATUS_FILE_FORMAT.format(name)).write_text(JOINED)
+    game_dir_watcher = get_game_dir_watcher(game_dir, [GAME_START_TIME_FILE])
+    write_game_file(game_dir, PERSONAL_STATUS_FILE_FORMAT.format(name), JOINED)
     while not all_players_joined(game_dir):
-        pass
+        game_dir_watcher.wait()
+    game_dir_watcher.close()
     print(f"Welcome {name}! Open http://localhost:8888 in your browser.")
 
 if __name__ == '__main__':
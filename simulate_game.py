@@ -0,0 +1,304 @@
+"""
+Runs a whole game without any human: the "human" players are bots (threads of this process) that
+send messages and vote at configurable rates, and the LLM players use the mock backend. Phases
+are shortened by the time compression factor. Reports the relaying throughput and latency of the
+game manager (from a bot writing a message to its chat file, until it's in the public chat).
+usage example (a soak test): python simulate_game.py -p 50 -l 2 -r 60 -x 10
+"""
+import json
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from dataclasses import asdict
+from threading import Event, Thread
+from game_constants import *  # incl. argparse, time, Path (from pathlib), colored (from termcolor)
+from game_status_checks import is_nighttime, is_game_over, is_voted_out, is_time_to_vote, \
+    all_players_joined, read_game_file, write_game_file, append_to_game_file, get_phase_status
+from game_dir_watcher import get_game_dir_watcher
+from file_tail_reader import FileTailReader
+from message_records import MessageRecord, UNPARSED
+from prepare_game import init_game, get_next_free_game_id
+from prepare_config import PlayerConfig
+from llm_players.llm_constants import DEFAULT_LLM_CONFIG, BACKEND_KEY, MOCK_BACKEND, \
+    MOCK_LATENCY_KEY, MOCK_SEED_KEY, WORDS_PER_SECOND_WAITING_KEY, LOG_LEVEL_KEY, \
+    INVOCATION_TRIGGERS_KEY, DEFAULT_INVOCATION_TRIGGERS, VOTING_WAITING_TIME_KEY
+
+SIMULATION_COLOR = "cyan"
+BOT_MESSAGE_FORMAT = "bot message number {}"  # unique per bot, to match it in the public chat
+SIMULATION_OUTPUT_FILE_FORMAT = "simulation_{}_output.txt"  # stdout of the spawned processes
+MAFIA_MAIN_SCRIPT = "mafia_main.py"
+LLM_INTERFACE_SCRIPT = "llm_interface.py"
+DEFAULT_NUM_SIMULATED_PLAYERS = 10
+DEFAULT_NUM_SIMULATED_LLM_PLAYERS = 1
+DEFAULT_MESSAGES_PER_MINUTE = 6  # per bot, in game time
+DEFAULT_MAX_VOTE_DELAY = 10  # seconds, in game time
+DEFAULT_TIME_COMPRESSION = 1
+PROCESS_EXIT_TIMEOUT = 10  # seconds to wait for the LLM players after the game is over
+LATENCY_PERCENTILES = [50, 95, 99]
+STOP_CHECK_INTERVAL = 1  # seconds, for the threads to notice the simulation was stopped
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--players", type=int, default=DEFAULT_NUM_SIMULATED_PLAYERS,
+                        help="total number of players in game, bots and LLMs")
+    parser.add_argument("-m", "--mafia", type=int, default=DEFAULT_NUM_MAFIA)
+    parser.add_argument("-l", "--llm", type=int, default=DEFAULT_NUM_SIMULATED_LLM_PLAYERS,
+                        help="number of LLM players (using the mock backend)")
+    parser.add_argument("-r", "--messages_per_minute", type=float,
+                        default=DEFAULT_MESSAGES_PER_MINUTE,
+                        help="average number of messages each bot sends per minute of game time")
+    parser.add_argument("-v", "--max_vote_delay", type=float, default=DEFAULT_MAX_VOTE_DELAY,
+                        help="bots vote after a random delay up to this many seconds of game time")
+    parser.add_argument("-x", "--time_compression", type=float, default=DEFAULT_TIME_COMPRESSION,
+                        help="how many times faster than real time the game runs")
+    parser.add_argument("-dt", "--daytime_minutes", type=float, default=DEFAULT_DAYTIME_MINUTES,
+                        help="number of minutes for Daytime phase (in game time)")
+    parser.add_argument("-nt", "--nighttime_minutes", type=float, default=DEFAULT_NIGHTTIME_MINUTES,
+                        help="number of minutes for Nighttime phase (in game time)")
+    parser.add_argument("--mock_latency", type=float, default=0,
+                        help="seconds of every generation of the LLM players (in real time)")
+    parser.add_argument("-s", "--seed", type=int, default=None)
+    parser.add_argument("-t", "--timeout", type=float, default=None,
+                        help="seconds (in real time) after which the game is stopped")
+    parser.add_argument("-k", "--keep_game_dir", action="store_true",
+                        help="keep the simulated game's dir (including the processes outputs)")
+    args = parser.parse_args()
+    if args.llm > args.players - args.mafia:
+        parser.error("LLM players are bystanders in a simulation, so they can't be more than them")
+    return args
+
+
+def get_simulated_names(num_players):
+    names = random.sample(OPTIONAL_CODE_NAMES, min(num_players, len(OPTIONAL_CODE_NAMES)))
+    # a soak test might need more players than the code names pool has
+    for i in range(len(names), num_players):
+        names.append(f"{OPTIONAL_CODE_NAMES[i % len(OPTIONAL_CODE_NAMES)]}"
+                     f"{i // len(OPTIONAL_CODE_NAMES) + 1}")
+    return names
+
+
+def create_simulation_config(args):
+    names = get_simulated_names(args.players)
+    llm_config = DEFAULT_LLM_CONFIG.copy()
+    llm_config[BACKEND_KEY] = MOCK_BACKEND
+    llm_config[MOCK_LATENCY_KEY] = args.mock_latency
+    llm_config[LOG_LEVEL_KEY] = "info"  # the full prompts of many players would flood the disk
+    llm_config[WORDS_PER_SECOND_WAITING_KEY] *= args.time_compression
+    llm_config[INVOCATION_TRIGGERS_KEY] = {  # all of their settings are in seconds
+        trigger: {key: value / args.time_compression for key, value in settings.items()}
+        for trigger, settings in DEFAULT_INVOCATION_TRIGGERS.items()}
+    llm_config[VOTING_WAITING_TIME_KEY] /= args.time_compression
+    player_configs = []
+    for i, name in enumerate(names):  # the first ones are mafia, the next ones are LLMs
+        is_llm = args.mafia <= i < args.mafia + args.llm
+        player_configs.append(PlayerConfig(
+            name, is_mafia=i < args.mafia, is_llm=is_llm, real_name="" if is_llm else name,
+            llm_config={**llm_config, MOCK_SEED_KEY: i} if is_llm else {}))
+    return {PLAYERS_KEY_IN_CONFIG: [asdict(player_config) for player_config in player_configs],
+            DAYTIME_MINUTES_KEY: args.daytime_minutes / args.time_compression,
+            NIGHTTIME_MINUTES_KEY: args.nighttime_minutes / args.time_compression,
+            "notes": f"simulated game, {args.time_compression}x faster than real time"}
+
+
+class BotPlayer(Thread):
+    """
+    Plays like a very simple human, through the same files as player_input.py: sends messages at
+    random intervals (with the given average), and votes for a random player after a random delay.
+    """
+
+    def __init__(self, name, game_dir, message_interval, max_vote_delay, sent_messages_times,
+                 stop_event):
+        super().__init__(daemon=True)
+        self.name = name
+        self.game_dir = game_dir
+        self.message_interval = message_interval  # seconds, on average
+        self.max_vote_delay = max_vote_delay
+        self.sent_messages_times = sent_messages_times  # (name, message) -> when it was sent
+        self.stop_event = stop_event
+        self.num_sent_messages = 0
+
+    def send_message(self):
+        message = BOT_MESSAGE_FORMAT.format(self.num_sent_messages)
+        self.num_sent_messages += 1
+        self.sent_messages_times[(self.name, message)] = time.monotonic()
+        append_to_game_file(self.game_dir, PERSONAL_CHAT_FILE_FORMAT.format(self.name),
+                            format_message(self.name, message))
+
+    def vote(self):
+        if self.stop_event.wait(random.uniform(0, self.max_vote_delay)):
+            return
+        candidates = read_game_file(self.game_dir, REMAINING_PLAYERS_FILE).splitlines()
+        candidates.remove(self.name)
+        if is_nighttime(self.game_dir):  # mafia can only vote out bystanders
+            mafia_names = read_game_file(self.game_dir, MAFIA_NAMES_FILE).splitlines()
+            candidates = [name for name in candidates if name not in mafia_names]
+        append_to_game_file(self.game_dir, PERSONAL_VOTE_FILE_FORMAT.format(self.name),
+                            random.choice(candidates) + "\n")
+
+    def get_next_message_time(self):
+        return time.monotonic() + random.expovariate(1 / self.message_interval)
+
+    def run(self):
+        game_dir_watcher = get_game_dir_watcher(
+            self.game_dir, GAME_STATUS_FILES + [PERSONAL_STATUS_FILE_FORMAT.format(self.name)])
+        is_mafia = self.name in read_game_file(self.game_dir, MAFIA_NAMES_FILE).splitlines()
+        write_game_file(self.game_dir, PERSONAL_STATUS_FILE_FORMAT.format(self.name), JOINED)
+        while not all_players_joined(self.game_dir) and not self.stop_event.is_set():
+            game_dir_watcher.wait(timeout=STOP_CHECK_INTERVAL)
+        next_message_time = self.get_next_message_time()
+        while not is_game_over(self.game_dir) and not self.stop_event.is_set():
+            if is_voted_out(self.name, self.game_dir):
+                break
+            if is_time_to_vote(self.game_dir):
+                voting_phase_status = get_phase_status(self.game_dir)
+                if is_mafia or not is_nighttime(self.game_dir):
+                    self.vote()
+                while get_phase_status(self.game_dir) == voting_phase_status \
+                        and not self.stop_event.is_set():
+                    game_dir_watcher.wait(timeout=STOP_CHECK_INTERVAL)
+                next_message_time = self.get_next_message_time()
+                continue
+            if time.monotonic() >= next_message_time:
+                if is_mafia or not is_nighttime(self.game_dir):
+                    self.send_message()
+                next_message_time = self.get_next_message_time()
+            game_dir_watcher.wait(timeout=max(next_message_time - time.monotonic(), 0))
+        game_dir_watcher.close()
+
+
+class RelayMonitor(Thread):
+    """Measures when the bots' messages reach the public chats, compared to when they were sent"""
+
+    def __init__(self, game_dir, sent_messages_times, stop_event):
+        super().__init__(daemon=True)
+        self.game_dir = game_dir
+        self.sent_messages_times = sent_messages_times
+        self.stop_event = stop_event
+        self.latencies = []  # seconds
+        self.num_other_messages = 0  # of the LLMs and of the game manager
+        self.first_relay_time = self.last_relay_time = None
+
+    def handle_line(self, line, arrival_time):
+        message = MessageRecord(line)
+        if message.kind == UNPARSED:
+            return
+        sending_time = self.sent_messages_times.pop((message.name, message.content.strip()), None)
+        if sending_time is None:
+            self.num_other_messages += 1
+            return
+        self.latencies.append(arrival_time - sending_time)
+        if self.first_relay_time is None:
+            self.first_relay_time = arrival_time
+        self.last_relay_time = arrival_time
+
+    def run(self):
+        chat_files = [PUBLIC_DAYTIME_CHAT_FILE, PUBLIC_NIGHTTIME_CHAT_FILE]
+        game_dir_watcher = get_game_dir_watcher(self.game_dir, chat_files)
+        readers = [FileTailReader(self.game_dir / chat_file) for chat_file in chat_files]
+        while True:
+            is_stopped = self.stop_event.is_set()  # checked before the last read
+            for reader in readers:
+                lines = reader.read_new_lines()
+                arrival_time = time.monotonic()
+                for line in lines:
+                    self.handle_line(line, arrival_time)
+            if is_stopped:
+                break
+            game_dir_watcher.wait(timeout=STOP_CHECK_INTERVAL)
+        game_dir_watcher.close()
+
+    def get_throughput(self):
+        if len(self.latencies) < 2 or self.last_relay_time == self.first_relay_time:
+            return 0
+        return len(self.latencies) / (self.last_relay_time - self.first_relay_time)
+
+
+def start_process(script, game_dir, output_name, stdin_text=None):
+    output_file = open(game_dir / SIMULATION_OUTPUT_FILE_FORMAT.format(output_name), "w")
+    process = subprocess.Popen([sys.executable, script, game_dir.name], stdin=subprocess.PIPE,
+                               stdout=output_file, stderr=subprocess.STDOUT, text=True)
+    if stdin_text is not None:
+        process.stdin.write(stdin_text)
+    process.stdin.close()
+    return process
+
+
+def print_report(game_dir, monitor, bots, duration):
+    num_sent_messages = sum(bot.num_sent_messages for bot in bots)
+    latencies = sorted(monitor.latencies)
+    print(colored(f"Simulated game {game_dir.name} took {duration:.1f}s: "
+                  f"{read_game_file(game_dir, WHO_WINS_FILE).strip() or 'not finished'}",
+                  SIMULATION_COLOR))
+    print(colored(f"Bots sent {num_sent_messages} messages, {len(latencies)} were relayed "
+                  f"({monitor.get_throughput():.1f} messages/s), plus {monitor.num_other_messages} "
+                  f"messages of the LLMs and the game manager", SIMULATION_COLOR))
+    if latencies:
+        # inclusive, so the percentiles are within the measured latencies
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive") \
+            if len(latencies) > 1 else latencies * 99
+        latencies_str = ", ".join(f"p{p} {percentiles[p - 1] * 1000:.1f}ms"
+                                  for p in LATENCY_PERCENTILES)
+        print(colored(f"Relaying latency: mean {statistics.mean(latencies) * 1000:.1f}ms, "
+                      f"{latencies_str}, max {latencies[-1] * 1000:.1f}ms", SIMULATION_COLOR))
+
+
+def run_simulation(args):
+    game_id = get_next_free_game_id()
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as config_file:
+        json.dump(create_simulation_config(args), config_file, indent=4)
+    init_game(game_id, config_file.name)
+    Path(config_file.name).unlink()
+    game_dir = Path(DIRS_PREFIX) / game_id
+    with open(game_dir / GAME_CONFIG_FILE) as f:
+        players = json.load(f)[PLAYERS_KEY_IN_CONFIG]
+    stop_event = Event()
+    sent_messages_times = {}
+    message_interval = 60 / (args.messages_per_minute * args.time_compression)
+    bots = [BotPlayer(player["name"], game_dir, message_interval,
+                      args.max_vote_delay / args.time_compression, sent_messages_times,
+                      stop_event)
+            for player in players if not player["is_llm"]]
+    monitor = RelayMonitor(game_dir, sent_messages_times, stop_event)
+    monitor.start()
+    start_time = time.monotonic()
+    manager_process = start_process(MAFIA_MAIN_SCRIPT, game_dir, "manager")
+    llm_names = [player["name"] for player in players if player["is_llm"]]
+    # with multiple LLM players, llm_interface.py asks which one to run (by its number)
+    llm_processes = [start_process(LLM_INTERFACE_SCRIPT, game_dir, name, f"{i + 1}\n")
+                     for i, name in enumerate(llm_names)]
+    for bot in bots:
+        bot.start()
+    try:
+        manager_process.wait(timeout=args.timeout)
+    except subprocess.TimeoutExpired:
+        print(colored(f"The game didn't finish in {args.timeout}s, stopping it", "red"))
+        manager_process.terminate()
+    duration = time.monotonic() - start_time
+    stop_event.set()
+    for bot in bots:
+        bot.join()
+    monitor.join()
+    for process in llm_processes:
+        try:
+            process.wait(timeout=PROCESS_EXIT_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.terminate()
+    print_report(game_dir, monitor, bots, duration)
+    if args.keep_game_dir:
+        print(colored(f"The simulated game is in: {game_dir.absolute()}", SIMULATION_COLOR))
+    else:
+        shutil.rmtree(game_dir)
+
+
+def main():
+    args = get_args()
+    random.seed(args.seed)
+    run_simulation(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Summarizes the timeline of a game's LLM players (the full timeline can be opened in Perfetto or
+chrome://tracing): the latency percentiles of every stage, so it's clear what dominates the
+players' reaction time.
+usage: python timeline_summary.py <game_id>
+"""
+import statistics
+from collections import defaultdict
+from game_constants import *  # incl. argparse, time, Path (from pathlib), colored (from termcolor)
+from llm_players.timeline import read_timeline_events, COMPLETE_EVENT_PHASE
+
+REACTION_SPAN = "reaction"  # contains all of the other stages of generating a message
+SUMMARY_PERCENTILES = [50, 99]
+
+
+def get_durations_by_span(events):
+    durations = defaultdict(list)  # seconds
+    for event in events:
+        if event.get("ph") != COMPLETE_EVENT_PHASE:
+            continue
+        durations[event["name"]].append(event["dur"] / 1e6)
+        if event["name"] == REACTION_SPAN:  # also by whether the message was sent or why not
+            durations[f"{REACTION_SPAN}[{event['args'].get('outcome')}]"].append(
+                event["dur"] / 1e6)
+    return durations
+
+
+def get_percentile(durations, percentile):
+    if len(durations) == 1:
+        return durations[0]
+    return statistics.quantiles(durations, n=100, method="inclusive")[percentile - 1]
+
+
+def print_summary(durations_by_span):
+    percentiles_header = "".join(f"{f'p{p}':>10}" for p in SUMMARY_PERCENTILES)
+    print(f"{'span':<40}{'count':>8}{'mean':>10}{percentiles_header}{'max':>10}{'total':>10}")
+    # the stages that took the most time in total are first
+    for name, durations in sorted(durations_by_span.items(), key=lambda item: -sum(item[1])):
+        percentiles = "".join(f"{get_percentile(durations, p):>10.3f}"
+                              for p in SUMMARY_PERCENTILES)
+        print(f"{name:<40}{len(durations):>8}{statistics.mean(durations):>10.3f}{percentiles}"
+              f"{max(durations):>10.3f}{sum(durations):>10.1f}")
+    print("(all in seconds)")
+
+
+def main():
+    game_dir = get_game_dir_from_argv()
+    timeline_file = game_dir / TIMELINE_FILE
+    if not timeline_file.exists():
+        raise ValueError(f"Game {game_dir.name} has no timeline (it had no LLM player?)")
+    print_summary(get_durations_by_span(read_timeline_events(timeline_file)))
+
+
+if __name__ == '__main__':
+    main()